@@ -1,8 +1,11 @@
 import os
 import json
 import openai
+import contextvars
+from contextlib import contextmanager
 from datetime import datetime
 from dotenv import load_dotenv
+from app.conversation_context import conversation_context
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,6 +21,10 @@ client = openai.OpenAI(
     base_url="https://api.intelligence.io.solutions/api/v1/",
 )
 
+# Incremental extraction sends the stored details plus this many of the latest
+# messages: the question asked, the user's answer and the model's restatement.
+EXTRACTION_RECENT_MESSAGES = int(os.getenv("AI_EXTRACTION_RECENT_MESSAGES", "3"))
+
 # System prompt to instruct the AI Agent on its role and how to behave.
 SYSTEM_PROMPT_GATHER_INFO = """
 You are Flai, a specialized AI assistant for booking flights. Your **only** function is to gather travel information.
@@ -50,33 +57,155 @@ Your task is to determine if the user's response is a confirmation or a correcti
 - If the user's message is a correction (e.g., "no, to Rome"), integrate the correction, restate the updated information, and ask for confirmation again. End this message with the `[INFO_COMPLETE]` token.
 """
 
-def get_ai_response(user_message: str, conversation_history: list, state: str) -> (str, list):
-    if not conversation_history:
-        # Start of a new conversation
+# Appended to the state's system prompt when one call returns both the reply
+# and the flight details (AI_COMBINED_TURN).
+COMBINED_TURN_PROMPT = """
+Respond with a JSON object with exactly two keys:
+- "reply": your message to the user, following all the rules above, including any special token.
+- "details": the flight details after the user's latest message, starting from the CURRENT DETAILS below.
+  Use the keys traveler_name, origin, destination, departure_date, return_date, number_of_travelers,
+  travel_class, flexible_dates, non_stop (true for direct flights only) and currency (an ISO 4217 code),
+  and omit any value that has not been mentioned. Set return_date or travel_class to null if the user takes it back.
+
+CURRENT DETAILS:
+{details}
+"""
+
+
+# Control tokens the application acts on; users never see them.
+CONTROL_TOKENS = ("[INFO_COMPLETE]", "[CONFIRMED]")
+
+# Where get_ai_response streams its reply while it is generated, if anywhere.
+_reply_sink = contextvars.ContextVar("reply_sink", default=None)
+
+
+@contextmanager
+def streaming_replies_to(sink):
+    """Streams model replies made inside the block to `sink`, which is called
+    with the visible text so far each time it grows and once with the final text.
+    A reply carrying a control token is never meant for the user (core_logic
+    sends its own message instead); `sink` is then called with None, once,
+    and should withdraw what it showed."""
+    token = _reply_sink.set(sink)
+    try:
+        yield
+    finally:
+        _reply_sink.reset(token)
+
+
+def visible_text(text: str, final: bool = False) -> str:
+    """`text` without control tokens. Unless `final`, a trailing fragment that
+    may be the start of one is held back until the next chunk settles it."""
+    for control_token in CONTROL_TOKENS:
+        text = text.replace(control_token, "")
+    if not final:
+        start = text.rfind("[")
+        if start != -1 and any(t.startswith(text[start:]) for t in CONTROL_TOKENS):
+            text = text[:start]
+    return text.strip()
+
+
+def _stream_completion(messages: list, sink) -> str:
+    stream = client.chat.completions.create(
+        model="meta-llama/Llama-3.3-70B-Instruct",
+        messages=messages,
+        max_tokens=150,
+        stream=True
+    )
+    parts, withdrawn = [], False
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            text = "".join(parts)
+            if any(control_token in text for control_token in CONTROL_TOKENS):
+                # The application acts on this reply and sends its own
+                # follow-up instead; take back what was shown of it.
+                if not withdrawn:
+                    sink(None)
+                    withdrawn = True
+            elif not withdrawn:
+                sink(visible_text(text))
+    ai_response = "".join(parts)
+    if not withdrawn:
+        sink(visible_text(ai_response, final=True))
+    return ai_response
+
+
+def _set_state_prompt(conversation_history: list, state: str):
+    # The history keeps a single system message: the prompt for the current state.
+    last_system_prompt = next((msg['content'] for msg in reversed(conversation_history) if msg['role'] == 'system'), None)
+    if state == "AWAITING_CONFIRMATION":
+        system_prompt = SYSTEM_PROMPT_CONFIRMATION
+    elif state == "GATHERING_INFO" or last_system_prompt is None:
         system_prompt = SYSTEM_PROMPT_GATHER_INFO
-        conversation_history.append({"role": "system", "content": system_prompt})
-    
-    # Check if the last system message is outdated for the current state
-    last_system_message = next((msg for msg in reversed(conversation_history) if msg['role'] == 'system'), None)
+    else:
+        system_prompt = last_system_prompt
+    conversation_context.set_system_prompt(conversation_history, system_prompt)
 
-    if state == "AWAITING_CONFIRMATION" and (not last_system_message or last_system_message['content'] != SYSTEM_PROMPT_CONFIRMATION):
-        conversation_history.append({"role": "system", "content": SYSTEM_PROMPT_CONFIRMATION})
-    elif state == "GATHERING_INFO" and (not last_system_message or last_system_message['content'] != SYSTEM_PROMPT_GATHER_INFO):
-        conversation_history.append({"role": "system", "content": SYSTEM_PROMPT_GATHER_INFO})
-    
+
+def get_ai_response_with_details(user_message: str, conversation_history: list, state: str, known_details: dict):
+    """
+    One call for both the reply and the flight details, using JSON output.
+    Returns (reply, updated history, details). If the call fails or its JSON
+    is unusable, falls back to `get_ai_response` and returns None for the
+    details, so the caller extracts them separately.
+    """
+    _set_state_prompt(conversation_history, state)
     conversation_history.append({"role": "user", "content": user_message})
+    messages = conversation_context.build_messages(conversation_history, known_details)
+    # The instructions go on the sent copy only; the stored prompt stays the plain one.
+    messages[0] = {"role": "system", "content": messages[0]["content"] + COMBINED_TURN_PROMPT.format(details=json.dumps(known_details or {}))}
+
+    try:
+        response = client.chat.completions.create(
+            model="meta-llama/Llama-3.3-70B-Instruct",
+            messages=messages,
+            max_tokens=400,
+            temperature=0,
+            response_format={"type": "json_object"}
+        )
+        conversation_context.record("combined", messages, conversation_history, response)
+        payload = json.loads(response.choices[0].message.content)
+        ai_response, details = payload.get("reply"), payload.get("details")
+        if not isinstance(ai_response, str) or not ai_response.strip() or not isinstance(details, dict):
+            raise ValueError(f"Unexpected combined response keys: {sorted(payload)}")
+    except Exception as e:
+        print(f"[AI Service] Combined reply failed, falling back to separate calls: {type(e).__name__}: {e}")
+        conversation_history.pop()
+        ai_response, updated_history = get_ai_response(user_message, conversation_history, state, known_details)
+        return ai_response, updated_history, None
+
+    conversation_history.append({"role": "assistant", "content": ai_response})
+    return ai_response, conversation_history, details
+
+
+def get_ai_response(user_message: str, conversation_history: list, state: str, known_details: dict = None) -> (str, list):
+    _set_state_prompt(conversation_history, state)
+
+    conversation_history.append({"role": "user", "content": user_message})
+    # Only recent turns plus a summary of older ones, built from the session's
+    # known details, are sent (app/conversation_context.py).
+    messages = conversation_context.build_messages(conversation_history, known_details)
 
     try:
         print(f"[AI Service] Making API call to IO Intelligence with model: meta-llama/Llama-3.3-70B-Instruct")
         print(f"[AI Service] API Key available: {'Yes' if io_api_key else 'No'}")
         print(f"[AI Service] Base URL: https://api.intelligence.io.solutions/api/v1/")
         
-        response = client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct",
-            messages=conversation_history,
-            max_tokens=150
-        )
-        ai_response = response.choices[0].message.content
+        sink = _reply_sink.get()
+        if sink:
+            # Streamed replies report no usage; the estimate is still recorded.
+            ai_response = _stream_completion(messages, sink)
+            conversation_context.record("reply", messages, conversation_history)
+        else:
+            response = client.chat.completions.create(
+                model="meta-llama/Llama-3.3-70B-Instruct",
+                messages=messages,
+                max_tokens=150
+            )
+            conversation_context.record("reply", messages, conversation_history, response)
+            ai_response = response.choices[0].message.content
         conversation_history.append({"role": "assistant", "content": ai_response})
         print(f"[AI Service] API call successful, response length: {len(ai_response)}")
         return ai_response, conversation_history
@@ -98,6 +227,10 @@ def get_ai_response(user_message: str, conversation_history: list, state: str) -
         else:
             fallback_response = "I'm experiencing some technical difficulties, but I'm still here to help! Please try rephrasing your request."
         
+        sink = _reply_sink.get()
+        if sink:
+            # Replaces whatever part of the failed reply was already shown.
+            sink(fallback_response)
         conversation_history.append({"role": "assistant", "content": fallback_response})
         return fallback_response, conversation_history
 
@@ -164,37 +297,68 @@ def extract_traveler_names(message: str, num_travelers: int) -> list:
         print(f"Error extracting traveler names: {e}")
         return []
 
-def extract_flight_details_from_history(conversation_history):
+def extract_flight_details_from_history(conversation_history, known_details=None):
     """
     Parses the conversation history to extract flight details using a structured IO prompt.
     Returns a dictionary of flight details, not a list.
+
+    With `known_details` (the details stored in the session so far), only the
+    last few messages are sent and the model updates those details, so the
+    prompt does not grow with the conversation.
     """
     try:
-        # Convert the conversation history to a string format suitable for the prompt
-        history_str = "\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation_history])
+        if known_details is not None:
+            recent = [m for m in conversation_history
+                      if isinstance(m, dict) and m.get("role") != "system"][-EXTRACTION_RECENT_MESSAGES:]
+            io_prompt = f"""
+        Update the flight details below with what was said in the latest messages of a conversation.
+        The user might correct themselves; the latest messages win. Keep every detail they do not change,
+        and set return_date or travel_class to null if the user takes it back.
+        Return the complete, updated details.
+        If the user is flexible about the departure date (e.g. "around the 15th"), set "flexible_dates" to true.
+        If the user only wants direct flights, set "non_stop" to true.
+        If the user names a currency for prices (e.g. "in naira"), set "currency" to its ISO 4217 code (e.g. "NGN").
 
-        # Define the IO prompt for extracting structured data
-        io_prompt = f"""
-        Extract the structured flight details from the following conversation.
-        The user might correct themselves. Always use the most recent, confirmed information.
-        If a value is not mentioned, omit the key.
+        CURRENT DETAILS:
+        {json.dumps(known_details)}
 
-        CONVERSATION:
-        {history_str}
+        LATEST MESSAGES:
+        {conversation_context.transcript(recent)}
 
-        EXTRACTED JSON:
+        UPDATED JSON:
         """
+        else:
+            # Convert the conversation history to a string format suitable for the prompt.
+            # System prompts are left out: they carry no travel details.
+            history_str = conversation_context.transcript(conversation_history)
+
+            # Define the IO prompt for extracting structured data
+            io_prompt = f"""
+            Extract the structured flight details from the following conversation.
+            The user might correct themselves. Always use the most recent, confirmed information.
+            If a value is not mentioned, omit the key.
+            If the user is flexible about the departure date (e.g. "around the 15th"), set "flexible_dates" to true.
+            If the user only wants direct flights, set "non_stop" to true.
+            If the user names a currency for prices (e.g. "in naira"), set "currency" to its ISO 4217 code (e.g. "NGN").
+
+            CONVERSATION:
+            {history_str}
+
+            EXTRACTED JSON:
+            """
 
         # Call the IO Intelligence API
+        messages = [
+            {"role": "system", "content": "You are a data extraction expert that always returns JSON."},
+            {"role": "user", "content": io_prompt}
+        ]
         response = client.chat.completions.create(
             model="meta-llama/Llama-3.3-70B-Instruct",
-            messages=[
-                {"role": "system", "content": "You are a data extraction expert that always returns JSON."},
-                {"role": "user", "content": io_prompt}
-            ],
+            messages=messages,
             temperature=0,
             response_format={"type": "json_object"}
         )
+        conversation_context.record("extraction", messages, response=response)
 
         # The API returns a list of dictionaries. For this flow, we only need the first one.
         extracted_text = response.choices[0].message.content
@@ -0,0 +1,188 @@
+import os
+import time
+import threading
+
+import redis
+
+from app.new_session_manager import get_redis_client
+
+# Requests a user is waiting on (searches, booking) and background ones
+# (airport/airline/city lookups, cache prewarming).
+PRIORITY_SEARCH = "search"
+PRIORITY_LOOKUP = "lookup"
+
+# Upper bounds, in seconds, of the queue wait-time histogram buckets.
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RateLimited(RuntimeError):
+    """No Amadeus request slot became free within the caller's wait budget."""
+
+
+def _is_throttled(error) -> bool:
+    return getattr(getattr(error, "response", None), "status_code", None) == 429
+
+
+def _retry_after(error, default: float) -> float:
+    http_response = getattr(getattr(error, "response", None), "http_response", None)
+    headers = getattr(http_response, "headers", None)
+    try:
+        return max(0.0, float(headers.get("Retry-After")))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+class AmadeusScheduler:
+    """Token bucket in front of every Amadeus API call.
+
+    - The bucket holds up to `burst` request slots and refills at `rate` per
+      second. It lives in Redis (a hash updated in a WATCH/MULTI transaction),
+      so all workers share the account's quota; without Redis each process
+      keeps its own.
+    - Lookups may not take the last `reserve` slots, which stay free for
+      searches a user is waiting on.
+    - A 429 pauses the bucket for everyone until its Retry-After has passed;
+      the throttled call is then retried.
+    - Time spent waiting for a slot is recorded per priority as a histogram.
+    """
+
+    KEY_PREFIX = "amadeus_rate:"
+
+    def __init__(self, name: str, rate: float, burst: int, reserve: int, max_wait: dict,
+                 max_throttle_retries: int = 2, default_retry_after: float = 1.0):
+        self.key = f"{self.KEY_PREFIX}{name}"
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.max_throttle_retries = max_throttle_retries
+        self.default_retry_after = default_retry_after
+        self._local = {"tokens": float(burst), "ts": time.time(), "paused_until": 0.0}
+        self._lock = threading.Lock()
+        self._stats = {"granted": 0, "timeouts": 0, "throttled": 0}
+        self._waits = {p: {"buckets": [0] * (len(WAIT_BUCKETS) + 1), "count": 0, "sum": 0.0}
+                       for p in (PRIORITY_SEARCH, PRIORITY_LOOKUP)}
+
+    def call(self, priority: str, fn, *args, **kwargs):
+        """Runs `fn` once a request slot is free, retrying it after a 429."""
+        for attempt in range(self.max_throttle_retries + 1):
+            self.acquire(priority)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not _is_throttled(e):
+                    raise
+                self._count("throttled")
+                pause = _retry_after(e, self.default_retry_after)
+                print(f"[AmadeusScheduler] Throttled by Amadeus; pausing requests for {pause:.1f}s.")
+                self.pause(pause)
+                if attempt == self.max_throttle_retries:
+                    raise
+
+    def acquire(self, priority: str) -> float:
+        """Blocks until a request slot is free. Returns the time waited, or
+        raises RateLimited once the priority's wait budget is used up."""
+        start = time.monotonic()
+        deadline = start + self.max_wait.get(priority, 0)
+        while True:
+            wait = self._take(priority)
+            if wait <= 0:
+                waited = time.monotonic() - start
+                self._record_wait(priority, waited)
+                return waited
+            if time.monotonic() + wait > deadline:
+                self._count("timeouts")
+                raise RateLimited(f"No Amadeus request slot for a {priority} within {self.max_wait.get(priority, 0)}s")
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Stops handing out slots for `seconds`, in every worker."""
+        until = time.time() + seconds
+        with self._lock:
+            self._local["paused_until"] = max(self._local["paused_until"], until)
+        client = get_redis_client()
+        if client:
+            try:
+                client.hset(self.key, "paused_until", until)
+            except redis.exceptions.RedisError as e:
+                print(f"[AmadeusScheduler] WARNING: Could not share pause: {e}")
+
+    def _take(self, priority: str) -> float:
+        """Takes a slot. Returns 0 on success, otherwise seconds until one may be free."""
+        client = get_redis_client()
+        if client:
+            try:
+                return client.transaction(lambda pipe: self._take_shared(pipe, priority), self.key,
+                                          value_from_callable=True)
+            except redis.exceptions.RedisError as e:
+                print(f"[AmadeusScheduler] WARNING: Falling back to the local bucket: {e}")
+        with self._lock:
+            wait, tokens = self._refill(priority, self._local["tokens"], self._local["ts"], self._local["paused_until"])
+            if wait <= 0:
+                self._local.update(tokens=tokens - 1, ts=time.time())
+            return wait
+
+    def _take_shared(self, pipe, priority: str) -> float:
+        tokens, ts, paused_until = pipe.hmget(self.key, "tokens", "ts", "paused_until")
+        wait, tokens = self._refill(priority, float(tokens) if tokens is not None else float(self.burst),
+                                    float(ts) if ts is not None else time.time(), float(paused_until or 0))
+        if wait <= 0:
+            pipe.multi()
+            pipe.hset(self.key, mapping={"tokens": tokens - 1, "ts": time.time()})
+            pipe.expire(self.key, 3600)
+        return wait
+
+    def _refill(self, priority: str, tokens: float, ts: float, paused_until: float):
+        """Returns (seconds to wait, tokens available now)."""
+        now = time.time()
+        if paused_until > now:
+            return paused_until - now, tokens
+        tokens = min(float(self.burst), tokens + max(0.0, now - ts) * self.rate)
+        floor = self.reserve if priority != PRIORITY_SEARCH else 0
+        if tokens - 1 >= floor:
+            return 0, tokens
+        return (floor + 1 - tokens) / self.rate, tokens
+
+    def _record_wait(self, priority: str, waited: float):
+        with self._lock:
+            self._stats["granted"] += 1
+            histogram = self._waits.setdefault(priority, {"buckets": [0] * (len(WAIT_BUCKETS) + 1), "count": 0, "sum": 0.0})
+            index = next((i for i, bound in enumerate(WAIT_BUCKETS) if waited <= bound), len(WAIT_BUCKETS))
+            histogram["buckets"][index] += 1
+            histogram["count"] += 1
+            histogram["sum"] += waited
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self) -> dict:
+        """Counters plus, per priority, cumulative wait-time buckets keyed by
+        their upper bound in seconds ("+Inf" for the last)."""
+        with self._lock:
+            waits = {}
+            for priority, histogram in self._waits.items():
+                cumulative, buckets = 0, {}
+                for bound, count in zip([*WAIT_BUCKETS, "+Inf"], histogram["buckets"]):
+                    cumulative += count
+                    buckets[str(bound)] = cumulative
+                waits[priority] = {"buckets": buckets, "count": histogram["count"], "sum": round(histogram["sum"], 3)}
+            return dict(self._stats, wait_seconds=waits)
+
+
+amadeus_scheduler = AmadeusScheduler(
+    # One bucket per Amadeus environment, as AmadeusService picks it.
+    name="production" if os.getenv("APP_ENV") == "production" else "test",
+    # The Amadeus test environment allows 10 requests per second per account.
+    rate=float(os.getenv("AMADEUS_RATE_LIMIT", "10")),
+    burst=int(os.getenv("AMADEUS_RATE_BURST", "10")),
+    reserve=int(os.getenv("AMADEUS_RATE_RESERVE", "3")),
+    max_wait={
+        PRIORITY_SEARCH: float(os.getenv("AMADEUS_SEARCH_MAX_WAIT", "5")),
+        PRIORITY_LOOKUP: float(os.getenv("AMADEUS_LOOKUP_MAX_WAIT", "2")),
+    },
+)
+
+
+def get_amadeus_scheduler_stats() -> dict:
+    return amadeus_scheduler.stats()
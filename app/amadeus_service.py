@@ -1,75 +1,107 @@
 import os
 from amadeus import Client, ResponseError, Location
-from amadeus.client.errors import ClientError
+from amadeus.client.errors import ClientError, AuthenticationError
 import json
+from app.reference_cache import airport_names, airline_names
+from app.reference_data import get_reference_data
+from app.flight_offer import bookable_offer
+from app.amadeus_token import use_shared_token, token_broker
+from app.amadeus_scheduler import amadeus_scheduler, RateLimited, PRIORITY_SEARCH, PRIORITY_LOOKUP
+
+def _is_not_found(error) -> bool:
+    """Whether Amadeus rejected a lookup as such (a 4xx other than 401/429),
+    rather than failing in a way worth retrying soon."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (401, 429)
+
 
 class AmadeusService:
     def __init__(self):
-        self.amadeus = Client(
+        # Every instance shares one access token (app/amadeus_token.py)
+        # instead of fetching its own.
+        self.amadeus = use_shared_token(Client(
             client_id=os.getenv("AMADEUS_CLIENT_ID"),
             client_secret=os.getenv("AMADEUS_CLIENT_SECRET"),
             hostname='production' if os.getenv("APP_ENV") == "production" else "test"
-        )
-        self.airport_cache = {}
-        self.airline_cache = {}
+        ))
 
     def get_airline_name(self, airline_code):
         """
         Get the full airline name for a given IATA code.
-        Uses a simple in-memory cache to avoid repeated API calls.
+        The bundled reference data (app/reference_data.py) is checked first;
+        Amadeus answers for codes it does not know, cached in the shared
+        reference cache (app/reference_cache.py).
         """
-        if airline_code in self.airline_cache:
-            return self.airline_cache[airline_code]
-        
+        reference = get_reference_data()
+        local_name = reference.airline_name(airline_code) if reference else None
+        if local_name:
+            return local_name
+        return airline_names.get_or_load(airline_code, self._fetch_airline_name) or airline_code
+
+    def _fetch_airline_name(self, airline_code):
         try:
-            response = self.amadeus.reference_data.airlines.get(airlineCodes=airline_code)
+            response = amadeus_scheduler.call(PRIORITY_LOOKUP, self.amadeus.reference_data.airlines.get, airlineCodes=airline_code)
             if response.data:
-                name = response.data[0]['businessName']
-                self.airline_cache[airline_code] = name
-                return name
-            else:
-                self.airline_cache[airline_code] = airline_code # Cache failure
-                return airline_code
-        except ResponseError:
-            self.airline_cache[airline_code] = airline_code # Cache failure
-            return airline_code
+                return response.data[0]['businessName']
+            return None
+        except ResponseError as error:
+            # Only a real "not found" is cached as a miss; RateLimited and
+            # other failures propagate, so the cache skips them.
+            if _is_not_found(error):
+                return None
+            raise
 
     def get_airport_name(self, iata_code):
         """
         Get the full airport name for a given IATA code.
-        Uses a simple in-memory cache to avoid repeated API calls.
+        The bundled reference data is checked first, then Amadeus (cached).
         """
-        if iata_code in self.airport_cache:
-            return self.airport_cache[iata_code]
-        
+        reference = get_reference_data()
+        local_name = reference.airport_name(iata_code) if reference else None
+        if local_name:
+            return local_name
+        return airport_names.get_or_load(iata_code, self._fetch_airport_name) or iata_code
+
+    def _fetch_airport_name(self, iata_code):
         try:
             # Use the locations API to search for the airport by its IATA code.
-            response = self.amadeus.reference_data.locations.get(
+            response = amadeus_scheduler.call(
+                PRIORITY_LOOKUP,
+                self.amadeus.reference_data.locations.get,
                 keyword=iata_code,
                 subType=Location.AIRPORT
             )
-            
-            # If we get data back, extract the name, cache it, and return it.
             if response.data:
-                name = response.data[0].get('name', iata_code)
-                self.airport_cache[iata_code] = name
-                return name
-            else:
-                # If no data, cache the failure (using the code itself) and return.
-                self.airport_cache[iata_code] = iata_code
-                return iata_code
-        except ResponseError:
-            # If the API fails, cache the failure and return the code as a fallback.
-            self.airport_cache[iata_code] = iata_code
-            return iata_code
+                return response.data[0].get('name', iata_code)
+            return None
+        except ResponseError as error:
+            # A "not found" is cached as a miss for a short time; other
+            # failures are not cached. Callers fall back to the code itself.
+            if _is_not_found(error):
+                return None
+            raise
+
+    def prewarm_reference_data(self, top_n):
+        """Loads the most used airport and airline names into the local cache."""
+        airports = airport_names.prewarm(top_n, self._fetch_airport_name)
+        airlines = airline_names.prewarm(top_n, self._fetch_airline_name)
+        print(f"[AmadeusService] Prewarmed {airports} airport and {airlines} airline names.")
 
     def get_iata_code(self, city_name):
         """
         Get the IATA code for a given city name.
-        Returns the first airport IATA code found.
+        Resolved from the bundled reference data when the name is known and
+        unambiguous; otherwise returns the first IATA code Amadeus finds.
         """
+        reference = get_reference_data()
+        local_code = reference.resolve_city(city_name) if reference else None
+        if local_code:
+            return local_code
         try:
-            response = self.amadeus.reference_data.locations.get(
+            # A user is waiting on this lookup, so it ranks with searches.
+            response = amadeus_scheduler.call(
+                PRIORITY_SEARCH,
+                self.amadeus.reference_data.locations.get,
                 keyword=city_name,
                 subType='CITY,AIRPORT'
             )
@@ -78,7 +110,7 @@ class AmadeusService:
                 if 'iataCode' in location:
                     return location['iataCode']
             return None
-        except ResponseError as error:
+        except (ResponseError, RateLimited) as error:
             print(f"Amadeus API Error (get_iata_code): {error}")
             return None
 
@@ -89,10 +121,15 @@ class AmadeusService:
         """
         try:
             print(f"DEBUG: Amadeus search_flights params: {kwargs}")
-            response = self.amadeus.shopping.flight_offers_search.get(**kwargs)
+            # Raises RateLimited when no request slot frees up in time; the
+            # caller's retry policy decides whether to try again.
+            response = amadeus_scheduler.call(PRIORITY_SEARCH, self.amadeus.shopping.flight_offers_search.get, **kwargs)
             return response.data
         except ResponseError as e:
             print(f"Amadeus API Error during flight search: {e}")
+            if isinstance(e, AuthenticationError):
+                # The shared token was rejected; the next call fetches a new one.
+                token_broker.invalidate(self.amadeus)
             # Safely log request and response if they exist on the error object
             if hasattr(e, 'request'):
                 print(f"Request: {e.request}")
@@ -103,13 +140,17 @@ class AmadeusService:
     def book_flight(self, flight_offer, traveler):
         """
         Confirms the flight price and books it.
-        :param flight_offer: The flight offer object from the search.
+        :param flight_offer: The flight offer object from the search, or a stored
+            session offer carrying its raw payload under "raw".
         :param traveler: The traveler information object.
         :return: The booking confirmation details or None if booking fails.
         """
+        flight_offer = bookable_offer(flight_offer)
         try:
             # First, confirm the price of the flight offer
-            price_confirm_response = self.amadeus.shopping.flight_offers.pricing.post(
+            price_confirm_response = amadeus_scheduler.call(
+                PRIORITY_SEARCH,
+                self.amadeus.shopping.flight_offers.pricing.post,
                 flight_offer
             )
             priced_offer = price_confirm_response.data['flightOffers'][0]
@@ -124,10 +165,10 @@ class AmadeusService:
             }
 
             # Use the generic client post method to send the raw body
-            order_response = self.amadeus.post('/v1/booking/flight-orders', flight_order_body)
+            order_response = amadeus_scheduler.call(PRIORITY_SEARCH, self.amadeus.post, '/v1/booking/flight-orders', flight_order_body)
             
             return order_response.data
-        except ResponseError as error:
+        except (ResponseError, RateLimited) as error:
             # We can log the full error for debugging
             # print(f"Amadeus booking failed. Response: {error.response.result}")
             return None
\ No newline at end of file
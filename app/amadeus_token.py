@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+import redis
+
+from app.new_session_manager import get_redis_client, try_acquire_lock
+
+
+class TokenBroker:
+    """Shares Amadeus OAuth access tokens between clients, threads and processes.
+
+    The amadeus SDK fetches a token per `Client`, and a new client is built
+    for every background search. The broker keeps one token per
+    (hostname, client_id) in memory and in Redis, until `refresh_margin`
+    seconds before it expires. When it has to be refreshed, one thread per
+    process asks Amadeus, and across processes the worker holding the Redis
+    lock does while the others wait for it to land. Without Redis the token
+    is shared within the process only.
+    """
+
+    KEY_PREFIX = "amadeus_token:"
+
+    def __init__(self, refresh_margin: int, wait_timeout: float, poll_interval: float = 0.1):
+        self.refresh_margin = refresh_margin
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._tokens = {}  # key -> (access_token, expires_at)
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "redis_hits": 0, "fetches": 0, "waits": 0}
+
+    @staticmethod
+    def token_key(client) -> str:
+        identity = f"{client.host}|{client.client_id}"
+        return hashlib.blake2b(identity.encode("utf-8"), digest_size=8).hexdigest()
+
+    def access_token(self, client) -> str:
+        key = self.token_key(client)
+        token = self._valid(self._tokens.get(key))
+        if token:
+            self._count("local_hits")
+            return token
+        with self._key_lock(key):
+            # Another thread may have refreshed it while this one waited.
+            token = self._valid(self._tokens.get(key))
+            if token:
+                self._count("local_hits")
+                return token
+            entry = self._read(key)
+            if entry is None and get_redis_client() and not try_acquire_lock(f"{self.KEY_PREFIX}{key}", self.wait_timeout):
+                self._count("waits")
+                entry = self._wait_for_fill(key)
+            if entry is None:
+                entry = self._fetch(client, key)
+            else:
+                self._count("redis_hits")
+            self._tokens[key] = entry
+            return entry[0]
+
+    def invalidate(self, client):
+        """Forgets the token of `client`, e.g. after Amadeus rejected it."""
+        key = self.token_key(client)
+        self._tokens.pop(key, None)
+        redis_client = get_redis_client()
+        if redis_client:
+            try:
+                redis_client.delete(f"{self.KEY_PREFIX}{key}")
+            except redis.exceptions.RedisError as e:
+                print(f"[TokenBroker] WARNING: Could not drop cached token: {e}")
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _valid(self, entry):
+        if entry and entry[1] - self.refresh_margin > time.time():
+            return entry[0]
+        return None
+
+    def _fetch(self, client, key: str):
+        self._count("fetches")
+        response = client._unauthenticated_request("POST", "/v1/security/oauth2/token", {
+            "grant_type": "client_credentials",
+            "client_id": client.client_id,
+            "client_secret": client.client_secret,
+        })
+        token = response.result.get("access_token")
+        expires_at = time.time() + int(response.result.get("expires_in", 0))
+        entry = (token, expires_at)
+        ttl = int(expires_at - time.time() - self.refresh_margin)
+        redis_client = get_redis_client()
+        if redis_client and token and ttl > 0:
+            try:
+                redis_client.set(f"{self.KEY_PREFIX}{key}", json.dumps({"access_token": token, "expires_at": expires_at}), ex=ttl)
+            except redis.exceptions.RedisError as e:
+                print(f"[TokenBroker] WARNING: Could not share token: {e}")
+        return entry
+
+    def _read(self, key: str):
+        redis_client = get_redis_client()
+        if not redis_client:
+            return None
+        try:
+            raw = redis_client.get(f"{self.KEY_PREFIX}{key}")
+            if raw is None:
+                return None
+            data = json.loads(raw)
+            entry = (data["access_token"], data["expires_at"])
+        except (redis.exceptions.RedisError, ValueError, KeyError) as e:
+            print(f"[TokenBroker] WARNING: Could not read shared token: {e}")
+            return None
+        return entry if self._valid(entry) else None
+
+    def _wait_for_fill(self, key: str):
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            entry = self._read(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, tokens=len(self._tokens))
+
+
+class SharedAccessToken:
+    """Drop-in for the SDK's per-client AccessToken that asks the broker."""
+
+    def __init__(self, client, broker: TokenBroker):
+        self.client = client
+        self.broker = broker
+
+    def _bearer_token(self):
+        return f"Bearer {self.broker.access_token(self.client)}"
+
+
+token_broker = TokenBroker(
+    # Amadeus tokens last 30 minutes; refresh a minute early so a token never
+    # expires mid-request.
+    refresh_margin=int(os.getenv("AMADEUS_TOKEN_REFRESH_MARGIN", "60")),
+    wait_timeout=float(os.getenv("AMADEUS_TOKEN_WAIT_TIMEOUT", "10")),
+)
+
+
+def use_shared_token(client):
+    """Makes an amadeus.Client authenticate through the shared token broker."""
+    client.access_token = SharedAccessToken(client, token_broker)
+    return client
+
+
+def get_token_broker_stats() -> dict:
+    return token_broker.stats()
@@ -0,0 +1,148 @@
+import os
+import time
+import threading
+
+from app.circle_service import CircleService
+from app.new_session_manager import (
+    schedule_circle_intent,
+    get_due_circle_intents,
+    settle_circle_intent,
+    drop_circle_intent,
+    count_circle_intents,
+    get_user_id_from_wallet,
+    try_acquire_lock,
+)
+from app.worker_pool import poller_pool
+
+
+class CircleIntentPoller:
+    """Polls every pending Circle payment intent from one scheduler thread.
+
+    Pending intents live in a Redis sorted set scored by their next check time,
+    so each tick only touches intents that are due and the schedule survives
+    restarts. Intents are checked often right after creation (when most
+    payments arrive) and then with exponential backoff. The `/circle-webhook`
+    path settles intents through the same Redis marker, so whichever sees a
+    completed payment first handles it and the other stops.
+    """
+
+    TICK_LOCK = "circle_intent_poller:tick"
+
+    def __init__(self, circle_service: CircleService = None):
+        self.circle_service = circle_service
+        self.tick_interval = float(os.getenv("CIRCLE_INTENT_TICK_INTERVAL", "5"))
+        self.fast_interval = float(os.getenv("CIRCLE_INTENT_FAST_INTERVAL", "5"))
+        self.fast_window = float(os.getenv("CIRCLE_INTENT_FAST_WINDOW", "120"))
+        self.max_interval = float(os.getenv("CIRCLE_INTENT_MAX_INTERVAL", "120"))
+        self.timeout_seconds = float(os.getenv("CIRCLE_INTENT_TIMEOUT", "3600"))
+        self.batch_size = int(os.getenv("CIRCLE_INTENT_BATCH_SIZE", "100"))
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._stats = {"ticks": 0, "status_checks": 0, "completed": 0, "expired": 0, "errors": 0}
+
+    def next_interval(self, age: float) -> float:
+        """Seconds until the next check for an intent that is `age` seconds old."""
+        if age < self.fast_window:
+            return self.fast_interval
+        # The wait doubles for every further `fast_window` seconds of age, until capped.
+        backoff = self.fast_interval * 2 ** ((age - self.fast_window) / self.fast_window)
+        return min(self.max_interval, backoff)
+
+    def register(self, intent_id: str, user_id: str = None):
+        """Start polling a newly created intent. The user is looked up from the
+        wallet mapping when the payment completes."""
+        now = time.time()
+        schedule_circle_intent(intent_id, now + self.fast_interval, created_at=now)
+        print(f"[CircleIntentPoller] Scheduled payment intent {intent_id}" + (f" for {user_id}." if user_id else "."))
+
+    def start(self):
+        """Start the scheduler thread if it is not already running. Safe to call repeatedly."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="circle-intent-poller", daemon=True)
+            self._thread.start()
+            print(f"[CircleIntentPoller] Started (tick {self.tick_interval}s).")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def counts(self) -> dict:
+        """Pending intents and those overdue by more than one max interval."""
+        return count_circle_intents(time.time(), overdue_after=self.max_interval)
+
+    def stats(self) -> dict:
+        return dict(self._stats, running=self._thread is not None and self._thread.is_alive(), **self.counts())
+
+    def _run(self):
+        while not self._stop_event.is_set() and not poller_pool.stopping:
+            if try_acquire_lock(self.TICK_LOCK, self.tick_interval):
+                try:
+                    self.tick()
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    print(f"[CircleIntentPoller] WARNING: Tick failed: {type(e).__name__}: {e}")
+            self._stop_event.wait(self.tick_interval)
+
+    def tick(self) -> int:
+        """Check every due intent once.
+
+        Returns:
+            Number of intents found complete during this tick
+        """
+        now = time.time()
+        due = get_due_circle_intents(now, limit=self.batch_size)
+        if not due:
+            return 0
+        if self.circle_service is None:
+            self.circle_service = CircleService()
+        self._stats["ticks"] += 1
+
+        completed = 0
+        for intent_id, created_at in due.items():
+            age = now - created_at
+            if age > self.timeout_seconds:
+                print(f"[CircleIntentPoller] WARNING: Payment intent {intent_id} not completed after {int(age)}s; no longer polling.")
+                drop_circle_intent(intent_id)
+                self._stats["expired"] += 1
+                continue
+
+            status = self.circle_service.get_payment_intent_status(intent_id)
+            self._stats["status_checks"] += 1
+            if status != "complete":
+                schedule_circle_intent(intent_id, time.time() + self.next_interval(age))
+                continue
+
+            # Look the user up before settling: a settled intent is no longer
+            # polled, so a failed lookup afterwards would lose the payment.
+            user_id = get_user_id_from_wallet(intent_id)
+            if not user_id:
+                print(f"[CircleIntentPoller] ERROR: Could not find user_id for paymentIntentId: {intent_id}")
+                schedule_circle_intent(intent_id, time.time() + self.next_interval(age))
+                continue
+            settled = settle_circle_intent(intent_id)
+            if settled is None:
+                schedule_circle_intent(intent_id, time.time() + self.next_interval(age))
+                continue
+            if not settled:
+                # The webhook got there first.
+                continue
+            print(f"[{user_id}] - INFO: Payment intent {intent_id} marked complete. Handling success.")
+            completed += 1
+            if not poller_pool.submit(_handle_successful_payment, user_id):
+                _handle_successful_payment(user_id)
+        self._stats["completed"] += completed
+        return completed
+
+
+def _handle_successful_payment(user_id: str):
+    try:
+        from app.main import handle_successful_payment  # Local import to avoid circular deps
+        handle_successful_payment(user_id)
+    except Exception as e:
+        print(f"[{user_id}] - ERROR in handle_successful_payment: {e}")
+
+
+circle_intent_poller = CircleIntentPoller()
@@ -1,5 +1,6 @@
 import os
 import requests
+from app import http_client
 import uuid
 import time
 
@@ -15,9 +16,13 @@ class CircleService:
             "Content-Type": "application/json",
         }
 
-    def create_payment_intent(self, usd_amount):
+    def create_payment_intent(self, usd_amount, wait_for_address=True):
         """
         Creates a new payment intent and polls for the deposit address.
+
+        With `wait_for_address=False` the intent is returned as soon as it is
+        created, with `address` set to None; callers then look the address up
+        in the background with `get_deposit_address`.
         """
         # Step 1: Create the Payment Intent
         intent_payload = {
@@ -33,7 +38,7 @@ class CircleService:
         }
         
         try:
-            intent_response = requests.post(
+            intent_response = http_client.post(
                 f"{self.base_url}/paymentIntents", headers=self.headers, json=intent_payload
             )
             intent_response.raise_for_status()
@@ -44,17 +49,13 @@ class CircleService:
                 print("Failed to create payment intent: ID missing from response.")
                 return None
 
+            if not wait_for_address:
+                return {"walletId": intent_id, "address": None}
+
             # Step 2: Poll for the address
             for _ in range(30): # Poll for up to 30 seconds
                 time.sleep(1) # Wait 1 second between polls
-                address_response = requests.get(
-                    f"{self.base_url}/paymentIntents/{intent_id}", headers=self.headers
-                )
-                address_response.raise_for_status()
-                address_data = address_response.json().get("data", {})
-                
-                payment_method = address_data.get("paymentMethods", [{}])[0]
-                address = payment_method.get("address")
+                address = self._fetch_deposit_address(intent_id)
 
                 if address:
                     print(f"Successfully retrieved address for intent {intent_id}")
@@ -70,11 +71,29 @@ class CircleService:
                 print(f"Response Body: {e.response.text}")
             return None 
 
+    def _fetch_deposit_address(self, intent_id):
+        response = http_client.get(
+            f"{self.base_url}/paymentIntents/{intent_id}", headers=self.headers
+        )
+        response.raise_for_status()
+        data = response.json().get("data", {})
+        payment_method = (data.get("paymentMethods") or [{}])[0]
+        return payment_method.get("address")
+
+    def get_deposit_address(self, intent_id):
+        """Returns the deposit address of a payment intent, or None if Circle has
+        not assigned one yet or the request fails."""
+        try:
+            return self._fetch_deposit_address(intent_id)
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching deposit address for payment intent {intent_id}: {e}")
+            return None
+
     def get_payment_intent_status(self, intent_id):
         """Returns the latest status (e.g., 'pending', 'complete') of a given payment intent ID.
         If an error occurs or the status cannot be determined, returns None."""
         try:
-            resp = requests.get(
+            resp = http_client.get(
                 f"{self.base_url}/paymentIntents/{intent_id}", headers=self.headers
             )
             resp.raise_for_status()
@@ -82,8 +101,8 @@ class CircleService:
             timeline = data.get("timeline", [])
             if not timeline:
                 return None
-            # Timeline items are ordered oldest -> newest; get the latest entry
-            latest_entry = sorted(timeline, key=lambda x: x.get("time", ""))[-1]
+            # Only the latest entry matters, so a single max() pass is enough
+            latest_entry = max(timeline, key=lambda x: x.get("time", ""))
             return latest_entry.get("status")
         except requests.exceptions.RequestException as e:
             print(f"Error fetching status for payment intent {intent_id}: {e}")
@@ -1,4 +1,6 @@
 import os
+import requests
+from app import http_client
 from typing import Optional, Dict, List
 
 # Lazy/forgiving imports so tests can run without native wheels
@@ -59,6 +61,20 @@ MINIMAL_ERC20_ABI = [
     },
 ]
 
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_EVENT_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+
+def _to_hex(value) -> str:
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    value = str(value)
+    return value if value.startswith("0x") else "0x" + value
+
+
+def _address_topic(address: str) -> str:
+    return "0x" + "0" * 24 + address.lower().replace("0x", "")
+
 
 class CircleLayerService:
     """Web3 utilities for Circle Layer Testnet with lazy RPC connection.
@@ -71,6 +87,7 @@ class CircleLayerService:
         self.rpc_url = rpc_url or os.getenv("CIRCLE_LAYER_RPC_URL")
         self.chain_id_env = chain_id or self._safe_int(os.getenv("CIRCLE_LAYER_CHAIN_ID"))
         self.w3 = None
+        self.active_rpc_url = None
 
     def _get_rpc_urls(self) -> List[str]:
         urls = []
@@ -101,6 +118,7 @@ class CircleLayerService:
                     if onchain_chain_id != self.chain_id_env:
                         raise RuntimeError(f"Chain ID mismatch: expected {self.chain_id_env}, got {onchain_chain_id}")
                 self.w3 = w3
+                self.active_rpc_url = url
                 return
             except Exception as e:
                 print(f"[CircleLayerService] WARNING: Failed to connect {url}: {e}")
@@ -171,6 +189,83 @@ class CircleLayerService:
         
         return balance
 
+    def get_native_balances(self, addresses: List[str], block_identifier: int) -> Dict[str, int]:
+        """Fetch native balances for many addresses at one block using JSON-RPC batch requests.
+
+        Args:
+            addresses: Addresses to check
+            block_identifier: Block number to read balances at (use a confirmed block)
+
+        Returns:
+            Dictionary mapping lowercased address to balance in wei. Addresses whose
+            lookup failed are omitted so callers can retry them next time.
+        """
+        self.connect()
+        batch_size = self._safe_int(os.getenv("CIRCLE_LAYER_RPC_BATCH_SIZE")) or 100
+        timeout = float(os.getenv("CIRCLE_LAYER_RPC_TIMEOUT", "5"))
+        block_hex = hex(block_identifier)
+        unique = list(dict.fromkeys(a.lower() for a in addresses))
+        balances = {}
+        for start in range(0, len(unique), batch_size):
+            chunk = unique[start:start + batch_size]
+            payload = [
+                {"jsonrpc": "2.0", "id": i, "method": "eth_getBalance", "params": [addr, block_hex]}
+                for i, addr in enumerate(chunk)
+            ]
+            try:
+                response = http_client.post(self.active_rpc_url, json=payload, timeout=timeout)
+                response.raise_for_status()
+                results = response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"[CircleLayerService] WARNING: Batch balance request failed: {e}")
+                continue
+            # Some nodes answer a batch with a single error object instead of a list.
+            if not isinstance(results, list):
+                print(f"[CircleLayerService] WARNING: Unexpected batch response: {results}")
+                continue
+            for item in results:
+                idx = item.get("id")
+                if item.get("error") or not isinstance(idx, int) or not 0 <= idx < len(chunk):
+                    continue
+                try:
+                    balances[chunk[idx]] = int(item["result"], 16)
+                except (KeyError, TypeError, ValueError):
+                    continue
+        return balances
+
+    def get_transfer_logs(self, token_address: str, from_block: int, to_block: int, to_addresses: List[str]) -> List[Dict]:
+        """Fetch ERC-20 Transfer logs sent to any of `to_addresses` in a block range.
+
+        The recipient filter is applied by the node through the indexed `to`
+        topic, so only matching logs come back over the wire and no ABI
+        decoding is needed.
+
+        Returns:
+            List of dicts with `to` (lowercased), `value`, `block_number` and a
+            unique `transfer_id` (tx hash and log index)
+        """
+        self.connect()
+        logs = self.w3.eth.get_logs({
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "address": self.w3.to_checksum_address(token_address),
+            "topics": [TRANSFER_EVENT_TOPIC, None, [_address_topic(a) for a in to_addresses]],
+        })
+        transfers = []
+        for log in logs:
+            try:
+                topics = log["topics"]
+                to_addr = "0x" + _to_hex(topics[2])[-40:]
+                transfers.append({
+                    "to": to_addr.lower(),
+                    "value": int(_to_hex(log["data"]), 16),
+                    "block_number": log["blockNumber"],
+                    "transfer_id": f"{_to_hex(log['transactionHash'])}:{log['logIndex']}",
+                })
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                print(f"[CircleLayerService] WARNING: Skipping malformed Transfer log: {e}")
+        return transfers
+
     def get_transaction_status(self, tx_hash: str) -> Optional[Dict]:
         """Get transaction details and status.
         
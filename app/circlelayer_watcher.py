@@ -0,0 +1,187 @@
+import os
+import threading
+from typing import Optional
+
+from app.circlelayer_service import CircleLayerService
+from app.new_session_manager import (
+    list_circlelayer_payments,
+    claim_circlelayer_payment,
+    credit_circlelayer_transfer,
+    get_indexer_cursor,
+    save_indexer_cursor,
+    try_acquire_lock,
+)
+from app.worker_pool import poller_pool
+
+
+class CircleLayerPaymentWatcher:
+    """Watches every outstanding Circle Layer deposit address from one thread.
+
+    Outstanding payments are the `circlelayer_payment:*` hashes in Redis, so the
+    watcher holds no state of its own and picks up where it left off after a
+    restart. Each tick reads the confirmed block once, then:
+
+    - native payments: fetches all balances at that block in JSON-RPC batches;
+    - ERC-20 payments: scans the new block range once per token for Transfer
+      logs addressed to any deposit address and credits them to their users.
+
+    RPC cost therefore grows with blocks rather than with the number of
+    customers waiting to pay.
+    """
+
+    TICK_LOCK = "circlelayer_watcher:tick"
+
+    def __init__(self, service: Optional[CircleLayerService] = None, poll_interval: Optional[int] = None, min_confirmations: Optional[int] = None):
+        self.service = service
+        self.poll_interval = poll_interval if poll_interval is not None else int(os.getenv("CIRCLE_LAYER_POLL_INTERVAL", "15"))
+        self.min_confirmations = min_confirmations if min_confirmations is not None else int(os.getenv("CIRCLE_LAYER_MIN_CONFIRMATIONS", "3"))
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._stats = {"ticks": 0, "last_block": None, "addresses_checked": 0, "log_ranges_scanned": 0, "payments_confirmed": 0, "errors": 0}
+
+    def start(self):
+        """Start the watcher thread if it is not already running. Safe to call repeatedly."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="circlelayer-watcher", daemon=True)
+            self._thread.start()
+            print(f"[CircleLayerWatcher] Started (interval {self.poll_interval}s, {self.min_confirmations} confirmations).")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self) -> dict:
+        return dict(self._stats, running=self._thread is not None and self._thread.is_alive())
+
+    def _run(self):
+        while not self._stop_event.is_set() and not poller_pool.stopping:
+            # Every web worker runs a watcher; the lock makes sure only one of
+            # them does the RPC work in any given interval.
+            if try_acquire_lock(self.TICK_LOCK, self.poll_interval):
+                try:
+                    self.tick()
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    print(f"[CircleLayerWatcher] WARNING: Tick failed: {type(e).__name__}: {e}")
+            self._stop_event.wait(self.poll_interval)
+
+    def tick(self) -> int:
+        """Check all outstanding payments once.
+
+        Returns:
+            Number of payments confirmed during this tick
+        """
+        payments = list_circlelayer_payments()
+        if not payments:
+            return 0
+
+        if self.service is None:
+            self.service = CircleLayerService()
+        confirmed_block = self.service.get_confirmed_block(self.min_confirmations)
+        self._stats["ticks"] += 1
+        self._stats["last_block"] = confirmed_block
+
+        native = {u: p for u, p in payments.items() if not p.get("token_address")}
+        by_token = {}
+        for user_id, payment in payments.items():
+            if payment.get("token_address"):
+                by_token.setdefault(payment["token_address"], {})[user_id] = payment
+
+        confirmed = 0
+        if native:
+            confirmed += self._check_native(native, confirmed_block)
+        for token_address, token_payments in by_token.items():
+            confirmed += self._scan_transfers(token_address, token_payments, confirmed_block)
+        self._stats["payments_confirmed"] += confirmed
+        return confirmed
+
+    def _check_native(self, payments: dict, confirmed_block: int) -> int:
+        balances = self.service.get_native_balances([p["address"] for p in payments.values()], confirmed_block)
+        self._stats["addresses_checked"] += len(payments)
+
+        confirmed = 0
+        for user_id, payment in payments.items():
+            balance = balances.get(payment["address"].lower())
+            if balance is None:
+                continue
+            balance_increase = balance - payment["initial_balance"]
+            if balance_increase < payment["expected_amount"]:
+                continue
+            print(f"[{user_id}] - INFO: Native token payment confirmed at block {confirmed_block}: balance increased by {balance_increase} wei (>= {payment['expected_amount']} wei)")
+            if self._claim(user_id):
+                confirmed += 1
+        return confirmed
+
+    def _scan_transfers(self, token_address: str, payments: dict, confirmed_block: int) -> int:
+        """Index Transfer logs of one token from the persisted cursor up to the confirmed block.
+
+        Each block range is scanned once for all waiting users, and the cursor
+        is saved after every chunk so a restart resumes where it stopped.
+        """
+        cursor_name = f"circlelayer_transfers:{token_address}"
+        lookback = int(os.getenv("CIRCLE_LAYER_INDEXER_LOOKBACK", "2000"))
+        max_range = int(os.getenv("CIRCLE_LAYER_INDEXER_MAX_RANGE", "2000"))
+
+        cursor = get_indexer_cursor(cursor_name)
+        # Transfers older than the lookback window predate any outstanding payment.
+        from_block = max(0, confirmed_block - lookback) if cursor is None else max(cursor + 1, confirmed_block - lookback)
+        self._stats["addresses_checked"] += len(payments)
+
+        confirmed = 0
+        users_by_address = {}
+        for user_id, payment in payments.items():
+            # Fully credited on an earlier tick that stopped before claiming.
+            if payment["received"] >= payment["expected_amount"]:
+                if self._claim(user_id):
+                    confirmed += 1
+                continue
+            users_by_address[payment["address"].lower()] = user_id
+
+        while from_block <= confirmed_block and users_by_address:
+            to_block = min(confirmed_block, from_block + max_range - 1)
+            transfers = self.service.get_transfer_logs(token_address, from_block, to_block, list(users_by_address))
+            self._stats["log_ranges_scanned"] += 1
+            for transfer in transfers:
+                user_id = users_by_address.get(transfer["to"])
+                if user_id is None:
+                    continue
+                total = credit_circlelayer_transfer(user_id, transfer["transfer_id"], transfer["value"])
+                if total is None:
+                    continue
+                expected = payments[user_id]["expected_amount"]
+                if total >= expected:
+                    print(f"[{user_id}] - INFO: ERC-20 token payment met at block {transfer['block_number']}: {total} >= {expected}.")
+                    del users_by_address[transfer["to"]]
+                    if self._claim(user_id):
+                        confirmed += 1
+            save_indexer_cursor(cursor_name, to_block)
+            from_block = to_block + 1
+        return confirmed
+
+    def _claim(self, user_id: str) -> bool:
+        if not claim_circlelayer_payment(user_id):
+            # Another worker already handled this payment.
+            return False
+        self._dispatch(user_id)
+        return True
+
+    def _dispatch(self, user_id: str):
+        # PDF generation and delivery are slow, so keep them off the watcher thread
+        # when possible. The claim has already removed the payment from Redis, so
+        # fall back to handling it inline rather than dropping it.
+        if not poller_pool.submit(_handle_successful_payment, user_id):
+            _handle_successful_payment(user_id)
+
+
+def _handle_successful_payment(user_id: str):
+    try:
+        from app.main import handle_successful_payment  # Local import to avoid circular deps
+        handle_successful_payment(user_id)
+    except Exception as e:
+        print(f"[{user_id}] - ERROR calling handle_successful_payment: {e}")
+
+
+circlelayer_watcher = CircleLayerPaymentWatcher()
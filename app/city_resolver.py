@@ -0,0 +1,313 @@
+import unicodedata
+from collections import namedtuple, defaultdict
+
+import pytz
+
+# Match tiers, best first. Within a tier candidates are ordered by edit
+# distance, then by how important the place is.
+TIER_CODE, TIER_CITY, TIER_AIRPORT, TIER_CITY_PREFIX, TIER_AIRPORT_PREFIX, TIER_FUZZY = range(6)
+
+# `major` marks the hub airports listed in app/data/major_airports.csv.
+Place = namedtuple("Place", "name code country kind international major", defaults=(False, False))
+Candidate = namedtuple("Candidate", "code name country tier distance")
+
+# Words users add around a place name that are not part of it: "new york city".
+_NOISE_WORDS = {"city", "airport", "international", "intl", "the"}
+# Country qualifiers users type that are not ISO 3166 names or alpha-2 codes.
+_COUNTRY_ALIASES = {"uk": "GB", "england": "GB", "scotland": "GB", "usa": "US", "america": "US", "uae": "AE"}
+
+
+def normalize(text: str) -> str:
+    """Casefolds, strips accents and collapses punctuation: 'São Paulo ' -> 'sao paulo'."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in text).split())
+
+
+def _country_names() -> dict:
+    names = {normalize(name): code for code, name in pytz.country_names.items()}
+    names.update(_COUNTRY_ALIASES)
+    return names
+
+
+def _deletes(key: str, depth: int) -> set:
+    """Every string made by deleting up to `depth` characters from `key`."""
+    found, frontier = {key}, {key}
+    for _ in range(depth):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        found |= frontier
+    return found
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein (optimal string alignment) distance, or limit + 1
+    as soon as the distance is known to exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = 0 if ca == cb else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class _TrieNode:
+    __slots__ = ("children", "best")
+
+    def __init__(self, best=None):
+        # First character -> (edge label, child). Edges carry whole runs of
+        # characters (a radix trie), so there is one node per branch point
+        # rather than one per character.
+        self.children = {}
+        # Ids of the best ranked names below this node, so a prefix lookup
+        # never walks the subtree.
+        self.best = best or []
+
+
+class PrefixTrie:
+    """Radix trie answering "best names starting with this prefix"."""
+
+    def __init__(self, best_per_node: int):
+        self.best_per_node = best_per_node
+        self.root = _TrieNode()
+
+    def insert(self, key: str, value):
+        """Adds `key`. Insert in order of importance: each node keeps the
+        first `best_per_node` values inserted below it."""
+        node, rest = self.root, key
+        self._remember(node, value)
+        while rest:
+            edge = node.children.get(rest[0])
+            if edge is None:
+                child = _TrieNode()
+                node.children[rest[0]] = (rest, child)
+                self._remember(child, value)
+                return
+            label, child = edge
+            common = 0
+            while common < min(len(label), len(rest)) and label[common] == rest[common]:
+                common += 1
+            if common < len(label):
+                # Split the edge; the middle node starts with everything below the old child.
+                middle = _TrieNode(list(child.best))
+                middle.children[label[common]] = (label[common:], child)
+                node.children[rest[0]] = (label[:common], middle)
+                child = middle
+            self._remember(child, value)
+            node, rest = child, rest[common:]
+
+    def _remember(self, node: _TrieNode, value):
+        if len(node.best) < self.best_per_node and value not in node.best:
+            node.best.append(value)
+
+    def best(self, prefix: str) -> list:
+        node, rest = self.root, prefix
+        while rest:
+            edge = node.children.get(rest[0])
+            if edge is None:
+                return []
+            label, child = edge
+            if not (label.startswith(rest) or rest.startswith(label)):
+                return []
+            node, rest = child, rest[len(label):]
+        return node.best
+
+
+class CityResolver:
+    """Ranks airports and metropolitan codes for a free-text place name.
+
+    Built once from the bundled reference data. Names of cities, metro areas
+    and airports are indexed three ways:
+
+    - a dict for exact matches ("lagos"),
+    - a radix trie whose nodes keep their best names, for partial input
+      ("frankfurt" -> "frankfurt am main"),
+    - a symmetric-deletion index, with candidates confirmed by a bounded
+      edit distance, for typos ("londn").
+
+    A country given after a comma or at the end ("Lagos, Nigeria", "Lagos
+    Nigeria") restricts the candidates to that country.
+    """
+
+    TRIE_BEST = 8
+
+    def __init__(self, places):
+        names = defaultdict(list)
+        for place in places:
+            key = normalize(place.name)
+            if key:
+                names[(key, "airport" if place.kind == "airport" else "city")].append(place)
+
+        self._names = []  # name id -> normalized name
+        self._kinds = []  # name id -> "city" or "airport"
+        self._entries = []  # name id -> [(code, country)], best first
+        self._ranks = []  # name id -> {country: rank}
+        for (key, kind), entries in names.items():
+            self._names.append(key)
+            self._kinds.append(kind)
+            by_country = defaultdict(list)
+            for place in entries:
+                by_country[place.country].append(place)
+            ranks = {c: self._group_rank(group) for c, group in by_country.items()}
+            ordered = sorted(entries, key=lambda p: (tuple(-x for x in ranks[p.country]), p.kind != "metro",
+                                                     not p.major, not p.international, p.code))
+            codes = []
+            for p in ordered:
+                if (p.code, p.country) not in codes:
+                    codes.append((p.code, p.country))
+            self._entries.append(codes)
+            self._ranks.append(ranks)
+        self._code_countries = {code: country for entries in self._entries for code, country in entries}
+
+        self._exact = defaultdict(list)
+        for name_id, key in enumerate(self._names):
+            self._exact[key].append(name_id)
+        # Prefix and typo lookups only cover city and metro names: airport
+        # names are long and users type them in full ("heathrow").
+        city_ids = sorted((i for i, kind in enumerate(self._kinds) if kind == "city"), key=self._importance)
+        self._trie = PrefixTrie(self.TRIE_BEST)
+        self._deletions = defaultdict(list)
+        for name_id in city_ids:
+            self._trie.insert(self._names[name_id], name_id)
+            for deleted in _deletes(self._names[name_id], 1):
+                self._deletions[deleted].append(name_id)
+        self._countries = _country_names()
+
+    @staticmethod
+    def _group_rank(group) -> tuple:
+        """How likely a name means this country's place: metro areas first,
+        then cities with a hub, then an international airport, then size."""
+        has_metro = any(p.kind == "metro" for p in group)
+        has_major = any(p.major for p in group)
+        has_international = any(p.international for p in group)
+        return has_metro, has_major, has_international, len({p.code for p in group})
+
+    def _importance(self, name_id: int) -> tuple:
+        best_rank = max(self._ranks[name_id].values())
+        return self._kinds[name_id] == "airport", tuple(-x for x in best_rank), len(self._names[name_id])
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def names(self) -> list:
+        """Every indexed (normalized) name."""
+        return list(self._names)
+
+    def candidates(self, query: str, limit: int = 5) -> list:
+        """Returns up to `limit` Candidates for `query`, best first."""
+        return [candidate for _, candidate in self._search(query)[:limit]]
+
+    def resolve(self, query: str):
+        """Returns the single best IATA code for `query`, or None when nothing
+        matches or the best match is a name shared by several countries that
+        rank equally (Birmingham GB/US), so the caller can ask Amadeus."""
+        found = self._search(query)
+        if not found:
+            return None
+        (best_key, best), others = found[0], found[1:]
+        for sort_key, other in others:
+            if sort_key[:3] != best_key[:3]:
+                break
+            if other.country != best.country:
+                return None
+        return best.code
+
+    def _search(self, query: str) -> list:
+        raw = (query or "").partition(",")[0].strip()
+        if len(raw) == 3 and raw.isupper() and raw in self._code_countries:
+            # Already an IATA code.
+            return [((TIER_CODE, 0, ()), Candidate(raw, normalize(raw), self._code_countries[raw], TIER_CODE, 0))]
+        place, country = self._split_country(query)
+        if not place:
+            return []
+        for key in self._variants(place):
+            found = self._lookup(key, country)
+            if found:
+                return found
+        return []
+
+    def _split_country(self, query: str):
+        place, _, qualifier = (query or "").partition(",")
+        place = normalize(place)
+        country = self._country_code(normalize(qualifier))
+        if country is None and " " in place:
+            # "lagos nigeria", "san jose costa rica"
+            words = place.split()
+            for cut in range(1, min(3, len(words) - 1) + 1):
+                code = self._country_code(" ".join(words[-cut:]), allow_alpha2=False)
+                if code and place not in self._exact:
+                    return " ".join(words[:-cut]), code
+        return place, country
+
+    def _country_code(self, text: str, allow_alpha2: bool = True):
+        if not text:
+            return None
+        if text in self._countries:
+            return self._countries[text]
+        if allow_alpha2 and len(text) == 2:
+            return text.upper()
+        return None
+
+    @staticmethod
+    def _variants(key: str) -> list:
+        stripped = " ".join(w for w in key.split() if w not in _NOISE_WORDS)
+        return [key, stripped] if stripped and stripped != key else [key]
+
+    def _lookup(self, key: str, country: str = None) -> list:
+        exact = self._exact.get(key, [])
+        found = self._collect(exact, country, lambda name_id: (
+            TIER_CITY if self._kinds[name_id] == "city" else TIER_AIRPORT, 0))
+        if found:
+            return found
+        # Whole words first ("frankfurt" -> "frankfurt am main"), then a partial
+        # last word ("londo"), which is too loose for very short input.
+        prefixes = [key + " ", key] if len(key) >= 4 else [key + " "]
+        for prefix in prefixes:
+            found = self._collect(self._trie.best(prefix), country, lambda name_id: (
+                TIER_CITY_PREFIX if self._kinds[name_id] == "city" else TIER_AIRPORT_PREFIX, 0))
+            if found:
+                return found
+        return self._fuzzy(key, country)
+
+    def _fuzzy(self, key: str, country: str = None) -> list:
+        # Symmetric deletion: names are indexed under every one-character
+        # deletion, so deleting up to `limit` characters from the query and
+        # looking each result up finds every name within `limit` edits
+        # without comparing the query to all names.
+        limit = 1 if len(key) <= 5 else 2
+        pool = set()
+        for deleted in _deletes(key, limit):
+            pool.update(self._deletions.get(deleted, ()))
+        distances = {}
+        for name_id in pool:
+            distance = edit_distance(key, self._names[name_id], limit)
+            if distance <= limit:
+                distances[name_id] = distance
+        return self._collect(distances, country, lambda name_id: (TIER_FUZZY, distances[name_id]))
+
+    def _collect(self, name_ids, country, tier_of) -> list:
+        found = []
+        for name_id in name_ids:
+            tier, distance = tier_of(name_id)
+            for code, code_country in self._entries[name_id]:
+                if country and code_country != country:
+                    continue
+                rank = self._ranks[name_id][code_country]
+                found.append((tier, distance, tuple(-x for x in rank), len(found),
+                              Candidate(code, self._names[name_id], code_country, tier, distance)))
+        found.sort(key=lambda item: item[:4])
+        seen, ordered = set(), []
+        for *sort_key, candidate in found:
+            if candidate.code not in seen:
+                seen.add(candidate.code)
+                ordered.append((tuple(sort_key), candidate))
+        return ordered
@@ -0,0 +1,140 @@
+import os
+import threading
+
+# Llama 3 averages about four characters of English per token, plus a few
+# tokens of chat-template framing per message. Close enough for budgeting;
+# the API's reported usage is recorded alongside when it is available.
+CHARS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 4
+
+SUMMARY_PREFIX = "Summary of earlier turns in this conversation:"
+# The assistant restates every detail it has gathered before this token, so
+# its last such message summarizes everything said before it.
+INFO_COMPLETE_TOKEN = "[INFO_COMPLETE]"
+# Gathered details are listed in this order, any others after them.
+DETAIL_ORDER = ["origin", "destination", "departure_date", "return_date", "number_of_travelers",
+                "traveler_name", "traveler_names", "travel_class", "flexible_dates", "non_stop", "currency"]
+
+
+def estimate_tokens(messages) -> int:
+    return sum(TOKENS_PER_MESSAGE + len(m.get("content") or "") // CHARS_PER_TOKEN for m in messages)
+
+
+class ConversationContext:
+    """Decides what part of a stored conversation is sent to the chat model.
+
+    - The stored history keeps one system message, the prompt for the
+      current state, at its start (older histories repeated it on every
+      state change).
+    - The model sees that prompt, the last `window_turns` user/assistant
+      turns, and a compact summary of anything older appended to the prompt.
+      The summary is the session's gathered details as key=value pairs, so
+      they survive however long ago they were given. Without any details it
+      falls back to the assistant's last restatement plus what the user said
+      after it, capped at `summary_max_chars`.
+    - Token counts are estimated per call and, with the API's usage when it
+      is reported, accumulated per kind of call.
+    """
+
+    def __init__(self, window_turns: int, summary_max_chars: int):
+        self.window_turns = window_turns
+        self.summary_max_chars = summary_max_chars
+        self._lock = threading.Lock()
+        self._usage = {}
+
+    @staticmethod
+    def set_system_prompt(history: list, system_prompt: str) -> list:
+        """Makes `system_prompt` the only system message, in place."""
+        history[:] = [{"role": "system", "content": system_prompt}] + [m for m in history if m.get("role") != "system"]
+        return history
+
+    def build_messages(self, history: list, known_details: dict = None) -> list:
+        """The messages to send for a history whose last entry is the new user
+        message. `known_details` are the flight details stored in the session."""
+        system = [m for m in history if m.get("role") == "system"][:1]
+        turns = [m for m in history if m.get("role") != "system"]
+        keep = self.window_turns * 2
+        if len(turns) <= keep:
+            return system + turns
+        older, recent = turns[:-keep], turns[-keep:]
+        summary = self.summarize(older, known_details)
+        if summary:
+            # Folded into the one system message rather than sent as a second one.
+            content = f"{system[0]['content']}\n\n{summary}" if system else summary
+            system = [{"role": "system", "content": content}]
+        return system + recent
+
+    @staticmethod
+    def summarize_details(details: dict) -> str:
+        """e.g. "Known: origin=LOS, destination=LHR, number_of_travelers=2"."""
+        keys = [k for k in DETAIL_ORDER if k in details] + sorted(k for k in details if k not in DETAIL_ORDER)
+        pairs = []
+        for key in keys:
+            value = details[key]
+            if value is None or value is False or value == "" or value == []:
+                continue
+            if isinstance(value, list):
+                value = " and ".join(str(v) for v in value)
+            pairs.append(f"{key}={value}")
+        return f"Known: {', '.join(pairs)}" if pairs else ""
+
+    def summarize(self, turns: list, known_details: dict = None) -> str:
+        known = self.summarize_details(known_details or {})
+        if known:
+            return f"{SUMMARY_PREFIX}\n{known}"
+        start = 0
+        for i, message in enumerate(turns):
+            if message.get("role") == "assistant" and INFO_COMPLETE_TOKEN in (message.get("content") or ""):
+                start = i
+        lines = []
+        for message in turns[start:]:
+            content = " ".join((message.get("content") or "").replace(INFO_COMPLETE_TOKEN, "").split())
+            if content and (message.get("role") == "user" or message is turns[start]):
+                lines.append(f"- {message['role']}: {content}")
+        # Most recent lines win when the summary is over budget.
+        kept, size = [], len(SUMMARY_PREFIX)
+        for line in reversed(lines):
+            if size + len(line) + 1 > self.summary_max_chars:
+                break
+            kept.append(line)
+            size += len(line) + 1
+        return "\n".join([SUMMARY_PREFIX, *reversed(kept)]) if kept else ""
+
+    @staticmethod
+    def transcript(history: list) -> str:
+        """The user/assistant turns as text, without system prompts."""
+        return "\n".join(f"{m['role']}: {m['content']}" for m in history if m.get("role") != "system")
+
+    def record(self, kind: str, messages: list, history: list = None, response=None):
+        """Accounts for one model call that sent `messages`, cut down from
+        `history` when given."""
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        with self._lock:
+            entry = self._usage.setdefault(kind, {"calls": 0, "estimated_prompt_tokens": 0, "estimated_tokens_saved": 0,
+                                                  "prompt_tokens": 0, "completion_tokens": 0})
+            entry["calls"] += 1
+            estimated = estimate_tokens(messages)
+            entry["estimated_prompt_tokens"] += estimated
+            if history is not None:
+                entry["estimated_tokens_saved"] += max(0, estimate_tokens(history) - estimated)
+            if isinstance(prompt_tokens, int):
+                entry["prompt_tokens"] += prompt_tokens
+            if isinstance(completion_tokens, int):
+                entry["completion_tokens"] += completion_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {kind: dict(entry, avg_estimated_prompt_tokens=round(entry["estimated_prompt_tokens"] / entry["calls"]))
+                    for kind, entry in self._usage.items()}
+
+
+conversation_context = ConversationContext(
+    window_turns=int(os.getenv("AI_CONTEXT_WINDOW_TURNS", "6")),
+    summary_max_chars=int(os.getenv("AI_CONTEXT_SUMMARY_CHARS", "800")),
+)
+
+
+def get_ai_usage_stats() -> dict:
+    return conversation_context.stats()
@@ -1,17 +1,23 @@
-import threading
 import os
-from app.new_session_manager import load_session, save_session
-from app.ai_service import get_ai_response, extract_flight_details_from_history, extract_traveler_details, extract_traveler_names
+from app.new_session_manager import load_session, save_session, with_raw_offer
+from app.ai_service import get_ai_response, get_ai_response_with_details, extract_flight_details_from_history, extract_traveler_details, extract_traveler_names
 from app.amadeus_service import AmadeusService
 from app.payment_service import create_checkout_session
-from app.tasks import search_flights_task, poll_usdc_payment_task, poll_circlelayer_payment_task
+from app.tasks import search_flights_task, deliver_usdc_address_task, USDC_PAYMENT_INSTRUCTIONS
 from app.circle_service import CircleService
 from app.currency_service import CurrencyService
 from app.new_session_manager import save_wallet_mapping, save_evm_mapping, get_next_address_index, save_circlelayer_payment_info
 import app.circlelayer_service as circlelayer_service
+from app.circlelayer_watcher import circlelayer_watcher
+from app.circle_intent_poller import circle_intent_poller
+from app.worker_pool import search_pool, poller_pool
 from dateutil import parser
+import app.slot_extractor as slot_extractor
 
 TRAVEL_CLASSES = ["ECONOMY", "PREMIUM_ECONOMY", "BUSINESS", "FIRST"]
+# Optional details the user can take back; the model clears them with null.
+CLEARABLE_DETAILS = ("return_date", "travel_class")
+BUSY_MESSAGE = "I'm handling a lot of requests right now. Please send your message again in a minute."
 
 # Initialize services
 circle_service = CircleService()
@@ -33,6 +39,45 @@ def _format_flight_offers(flights):
     return "\n".join(response_lines)
 
 
+def _last_question(history):
+    return next((m.get("content") for m in reversed(history or [])
+                 if isinstance(m, dict) and m.get("role") == "assistant"), None)
+
+
+def _merge_details(known_details, new_details):
+    """The known details updated with the model's. A detail the model leaves
+    out or sets to null keeps its known value, except that a null clears one
+    of the CLEARABLE_DETAILS."""
+    merged = dict(known_details)
+    for key, value in new_details.items():
+        if value is not None:
+            merged[key] = value
+        elif key in CLEARABLE_DETAILS:
+            merged.pop(key, None)
+    return merged
+
+
+def _extract_flight_details(history, known_details):
+    """Flight details after the latest messages, extracted by the model from
+    the details known so far and those messages only, and merged into them."""
+    slot_extractor.record("llm_extractions")
+    # The AI service should return a dictionary, but we safeguard against it returning a list.
+    extracted_data = extract_flight_details_from_history(history, known_details=known_details)
+    if isinstance(extracted_data, list) and extracted_data:
+        extracted_data = extracted_data[0] # Take the first element if it's a list
+    elif not isinstance(extracted_data, dict):
+        extracted_data = {} # Default to empty dict if something is wrong
+    return _merge_details(known_details, extracted_data)
+
+def _ai_turn(incoming_msg, conversation_history, state, known_details):
+    """The model's reply plus, in combined mode (AI_COMBINED_TURN), the flight
+    details from the same call. The details are None when they still have to
+    be extracted separately."""
+    if os.getenv("AI_COMBINED_TURN", "false").lower() == "true":
+        return get_ai_response_with_details(incoming_msg, conversation_history, state, known_details)
+    ai_response, updated_history = get_ai_response(incoming_msg, conversation_history, state, known_details)
+    return ai_response, updated_history, None
+
 def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
     """
     Processes an incoming message from any platform.
@@ -51,17 +96,33 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
     # NOTE: This is a simplified version of the logic from app/main.py's webhook.
     # It does not yet include payment or final booking logic.
     if state == "GATHERING_INFO":
-        ai_response, updated_history = get_ai_response(incoming_msg, conversation_history, state)
+        # The details gathered so far are kept in the session; only the new
+        # message is parsed to update them.
+        slots = slot_extractor.update_slots(flight_details, incoming_msg, _last_question(conversation_history))
+        # Details left over from an earlier search only short-circuit the model
+        # once the user has changed something.
+        details_complete = slots != flight_details and slot_extractor.is_complete(slots)
+        if details_complete:
+            # Everything the model would ask for is already stated; skip both model calls.
+            slot_extractor.record("replies_avoided")
+            slot_extractor.record("extractions_avoided")
+            model_details = None
+            ai_response = slot_extractor.confirmation_message(slots)
+            updated_history = list(conversation_history) + [{"role": "user", "content": incoming_msg},
+                                                            {"role": "assistant", "content": ai_response}]
+        else:
+            slot_extractor.record("llm_replies")
+            ai_response, updated_history, model_details = _ai_turn(incoming_msg, conversation_history, state, slots)
         
         if "[INFO_COMPLETE]" in ai_response:
-            # The AI service should return a dictionary, but we safeguard against it returning a list.
-            extracted_data = extract_flight_details_from_history(updated_history)
-            if isinstance(extracted_data, list) and extracted_data:
-                flight_details = extracted_data[0] # Take the first element if it's a list
-            elif isinstance(extracted_data, dict):
-                flight_details = extracted_data
+            if details_complete:
+                flight_details = slots
+            elif model_details:
+                # The reply came with the details; no second call needed.
+                slot_extractor.record("extractions_avoided")
+                flight_details = _merge_details(slots, model_details)
             else:
-                flight_details = {} # Default to empty dict if something is wrong
+                flight_details = _extract_flight_details(updated_history, slots)
 
             # Try to get the number of travelers, default to 1 if not found or invalid
             try:
@@ -93,6 +154,7 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
                     # Continue processing even if session save fails
         else:
             response_messages.append(ai_response)
+            flight_details = slots
             try:
                 save_session(user_id, state, updated_history, flight_offers, flight_details)
                 print(f"[Core Logic] Session saved for {user_id}")
@@ -159,7 +221,7 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
             save_session(user_id, state, conversation_history, flight_offers, flight_details)
 
     elif state == "AWAITING_CONFIRMATION":
-        ai_response, updated_history = get_ai_response(incoming_msg, conversation_history, state)
+        ai_response, updated_history, model_details = _ai_turn(incoming_msg, conversation_history, state, flight_details)
 
         if "[CONFIRMED]" in ai_response:
             # Re-load details from session in case this is the second confirmation
@@ -179,16 +241,18 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
                     # If parsing fails, we might send an error message or let the Amadeus API handle it.
                     # For now, we'll proceed and let Amadeus validate.
                 
-                # Immediately respond to the user
-                response_messages.append("Okay, I'm searching for the best flights for you. This might take a moment...")
-                
-                # Trigger the background task in a separate thread
-                task_thread = threading.Thread(target=search_flights_task, args=(user_id, flight_details))
-                task_thread.start()
-                
-                # Update state to prevent other inputs during search
-                state = "SEARCH_IN_PROGRESS"
-                save_session(user_id, state, updated_history, [], flight_details)
+                # Trigger the background search on the shared search pool
+                if search_pool.submit(search_flights_task, user_id, flight_details):
+                    # Immediately respond to the user
+                    response_messages.append("Okay, I'm searching for the best flights for you. This might take a moment...")
+
+                    # Update state to prevent other inputs during search
+                    state = "SEARCH_IN_PROGRESS"
+                    save_session(user_id, state, updated_history, [], flight_details)
+                else:
+                    # The pool is saturated; stay in AWAITING_CONFIRMATION so the user can simply confirm again.
+                    response_messages.append(BUSY_MESSAGE)
+                    save_session(user_id, state, conversation_history, flight_offers, flight_details)
             else:
                 # This should rarely happen, but it's a safe fallback.
                 response_messages.append("I seem to have lost the details. Let's start over.")
@@ -197,16 +261,13 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
         
         elif "[INFO_COMPLETE]" in ai_response:
             # This means the user made a correction. Re-extract details.
-            extracted_data = extract_flight_details_from_history(updated_history)
-            if isinstance(extracted_data, list) and extracted_data:
-                flight_details = extracted_data[0] # Safeguard
-            elif isinstance(extracted_data, dict):
-                flight_details = extracted_data
+            if model_details:
+                flight_details = _merge_details(flight_details, model_details)
             else:
-                flight_details = {} # Default
+                flight_details = _extract_flight_details(updated_history, flight_details)
 
             # We must re-ask for class if it was part of the correction.
-            if 'travel_class' not in flight_details:
+            if not flight_details.get('travel_class'):
                 state = "AWAITING_CLASS_SELECTION"
                 class_options_text = "It looks like the details were updated. What class would you like to fly? You can choose from: ECONOMY, PREMIUM_ECONOMY, BUSINESS, FIRST."
                 response_messages.append(class_options_text)
@@ -241,19 +302,26 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
             save_session(user_id, state, updated_history, flight_offers, flight_details)
 
     elif state == "SEARCH_IN_PROGRESS":
+        # Nothing changes here, and saving the session loaded above could
+        # overwrite results the background search saved in the meantime.
         response_messages.append("I'm still looking for flights for you. I'll send them over as soon as they're ready.")
-        save_session(user_id, state, conversation_history, flight_offers, flight_details)
 
     elif state == "FLIGHT_SELECTION":
         if "no" in incoming_msg.lower():
             response_messages.append("Okay, let's start over. Where would you like to go?")
             state = "GATHERING_INFO"
             save_session(user_id, state, [], [], {})
+        elif not flight_offers:
+            # The offers expired (see flight_offers_ttl) before a flight was chosen.
+            response_messages.append("Sorry, those flight offers have expired. Let's search again. Where would you like to go?")
+            state = "GATHERING_INFO"
+            save_session(user_id, state, [], [], {})
         else:
             try:
                 selection = int(incoming_msg.strip())
                 if 1 <= selection <= len(flight_offers):
-                    selected_flight = flight_offers[selection - 1] # Correctly index the selected flight
+                    # Keep the full Amadeus payload of the chosen offer only, for booking
+                    selected_flight = with_raw_offer(flight_offers[selection - 1])
                     
                     state = "AWAITING_PAYMENT_SELECTION"
                     response_messages.append("You've selected a great flight. How would you like to pay? (Reply with 'Card', 'USDC', or 'On-chain')")
@@ -299,7 +367,27 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
                 # currency = selected_flight.get('price', {}).get('currency', 'USD')
                 # usd_amount = currency_service.convert_to_usd(float(price_str), currency)
 
-                if usd_amount:
+                async_intents = os.getenv("CIRCLE_ASYNC_PAYMENT_INTENTS", "false").lower() == "true"
+
+                if usd_amount and async_intents:
+                    # Don't hold the webhook while Circle assigns an address; it is
+                    # looked up in the background and sent to the user when ready.
+                    wallet_info = circle_service.create_payment_intent(usd_amount, wait_for_address=False)
+                    payment_intent_id = wallet_info.get('walletId') if wallet_info else None
+                    if payment_intent_id:
+                        # Save the state the delivery task depends on before it can run.
+                        save_wallet_mapping(payment_intent_id, user_id)
+                        save_session(user_id, "AWAITING_USDC_PAYMENT", conversation_history, [selected_flight],
+                                     dict(flight_details, expected_usd_amount=usd_amount))
+                    if payment_intent_id and poller_pool.submit(deliver_usdc_address_task, user_id, payment_intent_id, usd_amount, circle_service):
+                        response_messages.append("Great! I'm generating your USDC payment address and will send it here in a moment.")
+                        state = "AWAITING_USDC_PAYMENT"
+                        circle_intent_poller.register(payment_intent_id, user_id)
+                        circle_intent_poller.start()
+                    else:
+                        response_messages.append("Sorry, I couldn't generate a USDC payment address at the moment. Please try again or select 'Card'.")
+                        save_session(user_id, state, conversation_history, [selected_flight], flight_details)
+                elif usd_amount:
                     wallet_info = circle_service.create_payment_intent(usd_amount)
                     if wallet_info:
                         payment_intent_id = wallet_info.get('walletId') # Correct key is walletId
@@ -310,7 +398,7 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
                             save_wallet_mapping(payment_intent_id, user_id)
                             
                             # Using a hardcoded test amount in the message
-                            response_messages.append(f"To pay with USDC, please send exactly {usd_amount:.2f} USDC (test amount) to the address below. I will notify you once the payment is confirmed.")
+                            response_messages.append(USDC_PAYMENT_INSTRUCTIONS.format(amount=usd_amount))
                             # Send the address in a separate message with no formatting for easy copying.
                             response_messages.append(wallet_address)
                             state = "AWAITING_USDC_PAYMENT"
@@ -320,14 +408,11 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
                             save_session(user_id, state, conversation_history, [selected_flight], flight_details)
 
                             # ------------------------------------------------
-                            # Start background polling for the USDC payment
+                            # Schedule background polling for the USDC payment
                             # ------------------------------------------------
-                            try:
-                                poll_thread = threading.Thread(target=poll_usdc_payment_task, args=(user_id, payment_intent_id))
-                                poll_thread.start()
-                                print(f"[{user_id}] - INFO: Started polling thread for payment intent {payment_intent_id}.")
-                            except Exception as e:
-                                print(f"[{user_id}] - ERROR: Could not start polling thread: {e}")
+                            # Poll as a fallback in case the Circle webhook is missed
+                            circle_intent_poller.register(payment_intent_id, user_id)
+                            circle_intent_poller.start()
                         else:
                             response_messages.append("Sorry, I couldn't generate a USDC payment address at the moment. Please try again or select 'Card'.")
                             save_session(user_id, state, conversation_history, [selected_flight], flight_details)
@@ -343,10 +428,10 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
 
         elif "on-chain" in incoming_msg.lower() or "circle layer" in incoming_msg.lower() or "clayer" in incoming_msg.lower() or "circlelayer" in incoming_msg.lower():
             try:
-                # Native token configuration
+                # Token configuration (native token unless an ERC-20 contract is configured)
                 token_symbol = os.getenv("CIRCLE_LAYER_TOKEN_SYMBOL", "CLAYER")
                 decimals = int(os.getenv("CIRCLE_LAYER_TOKEN_DECIMALS", "18"))
-                token_address = None  # Native token - no contract address needed
+                token_address = os.getenv("CIRCLE_LAYER_TOKEN_ADDRESS") or None
                 
                 # Calculate amount in wei (smallest unit)
                 amount_in_tokens = 1.0  # 1 CLAYER
@@ -360,14 +445,16 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
                 deposit_address = deposit.get("address")
 
                 if deposit_address:
-                    # Get initial balance to track payment increase
-                    try:
-                        circlelayer_svc = circlelayer_service.CircleLayerService()
-                        initial_balance = circlelayer_svc.check_native_balance(deposit_address)
-                        print(f"[{user_id}] - INFO: Initial balance at {deposit_address}: {initial_balance} wei")
-                    except Exception as e:
-                        print(f"[{user_id}] - WARNING: Could not get initial balance: {e}")
-                        initial_balance = 0
+                    # Get initial balance to track payment increase (ERC-20 payments are
+                    # credited from Transfer logs instead)
+                    initial_balance = 0
+                    if token_address is None:
+                        try:
+                            circlelayer_svc = circlelayer_service.CircleLayerService()
+                            initial_balance = circlelayer_svc.check_native_balance(deposit_address)
+                            print(f"[{user_id}] - INFO: Initial balance at {deposit_address}: {initial_balance} wei")
+                        except Exception as e:
+                            print(f"[{user_id}] - WARNING: Could not get initial balance: {e}")
                     
                     # Save payment tracking information
                     save_circlelayer_payment_info(
@@ -375,7 +462,8 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
                         address=deposit_address,
                         initial_balance=initial_balance,
                         expected_amount=amount_units,
-                        address_index=address_index
+                        address_index=address_index,
+                        token_address=token_address
                     )
                     
                     save_evm_mapping(deposit_address, user_id)
@@ -398,16 +486,8 @@ def process_message(user_id, incoming_msg, amadeus_service: AmadeusService):
                     )
                     response_messages.append(deposit_address)
 
-                    # Start background poller for native token balance
-                    try:
-                        poll_thread = threading.Thread(
-                            target=poll_circlelayer_payment_task,
-                            args=(user_id, deposit_address, token_address, amount_units, decimals),
-                        )
-                        poll_thread.start()
-                        print(f"[{user_id}] - INFO: Started Circle Layer polling for payment at {deposit_address} (index {address_index})")
-                    except Exception as e:
-                        print(f"[{user_id}] - ERROR: Could not start Circle Layer polling thread: {e}")
+                    # The shared watcher picks the payment up from its Redis tracking hash
+                    circlelayer_watcher.start()
                 else:
                     response_messages.append("Sorry, I couldn't generate a Circle Layer address right now. Please try again or choose 'Card'.")
                     save_session(user_id, state, conversation_history, [selected_flight], flight_details)
@@ -1,4 +1,5 @@
 import requests
+from app import http_client
 
 class CurrencyService:
     def __init__(self):
@@ -15,7 +16,7 @@ class CurrencyService:
             return amount
 
         try:
-            response = requests.get(f"{self.base_url}/latest?amount={amount}&from={source_currency}&to=USD")
+            response = http_client.get(f"{self.base_url}/latest?amount={amount}&from={source_currency}&to=USD")
             response.raise_for_status()
             
             data = response.json()
@@ -0,0 +1,140 @@
+import re
+from dataclasses import dataclass
+
+_ISO_DURATION = re.compile(r"P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?")
+
+
+def duration_minutes(iso_duration: str):
+    """'PT7H35M' -> 455, or None if it cannot be parsed."""
+    match = _ISO_DURATION.fullmatch(iso_duration or "")
+    if not match or not any(match.groups()):
+        return None
+    days, hours, minutes = (int(g or 0) for g in match.groups())
+    return (days * 24 + hours) * 60 + minutes
+
+
+def _compact(values: dict) -> dict:
+    return {k: v for k, v in values.items() if v is not None}
+
+
+@dataclass(slots=True, frozen=True)
+class Segment:
+    carrier_code: str
+    number: str
+    departure_iata: str
+    departure_at: str
+    arrival_iata: str
+    arrival_at: str
+    duration: str
+
+    @classmethod
+    def from_amadeus(cls, raw: dict) -> "Segment":
+        departure, arrival = raw.get("departure") or {}, raw.get("arrival") or {}
+        return cls(raw.get("carrierCode"), raw.get("number"), departure.get("iataCode"), departure.get("at"),
+                   arrival.get("iataCode"), arrival.get("at"), raw.get("duration"))
+
+    def to_dict(self) -> dict:
+        return _compact({
+            "carrierCode": self.carrier_code,
+            "number": self.number,
+            "departure": _compact({"iataCode": self.departure_iata, "at": self.departure_at}),
+            "arrival": _compact({"iataCode": self.arrival_iata, "at": self.arrival_at}),
+            "duration": self.duration,
+        })
+
+
+@dataclass(slots=True, frozen=True)
+class Itinerary:
+    duration: str
+    segments: tuple
+
+    @classmethod
+    def from_amadeus(cls, raw: dict) -> "Itinerary":
+        return cls(raw.get("duration"), tuple(Segment.from_amadeus(s) for s in raw.get("segments") or ()))
+
+    def to_dict(self) -> dict:
+        return _compact({"duration": self.duration, "segments": [s.to_dict() for s in self.segments]})
+
+
+@dataclass(slots=True)
+class FlightOffer:
+    """The part of an Amadeus flight offer the bot reads.
+
+    A raw offer repeats pricing and fare details per traveler and segment
+    (`travelerPricings`, `fareDetailsBySegment`, fees, pricing options,
+    aircraft, terminals...), none of which is shown to the user. Sessions
+    store this projection instead, via `to_dict()`, which keeps the Amadeus
+    field names so formatting, PDF and checkout code read it unchanged. The
+    raw offers are stored once per search (see save_raw_flight_offers) and
+    `raw_ref` ("<digest>:<index>") points at one of them; only the selected
+    offer's raw payload is loaded back, for booking.
+    """
+
+    id: str
+    total: str
+    currency: str
+    cabin: str
+    itineraries: tuple
+    last_ticketing_date: str = None
+    airline_name: str = None
+    traveler_name: str = None
+    raw_ref: str = None
+
+    @classmethod
+    def from_amadeus(cls, raw: dict, raw_ref: str = None) -> "FlightOffer":
+        price = raw.get("price") or {}
+        try:
+            cabin = raw["travelerPricings"][0]["fareDetailsBySegment"][0].get("cabin")
+        except (KeyError, IndexError, TypeError):
+            cabin = None
+        return cls(
+            id=raw.get("id"),
+            total=price.get("total"),
+            currency=price.get("currency"),
+            cabin=cabin,
+            itineraries=tuple(Itinerary.from_amadeus(i) for i in raw.get("itineraries") or ()),
+            last_ticketing_date=raw.get("lastTicketingDate"),
+            airline_name=raw.get("airlineName"),
+            traveler_name=raw.get("traveler_name"),
+            raw_ref=raw_ref,
+        )
+
+    def to_dict(self) -> dict:
+        return _compact({
+            "id": self.id,
+            "price": _compact({"total": self.total, "currency": self.currency}),
+            "itineraries": [i.to_dict() for i in self.itineraries],
+            "travelerPricings": [{"fareDetailsBySegment": [{"cabin": self.cabin}]}] if self.cabin else None,
+            "lastTicketingDate": self.last_ticketing_date,
+            "airlineName": self.airline_name,
+            "traveler_name": self.traveler_name,
+            "rawRef": self.raw_ref,
+        })
+
+
+def project_offers(raw_offers, raw_ref: str = None) -> list:
+    """Trimmed, session-sized dicts for a list of raw Amadeus offers. With a
+    `raw_ref`, each offer points at its position in the stored raw list."""
+    return [FlightOffer.from_amadeus(offer, f"{raw_ref}:{i}" if raw_ref else None).to_dict()
+            for i, offer in enumerate(raw_offers)]
+
+
+def bookable_offer(offer: dict) -> dict:
+    """The payload to send to Amadeus pricing/booking for a stored offer."""
+    return offer.get("raw") or offer
+
+
+def _rank_key(offer: dict):
+    try:
+        price = float(offer["price"]["total"])
+    except (KeyError, TypeError, ValueError):
+        price = float("inf")
+    durations = [duration_minutes(i.get("duration")) for i in offer.get("itineraries") or ()]
+    duration = sum(d for d in durations if d is not None) if durations and None not in durations else float("inf")
+    stops = sum(max(len(i.get("segments") or ()) - 1, 0) for i in offer.get("itineraries") or ())
+    return price, duration, stops
+
+
+def rank_offers(offers, limit: int) -> list:
+    """The `limit` best raw offers: cheapest first, then shortest, then fewest stops."""
+    return sorted(offers or [], key=_rank_key)[:limit]
@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HttpClient:
+    """Shared transport for outbound HTTP calls (Telegram, Circle, currency, RPC).
+
+    - One `requests.Session` per host, so TCP and TLS connections are kept alive
+      and reused instead of being re-established for every call.
+    - Every request gets a default (connect, read) timeout unless the caller
+      passes its own.
+    - Connection failures are retried with jittered exponential backoff. Read
+      errors and 502/503/504 responses are only retried for idempotent methods,
+      so a POST is never sent twice.
+    - Keeps per-host request, error and latency counters for /health.
+    """
+
+    def __init__(self, pool_maxsize: int, connect_timeout: float, read_timeout: float,
+                 retries: int, backoff_factor: float, backoff_jitter: float):
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self._sessions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _new_session(self) -> requests.Session:
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            status_forcelist=(502, 503, 504),
+            backoff_factor=self.backoff_factor,
+            backoff_jitter=self.backoff_jitter,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def session_for(self, url: str) -> requests.Session:
+        """Returns the pooled session for the host of `url`, creating it on first use."""
+        host = urlsplit(url).netloc
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = self._new_session()
+                    self._sessions[host] = session
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlsplit(url).netloc
+        start = time.monotonic()
+        failed = True
+        try:
+            response = self.session_for(url).request(method, url, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self._record(host, (time.monotonic() - start) * 1000, failed)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def _record(self, host: str, elapsed_ms: float, failed: bool):
+        with self._lock:
+            stats = self._stats.setdefault(host, {"requests": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["requests"] += 1
+            stats["errors"] += int(failed)
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                host: {
+                    "requests": s["requests"],
+                    "errors": s["errors"],
+                    "avg_ms": round(s["total_ms"] / s["requests"], 1),
+                    "max_ms": round(s["max_ms"], 1),
+                }
+                for host, s in self._stats.items()
+            }
+
+
+def _client_from_env() -> HttpClient:
+    return HttpClient(
+        pool_maxsize=int(os.getenv("HTTP_POOL_MAXSIZE", "32")),
+        connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05")),
+        read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "15")),
+        retries=int(os.getenv("HTTP_RETRIES", "2")),
+        backoff_factor=float(os.getenv("HTTP_BACKOFF_FACTOR", "0.3")),
+        backoff_jitter=float(os.getenv("HTTP_BACKOFF_JITTER", "0.3")),
+    )
+
+
+# The pool size matches the worker pools (8 search + 16 poller threads) plus
+# request threads, so background jobs do not queue for a connection.
+http_client = _client_from_env()
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return http_client.get(url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return http_client.post(url, **kwargs)
+
+
+def get_http_stats() -> dict:
+    return http_client.stats()
@@ -1,15 +1,28 @@
 import os
+import threading
 from flask import Flask, request, send_from_directory
 from twilio.twiml.messaging_response import MessagingResponse
 import stripe
 from twilio.rest import Client as TwilioClient
 from app.amadeus_service import AmadeusService
 from app.core_logic import process_message
-from app.new_session_manager import load_session, save_session, get_redis_client
-from app.telegram_service import send_message, send_telegram_pdf
+from app.new_session_manager import load_session, save_session, get_redis_client, get_redis_pool_stats, get_session_write_stats, reset_session_snapshots, get_user_id_from_wallet, settle_circle_intent
+from app.telegram_service import send_message, send_telegram_pdf, TelegramReplyStream
+from app.ai_service import streaming_replies_to
 from app.pdf_service import create_flight_itinerary
 from app.utils import sanitize_filename
 from app.storage_service import setup_cloudinary, upload_pdf
+from app.worker_pool import get_pool_stats
+from app.http_client import get_http_stats
+from app.reference_cache import get_reference_cache_stats
+from app.search_cache import get_search_cache_stats
+from app.reference_data import get_reference_data
+from app.conversation_context import get_ai_usage_stats
+from app.slot_extractor import get_slot_extractor_stats
+from app.amadeus_token import get_token_broker_stats
+from app.amadeus_scheduler import get_amadeus_scheduler_stats
+from app.circlelayer_watcher import circlelayer_watcher
+from app.circle_intent_poller import circle_intent_poller
 
 app = Flask(__name__)
 
@@ -17,6 +30,24 @@ app = Flask(__name__)
 amadeus_service = AmadeusService()
 setup_cloudinary()
 
+# Build the offline airport/airline index in the background (about 1s), so
+# the first message that needs it (slot extraction) doesn't wait for it.
+threading.Thread(target=get_reference_data, name="reference-data-load", daemon=True).start()
+
+# Load the most used airport/airline names in the background so the first
+# searches after a deploy don't wait on the reference-data API.
+REFERENCE_PREWARM_TOP_N = int(os.environ.get("REFERENCE_PREWARM_TOP_N", "0"))
+if REFERENCE_PREWARM_TOP_N > 0:
+    threading.Thread(target=amadeus_service.prewarm_reference_data, args=(REFERENCE_PREWARM_TOP_N,), name="reference-prewarm", daemon=True).start()
+
+# Resume watching Circle Layer payments that were outstanding before a restart
+if os.environ.get("CIRCLE_LAYER_RPC_URL") or os.environ.get("CIRCLE_LAYER_RPC_URLS"):
+    circlelayer_watcher.start()
+
+# Resume polling Circle payment intents that were pending before a restart
+if os.environ.get("CIRCLE_API_KEY"):
+    circle_intent_poller.start()
+
 # Initialize Twilio Client
 twilio_account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
 twilio_auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
@@ -30,6 +61,14 @@ def handle_successful_payment(user_id):
     state, conversation_history, flight_offers, flight_details = load_session(user_id)
     if not flight_offers:
         print(f"[{user_id}] - ERROR: No flight offer found in session after payment.")
+        missing_offer_text = "We received your payment, but I couldn't find your selected flight. Please contact support so we can issue your ticket."
+        try:
+            if user_id.startswith('telegram:'):
+                send_message(user_id.split(':')[1], missing_offer_text)
+            elif user_id.startswith('whatsapp:'):
+                twilio_client.messages.create(from_=TWILIO_WHATSAPP_NUMBER, body=missing_offer_text, to=user_id)
+        except Exception as e:
+            print(f"[{user_id}] - ERROR notifying user of missing flight offer: {e}")
         return
     selected_flight = flight_offers[0]
     traveler_names = flight_details.get("traveler_names", [])
@@ -90,6 +129,7 @@ def clear_redis(secret_key):
             client = get_redis_client()
             if client:
                 client.flushall()
+                reset_session_snapshots()
                 return "Redis database cleared successfully.", 200
             else:
                 return "Redis client not available.", 500
@@ -126,7 +166,19 @@ def health():
     return {
         'status': 'healthy',
         'redis': redis_status,
+        'redis_pool': get_redis_pool_stats(),
+        'session_writes': get_session_write_stats(),
         'environment_variables': env_status,
+        'worker_pools': get_pool_stats(),
+        'circlelayer_watcher': circlelayer_watcher.stats(),
+        'circle_intents': circle_intent_poller.stats(),
+        'http': get_http_stats(),
+        'reference_cache': get_reference_cache_stats(),
+        'search_cache': get_search_cache_stats(),
+        'amadeus_token': get_token_broker_stats(),
+        'amadeus_scheduler': get_amadeus_scheduler_stats(),
+        'ai_usage': get_ai_usage_stats(),
+        'slot_extractor': get_slot_extractor_stats(),
         'timestamp': '2025-08-23T10:45:00Z'
     }, 200
 
@@ -224,12 +276,23 @@ def circle_webhook():
             print("ERROR: Payment notification is missing 'paymentIntentId'.")
             return 'Missing paymentIntentId', 400
 
-        # Retrieve the user ID from the mapping
-        user_id = load_user_id_from_wallet(payment_intent_id)
+        # Retrieve the user ID from the mapping. This comes before settling,
+        # so a failed lookup leaves the intent for Circle's redelivery and the poller.
+        user_id = get_user_id_from_wallet(payment_intent_id)
         if not user_id:
             print(f"ERROR: Could not find user_id for paymentIntentId: {payment_intent_id}")
             return 'User not found for payment', 404
 
+        # The intent poller may have already handled this payment (or Circle
+        # may be redelivering the webhook); only the first one gets through.
+        settled = settle_circle_intent(payment_intent_id)
+        if settled is None:
+            # Unknown whether it was handled; have Circle retry.
+            return 'Could not record payment', 503
+        if not settled:
+            print(f"Payment intent {payment_intent_id} already handled. Responding with OK.")
+            return 'OK', 200
+
         # Delegate to the unified payment handler
         handle_successful_payment(user_id)
 
@@ -266,12 +329,25 @@ def telegram_webhook():
         incoming_msg = message.get('text', '')
         print(f"[Telegram] Processing message from {user_id}: '{incoming_msg[:50]}...'")
         
-        response_messages = process_message(user_id, incoming_msg, amadeus_service)
+        chat_id = user_id.split(':')[1]
+        reply_stream = None
+        if os.getenv("TELEGRAM_STREAM_REPLIES", "false").lower() == "true":
+            # The model's reply is shown while it is generated and edited as it grows.
+            reply_stream = TelegramReplyStream(chat_id, float(os.getenv("TELEGRAM_STREAM_EDIT_INTERVAL", "1.0")))
+            with streaming_replies_to(reply_stream.update):
+                response_messages = process_message(user_id, incoming_msg, amadeus_service)
+            reply_stream.close()
+        else:
+            response_messages = process_message(user_id, incoming_msg, amadeus_service)
         print(f"[Telegram] Process message returned {len(response_messages)} responses")
         
         # Send responses via Telegram
         for msg in response_messages:
-            send_message(user_id.split(':')[1], msg)
+            if reply_stream and (reply_stream.delivered(msg) or reply_stream.replace(msg)):
+                continue
+            send_message(chat_id, msg)
+        if reply_stream:
+            reply_stream.discard_withdrawn()
             
         return "OK", 200
     except Exception as e:
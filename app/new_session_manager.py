@@ -1,40 +1,131 @@
-import json
 import os
+import hashlib
+import threading
+from collections import OrderedDict, UserList
+from datetime import datetime, timedelta, timezone
 import redis
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
 import time
+from app import session_codec
 
 # --- Redis Connection ---
-# It's recommended to use a connection pool in a real application
+# One client backed by an explicit connection pool is shared by request threads
+# and background workers. `redis_client` stays None until the first successful
+# connect; failed connects are retried with exponential backoff.
 redis_client = None
+_redis_pool = None
+_connect_lock = threading.Lock()
+_connect_failures = 0
+_next_connect_attempt = 0.0
+_binary_client = (None, None)
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
+# The binary client needs its own pool (decoding is per connection); it only
+# carries sessions, raw offers and cached searches, so it gets a smaller budget.
+# A process opens at most the sum of both.
+REDIS_BINARY_MAX_CONNECTIONS = int(os.getenv("REDIS_BINARY_MAX_CONNECTIONS", "16"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "3"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_RECONNECT_BASE = float(os.getenv("REDIS_RECONNECT_BASE", "0.5"))
+REDIS_RECONNECT_MAX = float(os.getenv("REDIS_RECONNECT_MAX", "30"))
 
 def get_redis_client():
-    """Initializes and returns the Redis client."""
-    global redis_client
-    if redis_client is None and os.environ.get("REDIS_URL"):
+    """Returns the shared Redis client, connecting first if needed.
+
+    Once connected this is a plain global read with no logging. Commands that
+    hit a dropped connection are retried by the client itself with backoff.
+    """
+    client = redis_client
+    if client is not None:
+        return client
+    return _connect_redis()
+
+def _connect_redis():
+    global redis_client, _redis_pool, _connect_failures, _next_connect_attempt
+    redis_url = os.environ.get("REDIS_URL")
+    if not redis_url:
+        return None
+    with _connect_lock:
+        if redis_client is not None:
+            return redis_client
+        now = time.monotonic()
+        if now < _next_connect_attempt:
+            return None
         try:
-            redis_url = os.environ.get("REDIS_URL")
             print(f"[Redis] Attempting to connect to Redis URL: {redis_url[:20]}...")
-            redis_client = redis.from_url(redis_url, decode_responses=True)
-            redis_client.ping()
-            print(f"[Redis] Successfully connected to Redis")
-        except redis.exceptions.ConnectionError as e:
-            print(f"[Redis] Error connecting to Redis: {e}")
-            redis_client = None
+            pool = redis.ConnectionPool.from_url(
+                redis_url,
+                decode_responses=True,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                socket_keepalive=True,
+                health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+                retry_on_timeout=True,
+                retry=Retry(ExponentialBackoff(cap=REDIS_RECONNECT_MAX, base=REDIS_RECONNECT_BASE), 3),
+            )
+            client = redis.Redis(connection_pool=pool)
+            client.ping()
         except Exception as e:
-            print(f"[Redis] Unexpected error connecting to Redis: {e}")
-            redis_client = None
-    else:
-        if not os.environ.get("REDIS_URL"):
-            print(f"[Redis] REDIS_URL environment variable not set")
-        else:
-            print(f"[Redis] Redis client already initialized")
-    return redis_client
+            _connect_failures += 1
+            delay = min(REDIS_RECONNECT_MAX, REDIS_RECONNECT_BASE * 2 ** (_connect_failures - 1))
+            _next_connect_attempt = now + delay
+            print(f"[Redis] Error connecting to Redis: {e}. Retrying in {delay:.1f}s.")
+            return None
+        _redis_pool = pool
+        _connect_failures = 0
+        redis_client = client
+        print(f"[Redis] Successfully connected to Redis")
+        return client
+
+def get_binary_redis_client():
+    """Returns a client that shares the main client's server but does not decode
+    responses, for values stored as raw bytes (see app/session_codec.py)."""
+    global _binary_client
+    client = get_redis_client()
+    pool = getattr(client, "connection_pool", None)
+    if not isinstance(pool, redis.ConnectionPool):
+        return client
+    source, binary = _binary_client
+    if source is not client:
+        kwargs = dict(pool.connection_kwargs, decode_responses=False)
+        binary_pool = pool.__class__(connection_class=pool.connection_class, max_connections=REDIS_BINARY_MAX_CONNECTIONS, **kwargs)
+        binary = redis.Redis(connection_pool=binary_pool)
+        _binary_client = (client, binary)
+    return binary
+
+def _pool_usage(pool) -> dict:
+    in_use = len(getattr(pool, "_in_use_connections", ()))
+    return {
+        "max_connections": pool.max_connections,
+        "created": getattr(pool, "_created_connections", 0),
+        "in_use": in_use,
+        "idle": len(getattr(pool, "_available_connections", ())),
+        "utilization": round(in_use / pool.max_connections, 3),
+    }
+
+def get_redis_pool_stats() -> dict:
+    """Connection pool utilisation for /health, with the binary client's pool under "binary"."""
+    pool = _redis_pool
+    if pool is None:
+        return {"connected": redis_client is not None, "reconnect_failures": _connect_failures}
+    stats = {"connected": True, **_pool_usage(pool), "reconnect_failures": _connect_failures}
+    source, binary = _binary_client
+    if source is redis_client and isinstance(getattr(binary, "connection_pool", None), redis.ConnectionPool):
+        stats["binary"] = _pool_usage(binary.connection_pool)
+    return stats
 
 SESSION_EXPIRATION = 86400 # 24 hours in seconds
-WALLET_ID_PREFIX = "wallet_id:"
 WALLET_ID_EXPIRATION = 86400 # 24 hours
 
 EVM_MAPPING_PREFIX = "evm_mapping:"
+CIRCLELAYER_PAYMENT_PREFIX = "circlelayer_payment:"
+INDEXER_CURSOR_PREFIX = "indexer_cursor:"
+CIRCLE_INTENT_SCHEDULE_KEY = "circle_intents:schedule"
+CIRCLE_INTENT_CREATED_KEY = "circle_intents:created"
+CIRCLE_INTENT_SETTLED_PREFIX = "circle_intent_settled:"
 
 def save_wallet_mapping(payment_intent_id, user_id):
     """Saves a mapping from payment_intent_id to user_id."""
@@ -49,48 +140,279 @@ def save_wallet_mapping(payment_intent_id, user_id):
         print(f"Error saving wallet mapping to Redis: {e}")
 
 def load_user_id_from_wallet(wallet_id):
-    """Loads a user ID from Redis using the Circle wallet ID."""
+    """Loads a user ID from Redis using the Circle wallet ID (payment intent ID)."""
+    return get_user_id_from_wallet(wallet_id)
+
+SESSION_FIELDS = ("state", "conversation_history", "flight_offers", "flight_details")
+SESSION_DEFAULTS = {"state": "GATHERING_INFO", "conversation_history": [], "flight_offers": [], "flight_details": {}}
+SESSION_SNAPSHOT_LIMIT = int(os.getenv("SESSION_SNAPSHOT_LIMIT", "4096"))
+
+# Offers are kept out of the session hash under a content-addressed key; the
+# hash only stores the digest in `flight_offers_ref`. They are fetched when
+# the session is loaded in one of these states, and on first use otherwise.
+FLIGHT_OFFERS_PREFIX = "flight_offers:"
+FLIGHT_OFFERS_REF_FIELD = "flight_offers_ref"
+OFFER_STATES = {"FLIGHT_SELECTION", "AWAITING_PAYMENT_SELECTION", "AWAITING_PAYMENT", "AWAITING_USDC_PAYMENT", "AWAITING_CIRCLE_LAYER_PAYMENT", "BOOKING_CONFIRMED"}
+# Once a flight is selected the session holds just that offer, which must
+# outlive any payment webhook, so it is kept without an expiry.
+SELECTED_OFFER_STATES = OFFER_STATES - {"FLIGHT_SELECTION"}
+FLIGHT_OFFERS_MIN_TTL = int(os.getenv("FLIGHT_OFFERS_MIN_TTL", "3600"))
+FLIGHT_OFFERS_MAX_TTL = int(os.getenv("FLIGHT_OFFERS_MAX_TTL", "86400"))
+# Sessions hold trimmed offers (app/flight_offer.py); the full Amadeus
+# payloads of a search are kept once under this prefix for booking.
+RAW_FLIGHT_OFFERS_PREFIX = "raw_flight_offers:"
+
+# What this process last read from or wrote to Redis for each session, as
+# {user_id: {field: (fingerprint, stored_bytes)}}. Lets the tuple-style
+# load_session/save_session API skip fields that did not change.
+_session_snapshots = OrderedDict()
+_snapshot_lock = threading.Lock()
+_session_write_stats = {"saves": 0, "skipped_saves": 0, "fields_written": 0, "fields_skipped": 0, "bytes_written": 0, "bytes_saved": 0}
+
+def _fingerprint(packed: bytes) -> bytes:
+    return hashlib.blake2b(packed, digest_size=16).digest()
+
+def _remember_snapshot(user_id, snapshot):
+    with _snapshot_lock:
+        _session_snapshots[user_id] = snapshot
+        _session_snapshots.move_to_end(user_id)
+        while len(_session_snapshots) > SESSION_SNAPSHOT_LIMIT:
+            _session_snapshots.popitem(last=False)
+
+def reset_session_snapshots():
+    """Forget what is stored in Redis (e.g. after the database was cleared)."""
+    with _snapshot_lock:
+        _session_snapshots.clear()
+
+def get_session_write_stats() -> dict:
+    stats = dict(_session_write_stats)
+    stats["avg_bytes_saved_per_save"] = round(stats["bytes_saved"] / stats["saves"]) if stats["saves"] else 0
+    return stats
+
+def flight_offers_ttl(offers, now=None) -> int:
+    """Seconds to keep an offer list: until the earliest `lastTicketingDate`
+    has passed, clamped to [FLIGHT_OFFERS_MIN_TTL, FLIGHT_OFFERS_MAX_TTL]."""
+    now = time.time() if now is None else now
+    deadlines = []
+    for offer in offers:
+        last_date = offer.get("lastTicketingDate") if isinstance(offer, dict) else None
+        if not last_date:
+            continue
+        try:
+            end_of_day = datetime.strptime(last_date[:10], "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+        except ValueError:
+            continue
+        deadlines.append(end_of_day.timestamp())
+    if not deadlines:
+        return FLIGHT_OFFERS_MAX_TTL
+    return int(max(FLIGHT_OFFERS_MIN_TTL, min(FLIGHT_OFFERS_MAX_TTL, min(deadlines) - now)))
+
+def _load_flight_offers(client, ref: str):
+    """Returns (offers, stored_bytes) for an offers reference."""
+    if not ref:
+        return [], 0
+    raw = client.get(f"{FLIGHT_OFFERS_PREFIX}{ref}")
+    if raw is None:
+        print(f"[Session] WARNING: Flight offers {ref} have expired.")
+        return [], 0
+    return session_codec.decode(raw), len(raw)
+
+def save_raw_flight_offers(offers) -> str:
+    """Stores the raw Amadeus offers of a search for as long as the trimmed
+    offers are kept. Returns their reference, or None without Redis."""
+    client = get_binary_redis_client()
+    if not client or not offers:
+        return None
+    packed = session_codec.pack(offers)
+    ref = _fingerprint(packed).hex()
     try:
-        return redis_client.get(f"{WALLET_ID_PREFIX}{wallet_id}")
-    except Exception as e:
-        print(f"Error loading user ID from wallet mapping in Redis: {e}")
+        client.set(f"{RAW_FLIGHT_OFFERS_PREFIX}{ref}", session_codec.wrap(packed), ex=flight_offers_ttl(offers))
+    except redis.exceptions.RedisError as e:
+        print(f"Error saving raw flight offers to Redis: {e}")
         return None
+    return ref
 
-def save_session(user_id, state, conversation_history, flight_offers, flight_details):
-    """Saves the user's session to Redis."""
-    client = get_redis_client()
-    if not client:
-        print("Error: Redis client not available for saving session.")
-        return
+def load_raw_flight_offer(raw_ref: str):
+    """Returns the raw Amadeus offer for a trimmed offer's `rawRef`
+    ("<digest>:<index>"), or None if it is unknown or has expired."""
+    client = get_binary_redis_client()
+    ref, _, index = (raw_ref or "").partition(":")
+    if not client or not ref or not index.isdigit():
+        return None
     try:
-        session_data = {
-            "state": json.dumps(state),
-            "conversation_history": json.dumps(conversation_history),
-            "flight_offers": json.dumps(flight_offers),
-            "flight_details": json.dumps(flight_details)
-        }
-        client.hset(f"session:{user_id}", mapping=session_data)
+        raw = client.get(f"{RAW_FLIGHT_OFFERS_PREFIX}{ref}")
     except redis.exceptions.RedisError as e:
-        print(f"Error saving session to Redis: {e}")
+        print(f"Error loading raw flight offers from Redis: {e}")
+        return None
+    if raw is None:
+        print(f"[Session] WARNING: Raw flight offers {ref} have expired.")
+        return None
+    offers = session_codec.decode(raw)
+    return offers[int(index)] if int(index) < len(offers) else None
+
+def with_raw_offer(offer: dict) -> dict:
+    """The selected offer with its raw Amadeus payload under "raw", which
+    booking needs. Offers without a stored payload are returned as they are."""
+    if not isinstance(offer, dict) or "raw" in offer or not offer.get("rawRef"):
+        return offer
+    raw = load_raw_flight_offer(offer["rawRef"])
+    return dict(offer, raw=raw) if raw is not None else offer
+
+class DeferredOffers(UserList):
+    """Flight offers that are only fetched from Redis when first used."""
+
+    def __init__(self, client, ref: str):
+        self._client = client
+        self._ref = ref
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            try:
+                self._data, _ = _load_flight_offers(self._client, self._ref)
+            except redis.exceptions.RedisError as e:
+                print(f"Error loading flight offers from Redis: {e}")
+                self._data = []
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+class Session:
+    """A user's session plus a snapshot of what is stored in Redis.
+
+    `save()` packs each field, compares it with the snapshot and issues one
+    HSET containing only the fields that changed, or no write at all. Only
+    changed fields pay for compression. Reassigning an attribute and
+    mutating a list/dict in place are both detected. Flight offers are
+    stored under their own key (see FLIGHT_OFFERS_PREFIX).
+    """
+
+    def __init__(self, user_id, state="GATHERING_INFO", conversation_history=None, flight_offers=None, flight_details=None, snapshot=None):
+        self.user_id = user_id
+        self.state = state
+        self.conversation_history = conversation_history if conversation_history is not None else []
+        self.flight_offers = flight_offers if flight_offers is not None else []
+        self.flight_details = flight_details if flight_details is not None else {}
+        self._snapshot = snapshot or {}
+
+    @classmethod
+    def load(cls, user_id):
+        client = get_binary_redis_client()
+        if not client:
+            # Return a default session if Redis is not available
+            return cls(user_id)
+        try:
+            session_data = client.hgetall(f"session:{user_id}")
+            values, snapshot = {}, {}
+            offers_ref = None
+            for key, raw in session_data.items():
+                field = key.decode() if isinstance(key, bytes) else key
+                if field == FLIGHT_OFFERS_REF_FIELD:
+                    offers_ref = raw.decode() if isinstance(raw, bytes) else raw
+                elif field in SESSION_FIELDS:
+                    payload = session_codec.unwrap(raw)
+                    values[field] = session_codec.decode_payload(raw, payload)
+                    # Offers still stored inline (older sessions) are moved out on the next save.
+                    if field != "flight_offers":
+                        snapshot[field] = (_fingerprint(payload), len(raw))
+            if offers_ref is not None:
+                offers_size = 0
+                if values.get("state", "GATHERING_INFO") in OFFER_STATES:
+                    values["flight_offers"], offers_size = _load_flight_offers(client, offers_ref)
+                else:
+                    values["flight_offers"] = DeferredOffers(client, offers_ref)
+                snapshot["flight_offers"] = (bytes.fromhex(offers_ref), offers_size)
+        except redis.exceptions.RedisError as e:
+            print(f"Error loading session from Redis: {e}")
+            return cls(user_id)
+        _remember_snapshot(user_id, snapshot)
+        return cls(user_id, snapshot=snapshot, **values)
+
+    def as_tuple(self):
+        return self.state, self.conversation_history, self.flight_offers, self.flight_details
+
+    def dirty_fields(self) -> dict:
+        """Packed values of the fields that differ from what is stored."""
+        dirty = {}
+        for field in SESSION_FIELDS:
+            value = getattr(self, field)
+            if isinstance(value, DeferredOffers):
+                if not value.loaded:
+                    continue
+                value = value.data
+            packed = session_codec.pack(value)
+            stored = self._snapshot.get(field)
+            if stored is None or stored[0] != _fingerprint(packed):
+                dirty[field] = packed
+        return dirty
+
+    def save(self) -> int:
+        """Writes the changed fields. Returns the number of bytes written."""
+        client = get_binary_redis_client()
+        if not client:
+            print("Error: Redis client not available for saving session.")
+            return 0
+        dirty = self.dirty_fields()
+        mapping = {field: session_codec.wrap(packed) for field, packed in dirty.items() if field != "flight_offers"}
+        written = sum(len(v) for v in mapping.values())
+        sizes = {field: len(v) for field, v in mapping.items()}
+        try:
+            if "flight_offers" in dirty:
+                packed = dirty["flight_offers"]
+                ref = ""
+                offers = self.flight_offers.data if isinstance(self.flight_offers, DeferredOffers) else self.flight_offers
+                if offers:
+                    ref = _fingerprint(packed).hex()
+                    blob = session_codec.wrap(packed)
+                    ttl = None if self.state in SELECTED_OFFER_STATES else flight_offers_ttl(offers)
+                    client.set(f"{FLIGHT_OFFERS_PREFIX}{ref}", blob, ex=ttl)
+                    written += len(blob)
+                    sizes["flight_offers"] = len(blob)
+                mapping[FLIGHT_OFFERS_REF_FIELD] = ref
+                client.hdel(f"session:{self.user_id}", "flight_offers")
+            elif "state" in dirty and self.state in SELECTED_OFFER_STATES and self._snapshot.get("flight_offers"):
+                # The selected offer was stored earlier, possibly with an expiry.
+                client.persist(f"{FLIGHT_OFFERS_PREFIX}{self._snapshot['flight_offers'][0].hex()}")
+            if mapping:
+                client.hset(f"session:{self.user_id}", mapping=mapping)
+        except redis.exceptions.RedisError as e:
+            print(f"Error saving session to Redis: {e}")
+            return 0
+
+        saved = sum(size for field, (_, size) in self._snapshot.items() if field not in dirty)
+        snapshot = dict(self._snapshot)
+        for field, packed in dirty.items():
+            snapshot[field] = (_fingerprint(packed), sizes.get(field, 0))
+        self._snapshot = snapshot
+        _remember_snapshot(self.user_id, snapshot)
+
+        with _snapshot_lock:
+            stats = _session_write_stats
+            stats["saves"] += 1
+            stats["skipped_saves"] += int(not mapping)
+            stats["fields_written"] += len(dirty)
+            stats["fields_skipped"] += len(SESSION_FIELDS) - len(dirty)
+            stats["bytes_written"] += written
+            stats["bytes_saved"] += saved
+        return written
+
+def save_session(user_id, state, conversation_history, flight_offers, flight_details):
+    """Saves the user's session to Redis, writing only the fields that changed
+    since this process last loaded or saved it."""
+    with _snapshot_lock:
+        snapshot = _session_snapshots.get(user_id)
+    Session(user_id, state, conversation_history, flight_offers, flight_details, snapshot=snapshot).save()
 
 def load_session(user_id):
     """Loads the user's session from Redis."""
-    client = get_redis_client()
-    if not client:
-        # Return a default session if Redis is not available
-        return "GATHERING_INFO", [], [], {}
-    try:
-        session_data = client.hgetall(f"session:{user_id}")
-        if not session_data:
-            return "GATHERING_INFO", [], [], {}
-        state = json.loads(session_data.get("state", '"GATHERING_INFO"'))
-        history = json.loads(session_data.get("conversation_history", "[]"))
-        offers = json.loads(session_data.get("flight_offers", "[]"))
-        details = json.loads(session_data.get("flight_details", "{}"))
-        return state, history, offers, details
-    except redis.exceptions.RedisError as e:
-        print(f"Error loading session from Redis: {e}")
-        return "GATHERING_INFO", [], [], {}
+    return Session.load(user_id).as_tuple()
 
 def get_user_id_from_wallet(payment_intent_id):
     """Retrieves a user_id from a payment_intent_id mapping."""
@@ -104,6 +426,99 @@ def get_user_id_from_wallet(payment_intent_id):
         print(f"Error retrieving wallet mapping from Redis: {e}")
         return None
 
+# --- Circle payment intent scheduling ---
+
+def schedule_circle_intent(intent_id: str, next_check: float, created_at: float = None):
+    """Add or move a pending payment intent in the polling schedule.
+
+    Args:
+        intent_id: Circle payment intent ID
+        next_check: Unix time at which the intent should next be polled
+        created_at: Unix time the intent was created; only recorded the first time
+    """
+    client = get_redis_client()
+    if not client:
+        print("Error: Redis client not available for payment intent scheduling.")
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.zadd(CIRCLE_INTENT_SCHEDULE_KEY, {intent_id: next_check})
+        if created_at is not None:
+            pipe.hsetnx(CIRCLE_INTENT_CREATED_KEY, intent_id, str(created_at))
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        print(f"Error scheduling payment intent in Redis: {e}")
+
+def get_due_circle_intents(now: float, limit: int = 100) -> dict:
+    """Get intents whose next check time has passed.
+
+    Returns:
+        Dictionary mapping intent_id to its creation time (Unix seconds)
+    """
+    client = get_redis_client()
+    if not client:
+        return {}
+    try:
+        intent_ids = client.zrangebyscore(CIRCLE_INTENT_SCHEDULE_KEY, "-inf", now, start=0, num=limit)
+        if not intent_ids:
+            return {}
+        created = client.hmget(CIRCLE_INTENT_CREATED_KEY, intent_ids)
+        return {intent_id: float(ts) if ts else now for intent_id, ts in zip(intent_ids, created)}
+    except redis.exceptions.RedisError as e:
+        print(f"Error loading due payment intents from Redis: {e}")
+        return {}
+
+def settle_circle_intent(intent_id: str):
+    """Mark a payment intent as settled and stop polling it.
+
+    Both the webhook and the poller call this; only the first caller gets True,
+    so a payment is handled exactly once whichever path sees it first. Returns
+    None if Redis failed, so callers can retry instead of treating the intent
+    as already handled.
+    """
+    client = get_redis_client()
+    if not client:
+        print("Error: Redis client not available for settling payment intent.")
+        # Without Redis there is no poller to race with.
+        return True
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.set(f"{CIRCLE_INTENT_SETTLED_PREFIX}{intent_id}", "1", nx=True, ex=WALLET_ID_EXPIRATION)
+        pipe.zrem(CIRCLE_INTENT_SCHEDULE_KEY, intent_id)
+        pipe.hdel(CIRCLE_INTENT_CREATED_KEY, intent_id)
+        first, _, _ = pipe.execute()
+        return bool(first)
+    except redis.exceptions.RedisError as e:
+        print(f"Error settling payment intent in Redis: {e}")
+        return None
+
+def drop_circle_intent(intent_id: str):
+    """Stop polling an intent without settling it (e.g. it expired)."""
+    client = get_redis_client()
+    if not client:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.zrem(CIRCLE_INTENT_SCHEDULE_KEY, intent_id)
+        pipe.hdel(CIRCLE_INTENT_CREATED_KEY, intent_id)
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        print(f"Error dropping payment intent from Redis: {e}")
+
+def count_circle_intents(now: float, overdue_after: float) -> dict:
+    """Count pending intents and those more than `overdue_after` seconds past their check time."""
+    client = get_redis_client()
+    if not client:
+        return {"pending": 0, "overdue": 0}
+    try:
+        return {
+            "pending": client.zcard(CIRCLE_INTENT_SCHEDULE_KEY),
+            "overdue": client.zcount(CIRCLE_INTENT_SCHEDULE_KEY, "-inf", now - overdue_after),
+        }
+    except redis.exceptions.RedisError as e:
+        print(f"Error counting payment intents in Redis: {e}")
+        return {"pending": 0, "overdue": 0}
+
 # --- Circle Layer EVM helpers ---
 
 def save_evm_mapping(address: str, user_id: str, ttl_seconds: int = 86400):
@@ -129,15 +544,16 @@ def get_user_id_from_evm_address(address: str) -> str:
 
 # --- Circle Layer Payment Tracking ---
 
-def save_circlelayer_payment_info(user_id: str, address: str, initial_balance: int, expected_amount: int, address_index: int, ttl_seconds: int = 3600):
+def save_circlelayer_payment_info(user_id: str, address: str, initial_balance: int, expected_amount: int, address_index: int, token_address: str = None, ttl_seconds: int = 3600):
     """Save Circle Layer payment tracking information to prevent false confirmations.
     
     Args:
         user_id: User identifier
         address: Deposit address
         initial_balance: Balance before payment request (in wei)
-        expected_amount: Expected payment amount (in wei)
+        expected_amount: Expected payment amount (in smallest units)
         address_index: Address derivation index
+        token_address: ERC-20 contract address, or None for the native token
         ttl_seconds: Time to live for the tracking data
     """
     client = get_redis_client()
@@ -145,7 +561,7 @@ def save_circlelayer_payment_info(user_id: str, address: str, initial_balance: i
         print("Error: Redis client not available for Circle Layer payment tracking.")
         return
     try:
-        payment_key = f"circlelayer_payment:{user_id}"
+        payment_key = f"{CIRCLELAYER_PAYMENT_PREFIX}{user_id}"
         payment_data = {
             "address": address.lower(),
             "initial_balance": str(initial_balance),
@@ -153,6 +569,9 @@ def save_circlelayer_payment_info(user_id: str, address: str, initial_balance: i
             "address_index": str(address_index),
             "created_at": str(int(time.time()))
         }
+        if token_address:
+            payment_data["token_address"] = token_address.lower()
+            payment_data["received"] = "0"
         client.hset(payment_key, mapping=payment_data)
         client.expire(payment_key, ttl_seconds)
         print(f"[CircleLayer] Saved payment tracking for {user_id} at {address} (index {address_index})")
@@ -170,22 +589,140 @@ def get_circlelayer_payment_info(user_id: str) -> dict:
         print("Error: Redis client not available for Circle Layer payment lookup.")
         return None
     try:
-        payment_key = f"circlelayer_payment:{user_id}"
+        payment_key = f"{CIRCLELAYER_PAYMENT_PREFIX}{user_id}"
         payment_data = client.hgetall(payment_key)
         if not payment_data:
             return None
         
-        return {
-            "address": payment_data.get("address"),
-            "initial_balance": int(payment_data.get("initial_balance", "0")),
-            "expected_amount": int(payment_data.get("expected_amount", "0")),
-            "address_index": int(payment_data.get("address_index", "0")),
-            "created_at": int(payment_data.get("created_at", "0"))
-        }
+        return _parse_circlelayer_payment_info(payment_data)
     except redis.exceptions.RedisError as e:
         print(f"Error retrieving Circle Layer payment tracking from Redis: {e}")
         return None
 
+def _parse_circlelayer_payment_info(payment_data: dict) -> dict:
+    return {
+        "address": payment_data.get("address"),
+        "initial_balance": int(payment_data.get("initial_balance", "0")),
+        "expected_amount": int(payment_data.get("expected_amount", "0")),
+        "address_index": int(payment_data.get("address_index", "0")),
+        "created_at": int(payment_data.get("created_at", "0")),
+        "token_address": payment_data.get("token_address"),
+        "received": int(payment_data.get("received", "0"))
+    }
+
+def list_circlelayer_payments() -> dict:
+    """Get every outstanding Circle Layer payment.
+
+    Returns:
+        Dictionary mapping user_id to payment tracking data (same shape as
+        get_circlelayer_payment_info). Empty if Redis is unavailable.
+    """
+    client = get_redis_client()
+    if not client:
+        print("Error: Redis client not available for Circle Layer payment listing.")
+        return {}
+    try:
+        keys = list(client.scan_iter(match=f"{CIRCLELAYER_PAYMENT_PREFIX}*", count=500))
+        if not keys:
+            return {}
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        payments = {}
+        for key, payment_data in zip(keys, pipe.execute()):
+            # The hash may have expired between SCAN and HGETALL.
+            if payment_data and payment_data.get("address"):
+                payments[key[len(CIRCLELAYER_PAYMENT_PREFIX):]] = _parse_circlelayer_payment_info(payment_data)
+        return payments
+    except redis.exceptions.RedisError as e:
+        print(f"Error listing Circle Layer payments from Redis: {e}")
+        return {}
+
+def claim_circlelayer_payment(user_id: str) -> bool:
+    """Atomically remove a payment's tracking data.
+
+    Only one caller can win the claim, so a payment that several watchers see
+    clear at the same time is only handled once.
+    """
+    client = get_redis_client()
+    if not client:
+        print("Error: Redis client not available for Circle Layer payment claim.")
+        return False
+    try:
+        return client.delete(f"{CIRCLELAYER_PAYMENT_PREFIX}{user_id}") == 1
+    except redis.exceptions.RedisError as e:
+        print(f"Error claiming Circle Layer payment in Redis: {e}")
+        return False
+
+def credit_circlelayer_transfer(user_id: str, transfer_id: str, value: int):
+    """Credit an ERC-20 transfer to a pending payment exactly once.
+
+    Args:
+        user_id: User identifier
+        transfer_id: Unique id of the Transfer log (tx hash and log index)
+        value: Transferred amount in smallest units
+
+    Returns:
+        The new total received, or None if the transfer was already credited
+        or the payment is no longer outstanding
+    """
+    client = get_redis_client()
+    if not client:
+        print("Error: Redis client not available for Circle Layer transfer credit.")
+        return None
+    try:
+        payment_key = f"{CIRCLELAYER_PAYMENT_PREFIX}{user_id}"
+        transfer_field = f"transfer:{transfer_id}"
+
+        def credit(pipe):
+            # Don't resurrect a hash that was already claimed or expired. Under
+            # WATCH, a claim between this check and the write aborts and retries.
+            if not pipe.exists(payment_key) or pipe.hexists(payment_key, transfer_field):
+                return
+            pipe.multi()
+            pipe.hset(payment_key, transfer_field, str(value))
+            pipe.hincrby(payment_key, "received", int(value))
+
+        results = client.transaction(credit, payment_key)
+        return int(results[-1]) if results else None
+    except redis.exceptions.RedisError as e:
+        print(f"Error crediting Circle Layer transfer in Redis: {e}")
+        return None
+
+def get_indexer_cursor(name: str):
+    """Get the last block an on-chain indexer has fully processed, or None."""
+    client = get_redis_client()
+    if not client:
+        return None
+    try:
+        value = client.get(f"{INDEXER_CURSOR_PREFIX}{name}")
+        return int(value) if value is not None else None
+    except redis.exceptions.RedisError as e:
+        print(f"Error reading indexer cursor {name} from Redis: {e}")
+        return None
+
+def save_indexer_cursor(name: str, block_number: int):
+    """Persist an indexer's cursor (no expiration) so restarts resume from it."""
+    client = get_redis_client()
+    if not client:
+        return
+    try:
+        client.set(f"{INDEXER_CURSOR_PREFIX}{name}", str(block_number))
+    except redis.exceptions.RedisError as e:
+        print(f"Error saving indexer cursor {name} to Redis: {e}")
+
+def try_acquire_lock(name: str, ttl_seconds: int) -> bool:
+    """Try to take a short-lived cluster-wide lock. The lock is never released
+    explicitly; it simply expires after `ttl_seconds`."""
+    client = get_redis_client()
+    if not client:
+        return False
+    try:
+        return bool(client.set(f"lock:{name}", "1", nx=True, ex=max(1, int(ttl_seconds))))
+    except redis.exceptions.RedisError as e:
+        print(f"Error acquiring lock {name} in Redis: {e}")
+        return False
+
 def clear_circlelayer_payment_info(user_id: str):
     """Clear Circle Layer payment tracking information after successful payment."""
     client = get_redis_client()
@@ -193,7 +730,7 @@ def clear_circlelayer_payment_info(user_id: str):
         print("Error: Redis client not available for Circle Layer payment cleanup.")
         return
     try:
-        payment_key = f"circlelayer_payment:{user_id}"
+        payment_key = f"{CIRCLELAYER_PAYMENT_PREFIX}{user_id}"
         client.delete(payment_key)
         print(f"[CircleLayer] Cleared payment tracking for {user_id}")
     except redis.exceptions.RedisError as e:
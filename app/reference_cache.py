@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict, Counter
+
+import redis
+
+from app.new_session_manager import get_redis_client
+
+_MISSING = object()
+
+
+class ReferenceCache:
+    """Two-tier cache for slow-changing reference data (airport and airline names).
+
+    - Tier 1 is an in-process LRU bounded to `max_size` entries.
+    - Tier 2 is Redis, shared by every worker and surviving restarts.
+    - Found values live for `ttl` seconds. Keys the API says do not exist are
+      cached as None for the much shorter `negative_ttl`, so a bad code is not
+      looked up again on every search but is retried later.
+    - A loader that raises (rate limits, server errors) caches nothing, so
+      one throttled lookup does not hide a valid key from every worker.
+    - Lookups are counted in a Redis sorted set so the most used codes can be
+      prewarmed at startup.
+    """
+
+    POPULARITY_FLUSH_EVERY = 100
+
+    def __init__(self, name: str, max_size: int, ttl: int, negative_ttl: int):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending_popularity = Counter()
+        self._pending_count = 0
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "loads": 0, "load_errors": 0, "evictions": 0}
+
+    def _redis_key(self, key: str) -> str:
+        return f"refdata:{self.name}:{key}"
+
+    @property
+    def _popularity_key(self) -> str:
+        return f"refdata:{self.name}:popularity"
+
+    def _get_local(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key: str, value, ttl: int):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get(self, key: str):
+        """Returns the cached value (None for a cached miss) or `_MISSING`."""
+        value = self._get_local(key)
+        if value is not _MISSING:
+            self._count("local_hits")
+            return value
+        client = get_redis_client()
+        if client:
+            try:
+                pipe = client.pipeline(transaction=False)
+                pipe.get(self._redis_key(key))
+                pipe.ttl(self._redis_key(key))
+                raw, ttl = pipe.execute()
+                if raw is not None:
+                    value = json.loads(raw)
+                    self._set_local(key, value, ttl if ttl and ttl > 0 else self.negative_ttl)
+                    self._count("redis_hits")
+                    return value
+            except (redis.exceptions.RedisError, ValueError) as e:
+                print(f"[ReferenceCache:{self.name}] WARNING: Redis read failed: {e}")
+        self._count("misses")
+        return _MISSING
+
+    def set(self, key: str, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._set_local(key, value, ttl)
+        client = get_redis_client()
+        if client:
+            try:
+                client.set(self._redis_key(key), json.dumps(value), ex=ttl)
+            except redis.exceptions.RedisError as e:
+                print(f"[ReferenceCache:{self.name}] WARNING: Redis write failed: {e}")
+
+    def get_or_load(self, key: str, loader):
+        """Returns the value for `key`, calling `loader(key)` on a miss.
+
+        The loader returns the value, or None when the key does not exist;
+        either way the result is cached. It raises when the lookup failed for
+        another reason, and then None is returned without caching anything.
+        """
+        self._record_use(key)
+        value = self.get(key)
+        if value is not _MISSING:
+            return value
+        self._count("loads")
+        value = self._load(key, loader)
+        return None if value is _MISSING else value
+
+    def _load(self, key: str, loader):
+        """Calls the loader and caches its result, or returns `_MISSING` if it raised."""
+        try:
+            value = loader(key)
+        except Exception as e:
+            self._count("load_errors")
+            print(f"[ReferenceCache:{self.name}] WARNING: Lookup of {key} failed, not caching: {type(e).__name__}: {e}")
+            return _MISSING
+        self.set(key, value)
+        return value
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _record_use(self, key: str):
+        with self._lock:
+            self._pending_popularity[key] += 1
+            self._pending_count += 1
+            if self._pending_count < self.POPULARITY_FLUSH_EVERY:
+                return
+            pending, self._pending_popularity, self._pending_count = self._pending_popularity, Counter(), 0
+        self._flush_popularity(pending)
+
+    def _flush_popularity(self, pending: Counter):
+        client = get_redis_client()
+        if not client or not pending:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key, count in pending.items():
+                pipe.zincrby(self._popularity_key, count, key)
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            print(f"[ReferenceCache:{self.name}] WARNING: Could not record popularity: {e}")
+
+    def most_popular(self, top_n: int) -> list:
+        client = get_redis_client()
+        if not client or top_n <= 0:
+            return []
+        try:
+            return client.zrevrange(self._popularity_key, 0, top_n - 1)
+        except redis.exceptions.RedisError as e:
+            print(f"[ReferenceCache:{self.name}] WARNING: Could not read popularity: {e}")
+            return []
+
+    def prewarm(self, top_n: int, loader) -> int:
+        """Loads the `top_n` most used keys into the local tier. Returns how many were loaded."""
+        keys = self.most_popular(top_n)
+        for key in keys:
+            if self.get(key) is _MISSING:
+                self._load(key, loader)
+        return len(keys)
+
+    def clear(self):
+        """Drops the local tier (the Redis tier expires on its own)."""
+        with self._lock:
+            self._entries.clear()
+            self._pending_popularity.clear()
+            self._pending_count = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["local_hits"] + self._stats["redis_hits"] + self._stats["misses"]
+            hits = self._stats["local_hits"] + self._stats["redis_hits"]
+            return dict(
+                self._stats,
+                size=len(self._entries),
+                max_size=self.max_size,
+                hit_rate=round(hits / lookups, 3) if lookups else None,
+            )
+
+
+def _cache_from_env(name: str) -> ReferenceCache:
+    return ReferenceCache(
+        name,
+        max_size=int(os.getenv("REFERENCE_CACHE_SIZE", "2048")),
+        ttl=int(os.getenv("REFERENCE_CACHE_TTL", str(7 * 86400))),
+        negative_ttl=int(os.getenv("REFERENCE_NEGATIVE_TTL", "600")),
+    )
+
+
+# Shared by every AmadeusService instance in the process.
+airport_names = _cache_from_env("airport_name")
+airline_names = _cache_from_env("airline_name")
+
+
+def get_reference_cache_stats() -> dict:
+    return {cache.name: cache.stats() for cache in (airport_names, airline_names)}
+
+
+def clear_reference_caches():
+    for cache in (airport_names, airline_names):
+        cache.clear()
@@ -0,0 +1,151 @@
+import os
+import csv
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+import airportsdata
+
+from app.city_resolver import CityResolver, Place, normalize
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+AIRLINES_CSV = os.path.join(DATA_DIR, "airlines.csv")
+MAJOR_AIRPORTS_CSV = os.path.join(DATA_DIR, "major_airports.csv")
+
+Airport = namedtuple("Airport", "iata name city country lat lon tz")
+
+# Words dropped from airport names so "Heathrow" finds "London Heathrow Airport".
+_AIRPORT_NAME_NOISE = {"airport", "international", "intl", "regional", "municipal"}
+
+
+class ReferenceData:
+    """Offline index of airports, metropolitan city codes and airlines.
+
+    Airports come from the `airportsdata` package (IATA-coded airports only);
+    airlines from the curated app/data/airlines.csv, and the hub airports
+    (with the city names travellers use for them, e.g. Montreal for YUL,
+    whose dataset city is Dorval) from app/data/major_airports.csv. Records are held in
+    parallel arrays sorted by IATA code rather than one dict per airport, so
+    the ~8k airports cost a few hundred KB and a code lookup is a bisect.
+    Place names are searched through a CityResolver (app/city_resolver.py).
+    """
+
+    def __init__(self, airports: dict, metro_codes: dict, airlines: dict, major_airports: dict = None):
+        codes = sorted(airports)
+        self._codes = codes
+        self._names = [airports[c]["name"] for c in codes]
+        self._cities = [sys.intern(airports[c]["city"]) for c in codes]
+        self._countries = [sys.intern(airports[c]["country"]) for c in codes]
+        self._lats = array("d", (float(airports[c]["lat"]) for c in codes))
+        self._lons = array("d", (float(airports[c]["lon"]) for c in codes))
+        self._tz_names = sorted({airports[c]["tz"] for c in codes})
+        tz_ids = {tz: i for i, tz in enumerate(self._tz_names)}
+        self._tz_ids = array("H", (tz_ids[airports[c]["tz"]] for c in codes))
+        self._airlines = airlines
+        self.resolver = self._build_resolver(metro_codes, major_airports or {})
+
+    def _build_resolver(self, metro_codes: dict, major_airports: dict) -> CityResolver:
+        places = [Place(metro["name"], code, metro["country"], "metro")
+                  for code, metro in metro_codes.items()]
+        for i, code in enumerate(self._codes):
+            international = "international" in self._names[i].lower()
+            major = code in major_airports
+            for city in {self._cities[i], *major_airports.get(code, ())} - {""}:
+                places.append(Place(city, code, self._countries[i], "city", international, major))
+            full = normalize(self._names[i])
+            short = " ".join(w for w in full.split() if w not in _AIRPORT_NAME_NOISE)
+            city = normalize(self._cities[i])
+            # "London Heathrow Airport" is also found as "heathrow".
+            bare = short[len(city):].strip() if city and short.startswith(city + " ") else ""
+            for name in {full, short, bare} - {""}:
+                places.append(Place(name, code, self._countries[i], "airport", international, major))
+        return CityResolver(places)
+
+    def _index(self, iata_code: str):
+        code = (iata_code or "").strip().upper()
+        i = bisect_left(self._codes, code)
+        if i < len(self._codes) and self._codes[i] == code:
+            return i
+        return None
+
+    def airport(self, iata_code: str):
+        """Returns the Airport record for an IATA code, or None."""
+        i = self._index(iata_code)
+        if i is None:
+            return None
+        return Airport(self._codes[i], self._names[i], self._cities[i], self._countries[i],
+                       self._lats[i], self._lons[i], self._tz_names[self._tz_ids[i]])
+
+    def airport_name(self, iata_code: str):
+        i = self._index(iata_code)
+        return self._names[i] if i is not None else None
+
+    def airport_timezone(self, iata_code: str):
+        i = self._index(iata_code)
+        return self._tz_names[self._tz_ids[i]] if i is not None else None
+
+    def airline_name(self, airline_code: str):
+        return self._airlines.get((airline_code or "").strip().upper())
+
+    def resolve_city(self, query: str):
+        """Returns the IATA code to search flights from/to for a city or airport
+        name, or None when it is unknown or ambiguous (see CityResolver)."""
+        return self.resolver.resolve(query)
+
+    def stats(self) -> dict:
+        return {
+            "airports": len(self._codes),
+            "place_names": len(self.resolver),
+            "airlines": len(self._airlines),
+            "timezones": len(self._tz_names),
+        }
+
+
+def _load_airlines(path: str) -> dict:
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["iata"]: row["name"] for row in csv.DictReader(f)}
+
+
+def _load_major_airports(path: str) -> dict:
+    """IATA code -> city names travellers use for that hub."""
+    major = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            major.setdefault(row["iata"], []).append(row["city"])
+    return major
+
+
+def load_reference_data() -> ReferenceData:
+    return ReferenceData(
+        airports=airportsdata.load("IATA"),
+        metro_codes=airportsdata.load_iata_macs(),
+        airlines=_load_airlines(AIRLINES_CSV),
+        major_airports=_load_major_airports(MAJOR_AIRPORTS_CSV),
+    )
+
+
+_reference_data = None
+_load_lock = threading.Lock()
+
+
+def local_reference_data_enabled() -> bool:
+    """LOCAL_REFERENCE_DATA=false sends every lookup to Amadeus, as before."""
+    return os.getenv("LOCAL_REFERENCE_DATA", "true").lower() != "false"
+
+
+def get_reference_data():
+    """Returns the process-wide index, loading it on first use (about 1s,
+    mostly building the place-name index). app/main.py loads it in the
+    background at startup so no request pays for it. Returns None when the
+    local index is disabled."""
+    global _reference_data
+    if not local_reference_data_enabled():
+        return None
+    if _reference_data is None:
+        with _load_lock:
+            if _reference_data is None:
+                _reference_data = load_reference_data()
+                print(f"[ReferenceData] Loaded {_reference_data.stats()}")
+    return _reference_data
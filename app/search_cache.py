@@ -0,0 +1,171 @@
+import os
+import copy
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import Future
+
+import redis
+
+from app import session_codec
+from app.new_session_manager import get_binary_redis_client, try_acquire_lock
+from app.worker_pool import search_pool
+
+
+class SearchCache:
+    """Shared cache of Amadeus flight-offer searches.
+
+    - Results are stored in Redis under a hash of the normalized search
+      parameters, so every worker and every user shares them.
+    - A result is fresh for `ttl` seconds. For `stale_ttl` seconds after that
+      it is still returned immediately while one background job refreshes it.
+    - Concurrent identical searches share one upstream call: in-process they
+      wait on the same future, across processes they wait for the worker
+      holding the Redis lock to fill the cache.
+    - Empty results are never cached, since Amadeus also returns no offers
+      when a search fails.
+    """
+
+    KEY_PREFIX = "flight_search:"
+
+    def __init__(self, ttl: int, stale_ttl: int, wait_timeout: float, poll_interval: float = 0.25):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "upstream_calls": 0, "refreshes": 0}
+
+    @staticmethod
+    def canonical_params(params: dict) -> dict:
+        """Drops empty values and normalizes case and types, so equivalent
+        searches ({"adults": 1} and {"adults": "1"}) share a key."""
+        canonical = {}
+        for name, value in params.items():
+            if value is None or value == "":
+                continue
+            if isinstance(value, bool):
+                value = str(value).lower()
+            canonical[name] = str(value).strip().upper() if name != "departureDate" else str(value).strip()
+        return canonical
+
+    def cache_key(self, params: dict) -> str:
+        encoded = json.dumps(self.canonical_params(params), sort_keys=True, separators=(",", ":"))
+        return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get_or_search(self, params: dict, search) -> list:
+        """Returns the offers for `params`, calling `search()` only when no
+        usable cached result exists and no identical search is in flight."""
+        key = self.cache_key(params)
+        entry = self._read(key)
+        if entry is not None:
+            offers, fetched_at = entry
+            if time.time() - fetched_at < self.ttl:
+                self._count("hits")
+                return offers
+            self._count("stale_hits")
+            if search_pool.submit(self._refresh, key, search):
+                print(f"[SearchCache] Serving stale results for {key}; refreshing in the background.")
+            return offers
+        self._count("misses")
+        return self._search_once(key, search)
+
+    def _refresh(self, key: str, search):
+        self._count("refreshes")
+        self._search_once(key, search)
+
+    def _search_once(self, key: str, search) -> list:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        if not leader:
+            self._count("coalesced")
+            # Every caller gets its own copy: offers are enriched per user.
+            return copy.deepcopy(future.result())
+        try:
+            offers = self._fetch(key, search)
+            future.set_result(offers)
+            # The leader gets a copy too: followers copy the shared result on
+            # their own threads while the leader's caller may be mutating its offers.
+            return copy.deepcopy(offers)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _fetch(self, key: str, search) -> list:
+        if get_binary_redis_client() and not try_acquire_lock(f"{self.KEY_PREFIX}{key}", self.wait_timeout):
+            # Another worker is running this search; use its result if it lands in time.
+            offers = self._wait_for_fill(key)
+            if offers is not None:
+                self._count("coalesced")
+                return offers
+        self._count("upstream_calls")
+        offers = search()
+        if offers:
+            self._write(key, offers)
+        return offers
+
+    def _wait_for_fill(self, key: str):
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            entry = self._read(key)
+            if entry is not None and time.time() - entry[1] < self.ttl:
+                return entry[0]
+        return None
+
+    def _read(self, key: str):
+        """Returns (offers, fetched_at) for a cached search, or None."""
+        client = get_binary_redis_client()
+        if not client:
+            return None
+        try:
+            raw = client.get(f"{self.KEY_PREFIX}{key}")
+            if raw is None:
+                return None
+            entry = session_codec.decode(raw)
+            return entry["offers"], entry["fetched_at"]
+        except (redis.exceptions.RedisError, ValueError, KeyError) as e:
+            print(f"[SearchCache] WARNING: Could not read cached search {key}: {e}")
+            return None
+
+    def _write(self, key: str, offers: list):
+        client = get_binary_redis_client()
+        if not client:
+            return
+        try:
+            entry = session_codec.encode({"offers": offers, "fetched_at": time.time()})
+            client.set(f"{self.KEY_PREFIX}{key}", entry, ex=self.ttl + self.stale_ttl)
+        except redis.exceptions.RedisError as e:
+            print(f"[SearchCache] WARNING: Could not cache search {key}: {e}")
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["stale_hits"] + self._stats["misses"]
+            served = self._stats["hits"] + self._stats["stale_hits"]
+            return dict(self._stats, inflight=len(self._inflight),
+                        hit_rate=round(served / lookups, 3) if lookups else None)
+
+
+flight_search_cache = SearchCache(
+    ttl=int(os.getenv("FLIGHT_SEARCH_CACHE_TTL", "300")),
+    stale_ttl=int(os.getenv("FLIGHT_SEARCH_STALE_TTL", "900")),
+    # Matches the 15s retry budget of a search plus some slack.
+    wait_timeout=float(os.getenv("FLIGHT_SEARCH_WAIT_TIMEOUT", "20")),
+)
+
+
+def get_search_cache_stats() -> dict:
+    return flight_search_cache.stats()
@@ -0,0 +1,86 @@
+import os
+import json
+import threading
+import msgpack
+import zstandard
+
+# Every encoded session field starts with a one-byte format marker. Legacy
+# fields are plain JSON text, which can never start with these bytes, so old
+# sessions are read transparently and rewritten in the new format on save.
+FORMAT_MSGPACK = b"\x01"
+FORMAT_MSGPACK_ZSTD = b"\x02"
+
+# Fields whose msgpack encoding is at least this many bytes are compressed.
+COMPRESS_THRESHOLD = int(os.getenv("SESSION_COMPRESS_THRESHOLD", "1024"))
+COMPRESS_LEVEL = int(os.getenv("SESSION_COMPRESS_LEVEL", "3"))
+
+# zstd contexts are not thread-safe, and request threads, the worker pools
+# and the watcher all encode sessions, so each thread gets its own pair.
+_local = threading.local()
+
+
+def _compressor():
+    if not hasattr(_local, "compressor"):
+        _local.compressor = zstandard.ZstdCompressor(level=COMPRESS_LEVEL)
+    return _local.compressor
+
+
+def _decompressor():
+    if not hasattr(_local, "decompressor"):
+        _local.decompressor = zstandard.ZstdDecompressor()
+    return _local.decompressor
+
+
+def use_legacy_json() -> bool:
+    """SESSION_CODEC=json keeps writing the old JSON format (e.g. to roll back)."""
+    return os.getenv("SESSION_CODEC", "msgpack").lower() == "json"
+
+
+def pack(value) -> bytes:
+    """Serialises a field without the format marker or compression.
+
+    Equal values pack to equal bytes, so callers can compare packed fields to
+    detect changes before paying for compression.
+    """
+    if use_legacy_json():
+        return json.dumps(value).encode("utf-8")
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def wrap(packed: bytes) -> bytes:
+    """Adds the format marker to a packed field, compressing it if large."""
+    if use_legacy_json():
+        return packed
+    if len(packed) >= COMPRESS_THRESHOLD:
+        # zstd streams embed their size, so a plain decompress() can read them back.
+        return FORMAT_MSGPACK_ZSTD + _compressor().compress(packed)
+    return FORMAT_MSGPACK + packed
+
+
+def encode(value) -> bytes:
+    """Encodes one session field."""
+    return wrap(pack(value))
+
+
+def unwrap(raw) -> bytes:
+    """Returns the packed payload of a stored field (legacy JSON is returned as is)."""
+    if isinstance(raw, str):
+        return raw.encode("utf-8")
+    marker = raw[:1]
+    if marker == FORMAT_MSGPACK:
+        return raw[1:]
+    if marker == FORMAT_MSGPACK_ZSTD:
+        return _decompressor().decompress(raw[1:])
+    return raw
+
+
+def decode(raw):
+    """Decodes one session field written by `encode` or by the legacy JSON format."""
+    return decode_payload(raw, unwrap(raw))
+
+
+def decode_payload(raw, payload: bytes):
+    """Decodes a field whose payload was already extracted with `unwrap`."""
+    if isinstance(raw, str) or raw[:1] not in (FORMAT_MSGPACK, FORMAT_MSGPACK_ZSTD):
+        return json.loads(payload)
+    return msgpack.unpackb(payload, raw=False, strict_map_key=False)
@@ -0,0 +1,264 @@
+import re
+import threading
+from datetime import date, datetime
+
+from dateutil import parser as date_parser
+from dateutil.relativedelta import relativedelta
+
+from app.reference_data import get_reference_data
+from app.city_resolver import TIER_AIRPORT
+
+# What the gathering prompt (SYSTEM_PROMPT_GATHER_INFO) must collect before
+# the details are complete; return_date is optional.
+REQUIRED_SLOTS = ("traveler_name", "origin", "destination", "departure_date", "number_of_travelers")
+
+_NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9}
+_COMPANIONS = r"(?:wife|husband|partner|friend|son|daughter|mum|mom|mother|dad|father|brother|sister|colleague|boss|girlfriend|boyfriend|fiancee?)"
+_MONTHS = r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Words that end a place name: "to London on the 15th", "from Lagos next week".
+_PLACE_END = r"(?=$|[,.!?;]|\s+(?:on|in|for|around|about|departing|leaving|next|this|tomorrow|today|with|returning|return|and|at|by|via|the|please|from|to)\b|\s+\d)"
+_PLACE = r"[A-Za-z][A-Za-z .'-]{1,40}?"
+_ROUTES = [
+    re.compile(rf"\bfrom\s+(?P<origin>{_PLACE})\s+to\s+(?P<destination>{_PLACE}){_PLACE_END}", re.I),
+    re.compile(rf"\bto\s+(?P<destination>{_PLACE})\s+from\s+(?P<origin>{_PLACE}){_PLACE_END}", re.I),
+    re.compile(rf"^\s*(?P<origin>{_PLACE})\s+to\s+(?P<destination>{_PLACE}){_PLACE_END}", re.I),
+    re.compile(rf"\b(?:fly|flying|flight|flights|travel|travelling|traveling|go|going|trip|get)\s+to\s+(?P<destination>{_PLACE}){_PLACE_END}", re.I),
+    re.compile(rf"\b(?:from|leaving|departing)\s+(?P<origin>{_PLACE}){_PLACE_END}", re.I),
+]
+
+_DATE_PATTERNS = [
+    ("iso", re.compile(r"\b(\d{4}-\d{1,2}-\d{1,2})\b")),
+    ("numeric", re.compile(r"\b(\d{1,2}[/.]\d{1,2}(?:[/.]\d{2,4})?)\b")),
+    ("day_month", re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?(?:\s+of)?\s+({_MONTHS})\.?(?:,?\s+(\d{{4}}))?\b", re.I)),
+    ("month_day", re.compile(rf"\b({_MONTHS})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?\b(?:,?\s+(\d{{4}}))?", re.I)),
+    ("day_only", re.compile(r"\bthe\s+(\d{1,2})(?:st|nd|rd|th)\b", re.I)),
+    ("relative", re.compile(rf"\b(today|tomorrow|(?:next|this|on)\s+(?:{'|'.join(_WEEKDAYS)}))\b", re.I)),
+]
+_RETURN_CUE = re.compile(r"\b(?:return(?:ing)?|back|coming back|until|till)\b[^,.;]*$", re.I)
+_FLEXIBLE_CUE = re.compile(r"\b(?:around|about|roughly|approximately|flexible|give or take|or so)\b|-ish\b", re.I)
+
+_TRAVELER_COUNT = re.compile(
+    r"\b(\d{1,2}|one|two|three|four|five|six|seven|eight|nine)\s+(?:adults?|people|persons?|passengers?|travell?ers?|of us|tickets?|seats?)\b", re.I)
+_SOLO = re.compile(r"\b(?:just me|only me|myself|alone|solo|one person)\b", re.I)
+_PAIR = re.compile(rf"\b(?:me and my {_COMPANIONS}|my {_COMPANIONS} and (?:i|me))\b", re.I)
+_CLASS = re.compile(r"\b(premium economy|economy|business class|first class)\b", re.I)
+_NON_STOP = re.compile(r"\b(?:non-?stop|direct flights?|direct only|only direct|no (?:stops|layovers?|connections))\b", re.I)
+_CURRENCIES = {"usd": "USD", "dollars": "USD", "eur": "EUR", "euros": "EUR", "gbp": "GBP", "pounds": "GBP",
+               "ngn": "NGN", "naira": "NGN", "ghs": "GHS", "cedis": "GHS", "kes": "KES", "zar": "ZAR", "rand": "ZAR",
+               "cad": "CAD", "aud": "AUD", "aed": "AED", "dirhams": "AED"}
+_CURRENCY = re.compile(rf"\b(?:in|pay|paying|prices?|currency)\s+(?:in\s+)?(?:us\s+)?({'|'.join(_CURRENCIES)})\b", re.I)
+_NAME = re.compile(r"\b(?i:my name is|my name's|name is|i am|i'm|this is)\s+([A-Z][A-Za-z'-]+(?:\s+[A-Z][A-Za-z'-]+){1,3})")
+_BARE_NAME = re.compile(r"^\s*([A-Za-z][A-Za-z'-]+(?:\s+[A-Za-z][A-Za-z'-]+){1,3})\s*[.!]?\s*$")
+_NOT_NAME_WORDS = {"flying", "going", "travelling", "traveling", "looking", "from", "to", "and", "the", "not", "sure",
+                   "yes", "no", "okay", "ok", "thanks", "please", "just", "me", "alone"}
+
+# Which single slot the assistant's last question asks for, by keywords.
+_QUESTION_SLOTS = [
+    ("traveler_name", re.compile(r"\bname\b", re.I)),
+    ("number_of_travelers", re.compile(r"\bhow many\b|\btravell?ers\b|\bpassengers\b|\bpeople\b", re.I)),
+    ("departure_date", re.compile(r"\bwhen\b|\bdate\b|\bwhat day\b", re.I)),
+    ("origin", re.compile(r"\b(?:from|departing|leaving|origin)\b", re.I)),
+    ("destination", re.compile(r"\bwhere\b.*\b(?:to|go|going)\b|\bdestination\b", re.I)),
+]
+
+
+def _resolves(place: str) -> bool:
+    """True when `place` is exactly the name or code of one place. Prefix and
+    typo matches are left to the model: "fly" is one edit from "Ely"."""
+    reference = get_reference_data()
+    if not reference or not place:
+        return False
+    best = reference.resolver.candidates(place, limit=1)
+    return bool(best and best[0].tier <= TIER_AIRPORT and reference.resolve_city(place))
+
+
+def _match_place(phrase: str):
+    """The longest leading run of words (up to four) that resolves to exactly
+    one place, title-cased, or None."""
+    words = phrase.strip(" .'-").split()
+    for n in range(min(4, len(words)), 0, -1):
+        candidate = " ".join(words[:n])
+        if len(candidate) >= 3 and candidate.lower() not in _NOT_NAME_WORDS and _resolves(candidate):
+            return candidate if candidate.isupper() and len(candidate) == 3 else candidate.title()
+    return None
+
+
+def _future(candidate: date, today: date, step: relativedelta) -> date:
+    while candidate < today:
+        candidate += step
+    return candidate
+
+
+def _parse_date(kind: str, match, today: date):
+    """The date a matched phrase means, or None when it is invalid or ambiguous."""
+    try:
+        if kind == "iso":
+            return datetime.strptime(match.group(1), "%Y-%m-%d").date()
+        if kind == "numeric":
+            parts = re.split(r"[/.]", match.group(1))
+            # 05/06 could be either order; only unambiguous dates are trusted.
+            if int(parts[0]) <= 12 and int(parts[1]) <= 12 and parts[0] != parts[1]:
+                return None
+            parsed = date_parser.parse(match.group(1), dayfirst=int(parts[0]) > 12 or int(parts[1]) <= 12,
+                                       default=datetime(today.year, 1, 1)).date()
+            return parsed if len(parts) == 3 else _future(parsed, today, relativedelta(years=1))
+        if kind in ("day_month", "month_day"):
+            text = " ".join(g for g in match.groups() if g)
+            parsed = date_parser.parse(text, default=datetime(today.year, 1, 1)).date()
+            return parsed if match.group(3) else _future(parsed, today, relativedelta(years=1))
+        if kind == "day_only":
+            return _future(today.replace(day=int(match.group(1))), today, relativedelta(months=1))
+        if kind == "relative":
+            phrase = match.group(1).lower()
+            if phrase == "today":
+                return today
+            if phrase == "tomorrow":
+                return today + relativedelta(days=1)
+            qualifier, weekday = phrase.split()
+            # The coming weekday; "next" never means today.
+            target = today + relativedelta(weekday=_WEEKDAYS.index(weekday))
+            return target + relativedelta(days=7) if qualifier == "next" and target == today else target
+    except (ValueError, OverflowError):
+        return None
+    return None
+
+
+def _extract_dates(text: str, today: date) -> dict:
+    slots, taken = {}, []
+    for kind, pattern in _DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            if any(start < match.end() and match.start() < end for start, end in taken):
+                continue
+            parsed = _parse_date(kind, match, today)
+            if parsed is None or parsed < today:
+                continue
+            taken.append(match.span())
+            slot = "return_date" if _RETURN_CUE.search(text[max(0, match.start() - 30):match.start()]) else "departure_date"
+            slots.setdefault(slot, (match.start(), parsed))
+    dates = {slot: value.isoformat() for slot, (_, value) in slots.items()}
+    if "departure_date" in dates and _FLEXIBLE_CUE.search(text):
+        dates["flexible_dates"] = True
+    return dates
+
+
+def _expected_slot(question: str):
+    """The slot the assistant asked for, when it asked for exactly one."""
+    asked = [slot for slot, pattern in _QUESTION_SLOTS if pattern.search(question or "")]
+    return asked[0] if len(asked) == 1 else None
+
+
+def extract_slots(text: str, expected_slot: str = None, today: date = None) -> dict:
+    """Slots this one user message states unambiguously.
+
+    `expected_slot` is what the assistant just asked for, so a bare answer
+    ("Lagos", "2", "David Ugbodaga") can be assigned to it.
+    """
+    today = today or date.today()
+    text = text or ""
+    slots = {}
+
+    for pattern in _ROUTES:
+        match = pattern.search(text)
+        if not match:
+            continue
+        for slot, phrase in match.groupdict().items():
+            place = _match_place(phrase or "")
+            if place and slot not in slots:
+                slots[slot] = place
+    if expected_slot in ("origin", "destination") and expected_slot not in slots and len(text.split()) <= 4:
+        place = _match_place(text)
+        if place:
+            slots[expected_slot] = place
+
+    slots.update(_extract_dates(text, today))
+
+    count = _TRAVELER_COUNT.search(text)
+    if count:
+        value = count.group(1).lower()
+        slots["number_of_travelers"] = int(value) if value.isdigit() else _NUMBER_WORDS[value]
+    elif _PAIR.search(text):
+        slots["number_of_travelers"] = 2
+    elif _SOLO.search(text):
+        slots["number_of_travelers"] = 1
+    elif expected_slot == "number_of_travelers":
+        bare = text.strip(" .!").lower()
+        if bare.isdigit() and 0 < int(bare) < 10:
+            slots["number_of_travelers"] = int(bare)
+        elif bare in _NUMBER_WORDS:
+            slots["number_of_travelers"] = _NUMBER_WORDS[bare]
+
+    travel_class = _CLASS.search(text)
+    if travel_class:
+        slots["travel_class"] = travel_class.group(1).upper().replace(" CLASS", "").replace(" ", "_")
+
+    if _NON_STOP.search(text):
+        slots["non_stop"] = True
+    currency = _CURRENCY.search(text)
+    if currency:
+        slots["currency"] = _CURRENCIES[currency.group(1).lower()]
+
+    name = _NAME.search(text)
+    if not name and expected_slot == "traveler_name":
+        name = _BARE_NAME.match(text)
+    if name:
+        words = name.group(1).split()
+        if not any(w.lower() in _NOT_NAME_WORDS for w in words) and not _resolves(name.group(1)):
+            slots["traveler_name"] = " ".join(w[:1].upper() + w[1:] for w in words)
+    return slots
+
+
+def extract_from_history(history, today: date = None) -> dict:
+    """Slots from every user message in a conversation, later messages
+    overriding earlier ones (users correct themselves)."""
+    slots, question = {}, None
+    for message in history or []:
+        if not isinstance(message, dict):
+            continue
+        if message.get("role") == "assistant":
+            question = message.get("content")
+        elif message.get("role") == "user":
+            slots.update(extract_slots(message.get("content"), _expected_slot(question), today))
+    return slots
+
+
+def update_slots(slots: dict, message: str, question: str = None, today: date = None) -> dict:
+    """`slots` updated with what the newest user message states. Only that
+    message is parsed, so a turn costs the same however long the conversation
+    is; `question` is the assistant message it answers."""
+    return {**(slots or {}), **extract_slots(message, _expected_slot(question), today)}
+
+
+def is_complete(slots: dict) -> bool:
+    return all(slots.get(slot) for slot in REQUIRED_SLOTS)
+
+
+def confirmation_message(slots: dict) -> str:
+    """The assistant's restatement of complete details, as the model would
+    write it, ending with the [INFO_COMPLETE] token."""
+    trip = f"from {slots['origin']} to {slots['destination']} on {slots['departure_date']}"
+    if slots.get("return_date"):
+        trip += f", returning {slots['return_date']}"
+    travelers = slots["number_of_travelers"]
+    return (f"Thanks, {slots['traveler_name']}. You'd like to fly {trip} "
+            f"for {travelers} traveler{'s' if travelers != 1 else ''}. [INFO_COMPLETE]")
+
+
+_stats = {"replies_avoided": 0, "extractions_avoided": 0, "llm_replies": 0, "llm_extractions": 0}
+_stats_lock = threading.Lock()
+
+
+def record(event: str):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def get_slot_extractor_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    avoided = stats["replies_avoided"] + stats["extractions_avoided"]
+    total = avoided + stats["llm_replies"] + stats["llm_extractions"]
+    stats["llm_calls_avoided"] = avoided
+    stats["avoided_rate"] = round(avoided / total, 3) if total else None
+    return stats
@@ -29,7 +29,9 @@ def upload_pdf(pdf_bytes, filename):
             pdf_bytes,
             resource_type="raw",
             public_id=filename,
-            folder="flight_tickets/"  # Optional: to keep files organized
+            folder="flight_tickets/",  # Optional: to keep files organized
+            # The Cloudinary SDK pools its own connections; just bound how long an upload can block.
+            timeout=float(os.environ.get("CLOUDINARY_UPLOAD_TIMEOUT", "30"))
         )
         
         # The secure_url is the HTTPS URL for the uploaded file
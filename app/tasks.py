@@ -2,11 +2,16 @@
 import os
 from twilio.rest import Client as TwilioClient
 from app.amadeus_service import AmadeusService
-from app.new_session_manager import load_session, save_session
-from app.utils import _format_flight_offers
+from app.new_session_manager import load_session, save_session, drop_circle_intent, save_raw_flight_offers
+from app.utils import _format_flight_offers, _displayed_airport_codes
 from app.telegram_service import send_message
-from tenacity import retry, stop_after_delay, wait_fixed, RetryError
+from app.worker_pool import poller_pool, lookup_all, run_lookups, date_search_executor
+from app.search_cache import flight_search_cache
+from app.amadeus_scheduler import RateLimited
+from app.flight_offer import project_offers, rank_offers
+from tenacity import retry, stop_after_delay, wait_random_exponential, RetryError
 import time
+from datetime import date, datetime, timedelta
 
 # Initialize Twilio Client for the task
 twilio_account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
@@ -14,11 +19,108 @@ twilio_auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
 TWILIO_WHATSAPP_NUMBER = os.environ.get("TWILIO_WHATSAPP_NUMBER")
 twilio_client = TwilioClient(twilio_account_sid, twilio_auth_token)
 
-@retry(stop=stop_after_delay(15), wait=wait_fixed(2))
+# How many offers Amadeus returns per search, and how many of those are kept
+# (ranked by price, then duration) and shown to the user.
+FLIGHT_SEARCH_MAX_RESULTS = int(os.getenv("FLIGHT_SEARCH_MAX_RESULTS", "20"))
+FLIGHT_OFFERS_KEPT = int(os.getenv("FLIGHT_OFFERS_KEPT", "5"))
+# Currency to price offers in; empty leaves it to Amadeus.
+FLIGHT_SEARCH_CURRENCY = os.getenv("FLIGHT_SEARCH_CURRENCY", "")
+# Flexible-date searches cover this many days either side of the requested
+# date, with at most FLEXIBLE_DATE_MAX_SEARCHES Amadeus searches per request.
+FLEXIBLE_DATE_WINDOW = int(os.getenv("FLEXIBLE_DATE_WINDOW", "3"))
+FLEXIBLE_DATE_MAX_SEARCHES = int(os.getenv("FLEXIBLE_DATE_MAX_SEARCHES", "7"))
+
+USDC_PAYMENT_INSTRUCTIONS = "To pay with USDC, please send exactly {amount:.2f} USDC (test amount) to the address below. I will notify you once the payment is confirmed."
+
+
+def _send_proactive_message(user_id, text):
+    """Sends a message to the user outside of a webhook response."""
+    try:
+        print(f"[{user_id}] - INFO: Attempting to send message to user.")
+        if user_id.startswith('whatsapp:'):
+            print(f"[{user_id}] - DEBUG: Sending proactive message from: '{TWILIO_WHATSAPP_NUMBER}' to: '{user_id}'")
+            twilio_client.messages.create(
+                from_=TWILIO_WHATSAPP_NUMBER,
+                body=text,
+                to=user_id
+            )
+        elif user_id.startswith('telegram:'):
+            chat_id = user_id.split(':')[1]
+            send_message(chat_id, text)
+        print(f"[{user_id}] - INFO: Message sent successfully.")
+        return True
+    except Exception as e:
+        print(f"[{user_id}] - CRITICAL: Failed to send proactive message from task: {e}")
+        return False
+
+# Jittered exponential backoff, so workers retrying after throttling or an
+# outage do not hit Amadeus again in lockstep.
+@retry(stop=stop_after_delay(15), wait=wait_random_exponential(multiplier=0.5, max=4))
 def _search_flights_with_retry(amadeus_service, **kwargs):
     """Wrapper to search flights with retry logic."""
     return amadeus_service.search_flights(**kwargs)
 
+def _build_search_params(flight_details, origin_iata, destination_iata):
+    """Amadeus flight-offers search parameters for the gathered details."""
+    search_params = {
+        "originLocationCode": origin_iata,
+        "destinationLocationCode": destination_iata,
+        "departureDate": flight_details.get('departure_date'),
+        "adults": str(flight_details.get('number_of_travelers', '1')),
+        "max": FLIGHT_SEARCH_MAX_RESULTS,
+    }
+    if 'travel_class' in flight_details and flight_details['travel_class']:
+        search_params['travelClass'] = flight_details['travel_class']
+    if str(flight_details.get('non_stop', '')).lower() in ("true", "yes", "1"):
+        search_params['nonStop'] = "true"
+    currency = flight_details.get('currency') or FLIGHT_SEARCH_CURRENCY
+    if currency:
+        search_params['currencyCode'] = currency.upper()
+    return search_params
+
+def _departure_dates(flight_details, today=None):
+    """The requested departure date, or every date within FLEXIBLE_DATE_WINDOW
+    of it (nearest first, none in the past) when the user is flexible."""
+    requested = flight_details.get('departure_date')
+    if str(flight_details.get('flexible_dates', '')).lower() not in ("true", "yes", "1"):
+        return [requested]
+    try:
+        base = datetime.strptime(requested, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return [requested]
+    today = today or date.today()
+    offsets = sorted(range(-FLEXIBLE_DATE_WINDOW, FLEXIBLE_DATE_WINDOW + 1), key=lambda d: (abs(d), d))
+    dates = [base + timedelta(days=d) for d in offsets if base + timedelta(days=d) >= today]
+    return [d.isoformat() for d in dates[:FLEXIBLE_DATE_MAX_SEARCHES]] or [requested]
+
+def _search_departure_dates(user_id, amadeus_service, search_params, dates):
+    """Searches every date concurrently, each cached on its own. Returns
+    {date: offers}; a date whose search fails has no offers."""
+    def search_date(departure_date):
+        params = dict(search_params, departureDate=departure_date)
+        try:
+            # Identical searches by other users share one cached Amadeus call.
+            # Only the best offers are cached and stored.
+            return flight_search_cache.get_or_search(
+                params,
+                lambda: rank_offers(_search_flights_with_retry(amadeus_service, **params), FLIGHT_OFFERS_KEPT),
+            )
+        except (RetryError, RateLimited):
+            print(f"[{user_id}] - WARNING: Amadeus API timeout/retry error for {departure_date}.")
+            return []
+    # Not on lookup_executor: these can block for seconds and would hold up
+    # other users' airport and airline lookups.
+    return lookup_all(search_date, dates, date_search_executor)
+
+def _cheapest_date_message(offers_by_date):
+    cheapest = rank_offers([dict(offers[0], departureDate=d) for d, offers in offers_by_date.items() if offers], 1)
+    if len(offers_by_date) < 2 or not cheapest:
+        return ""
+    price = cheapest[0]['price']
+    day = datetime.strptime(cheapest[0]['departureDate'], '%Y-%m-%d').strftime('%a %d %b')
+    amount = f"{price['total']} {price.get('currency', '')}".strip()
+    return f"The cheapest day to fly is {day}, from {amount}."
+
 def search_flights_task(user_id, flight_details):
     """
     Function to search for flights asynchronously, send a proactive message,
@@ -42,49 +144,50 @@ def search_flights_task(user_id, flight_details):
         amadeus_service = AmadeusService()
         print(f"[{user_id}] - INFO: AmadeusService initialized.")
         
-        origin_iata = amadeus_service.get_iata_code(flight_details.get('origin'))
-        print(f"[{user_id}] - INFO: Got origin IATA '{origin_iata}' for '{flight_details.get('origin')}'.")
-
-        destination_iata = amadeus_service.get_iata_code(flight_details.get('destination'))
-        print(f"[{user_id}] - INFO: Got destination IATA '{destination_iata}' for '{flight_details.get('destination')}'.")
+        # Origin and destination are resolved concurrently.
+        origin, destination = flight_details.get('origin'), flight_details.get('destination')
+        iata_codes = lookup_all(amadeus_service.get_iata_code, [origin, destination])
+        origin_iata, destination_iata = iata_codes.get(origin), iata_codes.get(destination)
+        print(f"[{user_id}] - INFO: Got origin IATA '{origin_iata}' for '{origin}'.")
+        print(f"[{user_id}] - INFO: Got destination IATA '{destination_iata}' for '{destination}'.")
         
-        offers = []
+        offers, cheapest_date_msg = [], ""
         if origin_iata and destination_iata:
             print(f"[{user_id}] - INFO: Searching flights with Amadeus...")
             
-            search_params = {
-                "originLocationCode": origin_iata,
-                "destinationLocationCode": destination_iata,
-                "departureDate": flight_details.get('departure_date'),
-                "adults": str(flight_details.get('number_of_travelers', '1'))
-            }
-            if 'travel_class' in flight_details and flight_details['travel_class']:
-                search_params['travelClass'] = flight_details['travel_class']
-
-            try:
-                offers = _search_flights_with_retry(
-                    amadeus_service,
-                    **search_params
-                )
-                print(f"[{user_id}] - INFO: Amadeus search returned {len(offers) if offers else 0} offers.")
-            except RetryError:
-                print(f"[{user_id}] - WARNING: Amadeus API timeout/retry error.")
-                offers = []
+            search_params = _build_search_params(flight_details, origin_iata, destination_iata)
+            dates = _departure_dates(flight_details)
+            offers_by_date = _search_departure_dates(user_id, amadeus_service, search_params, dates)
+            # Offers for every date compete for the displayed slots.
+            offers = rank_offers([o for d in dates for o in offers_by_date.get(d) or []], FLIGHT_OFFERS_KEPT)
+            cheapest_date_msg = _cheapest_date_message(offers_by_date)
+            print(f"[{user_id}] - INFO: Amadeus search returned {len(offers)} offers for {len(dates)} date(s).")
         else:
             print(f"[{user_id}] - WARNING: Missing IATA code. Skipping flight search.")
 
         
         if offers:
+            # The session keeps trimmed offers; the raw ones are stored once for booking.
+            offers = project_offers(offers, save_raw_flight_offers(offers))
+
+            # Look up every distinct airline and displayed airport at once, so
+            # enrichment takes as long as the slowest lookup, not the sum.
+            carrier_codes = [offer['itineraries'][0]['segments'][0]['carrierCode'] for offer in offers]
+            names = run_lookups({
+                "airlines": (amadeus_service.get_airline_name, carrier_codes),
+                "airports": (amadeus_service.get_airport_name, _displayed_airport_codes(offers)),
+            })
+
             # Enrich offers with airline names and the traveler's name
             traveler_name = flight_details.get('traveler_name')
-            for offer in offers:
-                carrier_code = offer['itineraries'][0]['segments'][0]['carrierCode']
-                airline_name = amadeus_service.get_airline_name(carrier_code)
-                offer['airlineName'] = airline_name
+            for offer, carrier_code in zip(offers, carrier_codes):
+                offer['airlineName'] = names["airlines"].get(carrier_code, carrier_code)
                 if traveler_name:
                     offer['traveler_name'] = traveler_name
 
-            response_msg = _format_flight_offers(offers, amadeus_service)
+            response_msg = _format_flight_offers(offers, amadeus_service, airport_names=names["airports"])
+            if cheapest_date_msg:
+                response_msg = f"{cheapest_date_msg}\n\n{response_msg}"
             next_state = "FLIGHT_SELECTION"
             print(f"[{user_id}] - INFO: Formatted flight offers successfully.")
         else:
@@ -99,188 +202,47 @@ def search_flights_task(user_id, flight_details):
         offers = []
 
     # Proactively send the message back to the user
-    try:
-        print(f"[{user_id}] - INFO: Attempting to send message to user.")
-        if user_id.startswith('whatsapp:'):
-            print(f"[{user_id}] - DEBUG: Sending proactive message from: '{TWILIO_WHATSAPP_NUMBER}' to: '{user_id}'")
-            twilio_client.messages.create(
-                from_=TWILIO_WHATSAPP_NUMBER,
-                body=response_msg,
-                to=user_id
-            )
-        elif user_id.startswith('telegram:'):
-            chat_id = user_id.split(':')[1]
-            send_message(chat_id, response_msg)
-        print(f"[{user_id}] - INFO: Message sent successfully.")
-    except Exception as e:
-        print(f"[{user_id}] - CRITICAL: Failed to send proactive message from task: {e}")
+    _send_proactive_message(user_id, response_msg)
 
     # Update the user's session with the new state and offers
     save_session(user_id, next_state, conversation_history, offers, flight_details)
-    print(f"[{user_id}] - INFO: Session saved with new state '{next_state}'. Task finished.") 
-
-# -----------------------------------------------
-# USDC Payment Polling Task
-# -----------------------------------------------
+    print(f"[{user_id}] - INFO: Session saved with new state '{next_state}'. Task finished.")
 
-def poll_usdc_payment_task(user_id, intent_id, poll_interval=30, timeout_seconds=3600):
-    """Polls Circle for payment status until complete or timeout.
 
-    Args:
-        user_id (str): The platform-specific user identifier (e.g., telegram:12345).
-        intent_id (str): The Circle payment intent ID.
-        poll_interval (int, optional): Seconds between polls. Defaults to 30.
-        timeout_seconds (int, optional): Maximum time to poll. Defaults to 1 hour.
+def deliver_usdc_address_task(user_id, payment_intent_id, usd_amount, circle_service):
     """
-    from app.circle_service import CircleService  # Imported here to avoid circular deps at load time
-    circle_service = CircleService()
-
-    start_time = time.time()
-    print(f"[{user_id}] - INFO: Starting polling for payment intent {intent_id}.")
-
-    while time.time() - start_time < timeout_seconds:
-        status = circle_service.get_payment_intent_status(intent_id)
-        print(f"[{user_id}] - DEBUG: Payment intent {intent_id} status: {status}")
-
-        if status == "complete":
-            print(f"[{user_id}] - INFO: Payment intent {intent_id} marked complete. Handling success.")
-            try:
-                from app.main import handle_successful_payment  # Local import to avoid circular deps
-                handle_successful_payment(user_id)
-            except Exception as e:
-                print(f"[{user_id}] - ERROR in handle_successful_payment: {e}")
-            return
-        elif status is None:
-            print(f"[{user_id}] - WARNING: Unable to retrieve status for {intent_id}. Will retry.")
-
-        time.sleep(poll_interval)
-
-    print(f"[{user_id}] - WARNING: Polling timed out for payment intent {intent_id} after {timeout_seconds} seconds.") 
-
-# -----------------------------------------------
-# Circle Layer Payment Polling Task
-# -----------------------------------------------
-
-def poll_circlelayer_payment_task(user_id: str, address: str, token_address: str, amount_units: float, decimals: int, poll_interval: int = None, min_confirmations: int = None, timeout_seconds: int = 3600):
-    """Poll Circle Layer for native token payments to `address` until `amount_units` is met.
-
-    Args:
-        user_id: platform-specific id (e.g., telegram:123)
-        address: deposit address to receive funds
-        token_address: None for native tokens, contract address for ERC-20 tokens
-        amount_units: target amount in smallest units (e.g., wei for native tokens)
-        decimals: token decimals (e.g., 18 for native tokens)
-        poll_interval: seconds between polls (default from env CIRCLE_LAYER_POLL_INTERVAL or 15)
-        min_confirmations: required confirmations (default from env CIRCLE_LAYER_MIN_CONFIRMATIONS or 3)
-        timeout_seconds: stop polling after this many seconds
+    Waits for Circle to assign a deposit address to a payment intent created
+    with `wait_for_address=False` and sends it to the user as proactive messages.
+
+    The lookup backs off from CIRCLE_ADDRESS_POLL_INITIAL up to
+    CIRCLE_ADDRESS_POLL_MAX seconds between requests and gives up after
+    CIRCLE_ADDRESS_TIMEOUT seconds, or when the pool shuts down, returning the
+    user to payment selection. Nothing resumes the wait after a restart, so
+    the user is always either sent an address or asked to choose again.
     """
-    try:
-        from app.circlelayer_service import CircleLayerService
-        from app.main import handle_successful_payment
-        from app.new_session_manager import get_circlelayer_payment_info, clear_circlelayer_payment_info
-    except Exception as e:
-        print(f"[{user_id}] - ERROR: Unable to import CircleLayerService or handler: {e}")
-        return
-
-    svc = CircleLayerService()
-    
-    # Defaults
-    if poll_interval is None:
-        poll_interval = int(os.getenv("CIRCLE_LAYER_POLL_INTERVAL", "15"))
-    if min_confirmations is None:
-        min_confirmations = int(os.getenv("CIRCLE_LAYER_MIN_CONFIRMATIONS", "3"))
-
-    print(f"[{user_id}] - INFO: Starting Circle Layer polling for {amount_units} smallest units at {address}.")
-    start = time.time()
-
-    # Get payment tracking information
-    payment_info = get_circlelayer_payment_info(user_id)
-    if not payment_info:
-        print(f"[{user_id}] - ERROR: No payment tracking information found for {user_id}")
-        return
-    
-    initial_balance = payment_info.get("initial_balance", 0)
-    expected_amount = payment_info.get("expected_amount", amount_units)
-    address_index = payment_info.get("address_index", 0)
-    
-    print(f"[{user_id}] - INFO: Payment tracking - Initial: {initial_balance} wei, Expected: {expected_amount} wei, Address Index: {address_index}")
-
-    # Check if this is a native token payment
-    if token_address is None:
-        # Native token payment - check balance increase
-        while time.time() - start < timeout_seconds:
-            try:
-                current_balance = svc.check_native_balance(address, min_confirmations)
-                balance_increase = current_balance - initial_balance
-                
-                print(f"[{user_id}] - DEBUG: Current balance: {current_balance} wei, Initial: {initial_balance} wei, Increase: {balance_increase} wei, Target: {expected_amount} wei")
-                
-                # Only confirm if balance increased by the expected amount
-                if balance_increase >= expected_amount:
-                    print(f"[{user_id}] - INFO: Native token payment confirmed: balance increased by {balance_increase} wei (>= {expected_amount} wei)")
-                    
-                    # Clear payment tracking data
-                    clear_circlelayer_payment_info(user_id)
-                    
-                    try:
-                        handle_successful_payment(user_id)
-                    except Exception as e:
-                        print(f"[{user_id}] - ERROR calling handle_successful_payment: {e}")
-                    return
-                    
-            except Exception as e:
-                print(f"[{user_id}] - WARNING: Native balance check error: {e}")
-                
-            time.sleep(poll_interval)
-
-        print(f"[{user_id}] - WARNING: Circle Layer polling timed out after {timeout_seconds}s for {address}.")
-    else:
-        # ERC-20 token payment - use existing transfer event logic
-        to_checksum = svc.w3.to_checksum_address  # type: ignore
-        to_addr = to_checksum(address)
-        target_amount = int(round(amount_units * (10 ** decimals)))
-
-        last_from = max(0, svc.get_confirmed_block(min_confirmations) - 2000)
-
-        # Build event and filter parameters lazily each loop for updated blocks
-        contract = svc.erc20_contract(token_address)
-        Transfer = contract.events.Transfer
-
-        while time.time() - start < timeout_seconds:
-            try:
-                to_block = svc.get_confirmed_block(min_confirmations)
-                logs = svc.w3.eth.get_logs({
-                    "fromBlock": last_from,
-                    "toBlock": to_block,
-                    "address": svc.w3.to_checksum_address(token_address),
-                })
-                total = 0
-                # Decode and sum transfers to our address
-                for log in logs:
-                    try:
-                        ev = Transfer().process_log(log)
-                        if ev["args"]["to"] == to_addr:
-                            total += int(ev["args"]["value"])
-                    except Exception:
-                        continue
-
-                if total >= target_amount:
-                    print(f"[{user_id}] - INFO: ERC-20 token payment met: {total} >= {target_amount}.")
-                    
-                    # Clear payment tracking data
-                    clear_circlelayer_payment_info(user_id)
-                    
-                    try:
-                        handle_successful_payment(user_id)
-                    except Exception as e:
-                        print(f"[{user_id}] - ERROR calling handle_successful_payment: {e}")
-                    return
-
-                last_from = to_block
-            except Exception as e:
-                # Network hiccup / RPC failover; log and keep trying
-                print(f"[{user_id}] - WARNING: ERC-20 token polling error: {e}")
-
-            time.sleep(poll_interval)
-
-    print(f"[{user_id}] - WARNING: Circle Layer polling timed out after {timeout_seconds}s for {address}.") 
\ No newline at end of file
+    delay = float(os.getenv("CIRCLE_ADDRESS_POLL_INITIAL", "0.5"))
+    max_delay = float(os.getenv("CIRCLE_ADDRESS_POLL_MAX", "4"))
+    deadline = time.monotonic() + float(os.getenv("CIRCLE_ADDRESS_TIMEOUT", "60"))
+
+    while True:
+        time.sleep(delay)
+        address = circle_service.get_deposit_address(payment_intent_id)
+        if address:
+            print(f"[{user_id}] - INFO: Got deposit address for payment intent {payment_intent_id}.")
+            _send_proactive_message(user_id, USDC_PAYMENT_INSTRUCTIONS.format(amount=usd_amount))
+            # Send the address in a separate message with no formatting for easy copying.
+            _send_proactive_message(user_id, address)
+            return
+        if poller_pool.stopping:
+            print(f"[{user_id}] - WARNING: Shutting down before payment intent {payment_intent_id} got a deposit address.")
+            break
+        if time.monotonic() >= deadline:
+            print(f"[{user_id}] - WARNING: No deposit address for payment intent {payment_intent_id}; giving up.")
+            break
+        delay = min(max_delay, delay * 2)
+
+    drop_circle_intent(payment_intent_id)
+    state, conversation_history, flight_offers, flight_details = load_session(user_id)
+    if state == "AWAITING_USDC_PAYMENT":
+        save_session(user_id, "AWAITING_PAYMENT_SELECTION", conversation_history, flight_offers, flight_details)
+    _send_proactive_message(user_id, "Sorry, I couldn't generate a USDC payment address at the moment. Please try again or select 'Card'.")
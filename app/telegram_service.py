@@ -1,5 +1,7 @@
 import os
+import time
 import requests
+from app import http_client
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/"
@@ -16,13 +18,127 @@ def send_message(chat_id, text, parse_mode=None):
         payload["parse_mode"] = parse_mode
         
     try:
-        response = requests.post(f"{TELEGRAM_API_URL}sendMessage", json=payload)
+        response = http_client.post(f"{TELEGRAM_API_URL}sendMessage", json=payload)
         response.raise_for_status()  # Raise an exception for bad status codes
         return response.json()
     except requests.exceptions.RequestException as e:
         print(f"Error sending message to Telegram: {e}")
         return None
 
+def edit_message_text(chat_id, message_id, text):
+    """
+    Replaces the text of a message the bot sent earlier.
+    """
+    payload = {
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "text": text,
+    }
+    try:
+        response = http_client.post(f"{TELEGRAM_API_URL}editMessageText", json=payload)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Error editing Telegram message: {e}")
+        return None
+
+def delete_message(chat_id, message_id):
+    """
+    Deletes a message the bot sent earlier.
+    """
+    payload = {
+        "chat_id": chat_id,
+        "message_id": message_id,
+    }
+    try:
+        response = http_client.post(f"{TELEGRAM_API_URL}deleteMessage", json=payload)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        print(f"Error deleting Telegram message: {e}")
+        return None
+
+class TelegramReplyStream:
+    """
+    Shows a reply in one Telegram message while it is being generated.
+
+    The message is sent with the first text and then edited as the text
+    grows, at most once per `edit_interval` seconds (Telegram throttles bots
+    that edit faster). `close` sends the last pending edit.
+
+    A reply can be withdrawn (`update(None)`) when it turns out not to be
+    meant for the user. Its message is then reused for the next response
+    (`replace`) or, if there is none, deleted (`discard_withdrawn`).
+    """
+
+    def __init__(self, chat_id, edit_interval: float):
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval
+        self.message_id = None
+        self.text = ""
+        self.withdrawn = False
+        self._shown = ""
+        self._shown_at = 0.0
+
+    def update(self, text):
+        if text is None:
+            self.withdrawn = True
+            self.text = ""
+            return
+        self.text = text
+        if time.monotonic() - self._shown_at >= self.edit_interval:
+            self._show()
+
+    def close(self):
+        """Shows the final text, retrying a failed edit once. If it still
+        cannot be shown, the partial message is deleted so the caller's
+        fallback send does not show the reply twice."""
+        if self.withdrawn:
+            return
+        for _ in range(2):
+            self._show()
+            if self.text.strip() == self._shown:
+                return
+        if self.message_id is not None:
+            delete_message(self.chat_id, self.message_id)
+            self.message_id = None
+            self._shown = ""
+
+    def delivered(self, text) -> bool:
+        """Whether `text` is what this stream already shows."""
+        return self.message_id is not None and not self.withdrawn and text.strip() == self._shown
+
+    def replace(self, text) -> bool:
+        """Shows `text` in place of a withdrawn reply. False if there is
+        nothing to replace, so the caller sends `text` itself."""
+        if not self.withdrawn or self.message_id is None:
+            return False
+        if not edit_message_text(self.chat_id, self.message_id, text):
+            return False
+        self.withdrawn = False
+        self._shown = self.text = text.strip()
+        return True
+
+    def discard_withdrawn(self):
+        """Deletes the message of a withdrawn reply nothing replaced."""
+        if self.withdrawn and self.message_id is not None:
+            delete_message(self.chat_id, self.message_id)
+            self.message_id = None
+
+    def _show(self):
+        text = self.text.strip()
+        if not text or text == self._shown:
+            return
+        if self.message_id is None:
+            result = send_message(self.chat_id, text)
+            self.message_id = ((result or {}).get("result") or {}).get("message_id")
+            if self.message_id is None:
+                return
+        elif not edit_message_text(self.chat_id, self.message_id, text):
+            return
+        self._shown = text
+        self._shown_at = time.monotonic()
+
 def send_pdf(chat_id, pdf_bytes, filename="itinerary.pdf"):
     """
     Sends a PDF document to a Telegram user.
@@ -33,7 +149,7 @@ def send_pdf(chat_id, pdf_bytes, filename="itinerary.pdf"):
     data = {'chat_id': chat_id}
     
     try:
-        response = requests.post(url, files=files, data=data)
+        response = http_client.post(url, files=files, data=data, timeout=20)
         response.raise_for_status()
         print(f"PDF sent to Telegram chat_id {chat_id}")
         return response.json()
@@ -50,7 +166,7 @@ def send_telegram_pdf(chat_id, pdf_bytes, filename):
     data = {'chat_id': chat_id}
     
     try:
-        response = requests.post(url, files=files, data=data, timeout=20)
+        response = http_client.post(url, files=files, data=data, timeout=20)
         response.raise_for_status()
         print(f"PDF sent to Telegram chat {chat_id}")
     except requests.exceptions.RequestException as e:
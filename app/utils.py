@@ -1,6 +1,8 @@
 import re
 from datetime import datetime
 import pytz
+from app.reference_data import get_reference_data
+from app.worker_pool import lookup_all
 
 def _format_duration(iso_duration):
     """Formats an ISO 8601 duration string into a more readable format."""
@@ -20,18 +22,10 @@ def _format_duration(iso_duration):
 def get_local_time(iata_code):
     """
     Get the current local time for a given IATA code.
-    This is a simplified example; a real implementation would be more robust.
+    Unknown codes fall back to UTC.
     """
-    # This is a very basic mapping. A real app would use a more comprehensive library.
-    timezone_map = {
-        "JFK": "America/New_York",
-        "LHR": "Europe/London",
-        "CDG": "Europe/Paris",
-        "LAX": "America/Los_Angeles",
-        # ... add other common IATA codes
-    }
-    
-    timezone_name = timezone_map.get(iata_code, "UTC")
+    reference = get_reference_data()
+    timezone_name = (reference.airport_timezone(iata_code) if reference else None) or "UTC"
     local_tz = pytz.timezone(timezone_name)
     return datetime.now(local_tz)
 
@@ -49,11 +43,30 @@ def sanitize_filename(name):
     s = re.sub(r'(?u)[^-\w.]', '', s)
     return s
 
-def _format_flight_offers(flights, amadeus_service):
-    """Formats flight offers into a string with full details."""
+def _displayed_airport_codes(flights):
+    """Origin and destination codes of the offers _format_flight_offers shows."""
+    codes = []
+    for flight in flights[:5]:
+        segments = flight['itineraries'][0]['segments']
+        codes += [segments[0]['departure']['iataCode'], segments[-1]['arrival']['iataCode']]
+    return codes
+
+def _format_flight_offers(flights, amadeus_service, airport_names=None):
+    """Formats flight offers into a string with full details.
+
+    `airport_names` maps IATA codes to names when the caller already looked
+    them up; otherwise the names are fetched here, concurrently.
+    """
     if not flights:
         return "Sorry, I couldn't find any flights for the given criteria."
 
+    if airport_names is None:
+        airport_names = lookup_all(amadeus_service.get_airport_name, _displayed_airport_codes(flights))
+
+    # Flexible-date results depart on different days, so show the day too.
+    departure_days = {f['itineraries'][0]['segments'][0]['departure']['at'][:10] for f in flights[:5]}
+    time_format = '%a %d %b, %I:%M %p' if len(departure_days) > 1 else '%I:%M %p'
+
     response_lines = ["I found a few options for you:"]
     for i, flight in enumerate(flights[:5], 1):
         itinerary = flight['itineraries'][0]
@@ -65,10 +78,10 @@ def _format_flight_offers(flights, amadeus_service):
         origin_code = first_segment['departure']['iataCode']
         destination_code = last_segment['arrival']['iataCode']
         
-        origin_name = amadeus_service.get_airport_name(origin_code)
-        destination_name = amadeus_service.get_airport_name(destination_code)
+        origin_name = airport_names.get(origin_code, origin_code)
+        destination_name = airport_names.get(destination_code, destination_code)
 
-        departure_time = datetime.fromisoformat(first_segment['departure']['at']).strftime('%I:%M %p')
+        departure_time = datetime.fromisoformat(first_segment['departure']['at']).strftime(time_format)
         duration = _format_duration(itinerary.get('duration', ''))
         
         num_stops = len(itinerary['segments']) - 1
@@ -0,0 +1,236 @@
+import os
+import atexit
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WorkerPool:
+    """A bounded thread pool for background jobs.
+
+    - At most `max_workers` jobs run at once and at most `max_queue` more may wait.
+    - `submit` never blocks: when the pool is full the job is rejected and
+      the caller is expected to tell the user to try again later.
+    - Keeps simple counters so pool pressure can be reported on /health.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stopping = threading.Event()
+        self._shut_down = False
+        self._pending = 0
+        self._active = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._cancelled = 0
+
+    def submit(self, fn, *args, **kwargs) -> bool:
+        """Queues `fn(*args, **kwargs)`. Returns False if the job was rejected."""
+        if self._stopping.is_set() or not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            print(f"[WorkerPool:{self.name}] WARNING: Rejected {getattr(fn, '__name__', fn)} (pool full or shutting down).")
+            return False
+
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+        try:
+            future = self._executor.submit(self._run, fn, args, kwargs)
+        except RuntimeError as e:
+            # The executor refuses new work once it has been shut down.
+            with self._lock:
+                self._pending -= 1
+                self._rejected += 1
+            self._slots.release()
+            print(f"[WorkerPool:{self.name}] WARNING: Could not submit job: {e}")
+            return False
+        future.add_done_callback(self._on_done)
+        return True
+
+    def _on_done(self, future):
+        # Jobs cancelled by shutdown never reach _run; give back what they held.
+        if future.cancelled():
+            with self._lock:
+                self._pending -= 1
+                self._cancelled += 1
+            self._slots.release()
+
+    def _run(self, fn, args, kwargs):
+        with self._lock:
+            self._pending -= 1
+            self._active += 1
+        try:
+            fn(*args, **kwargs)
+            with self._lock:
+                self._completed += 1
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+            print(f"[WorkerPool:{self.name}] ERROR: Job {getattr(fn, '__name__', fn)} raised {type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._idle.notify_all()
+            self._slots.release()
+
+    @property
+    def stopping(self) -> bool:
+        """True once shutdown has started; long-running jobs should check this and exit."""
+        return self._stopping.is_set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._pending,
+                "active": self._active,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "cancelled": self._cancelled,
+            }
+
+    def request_stop(self):
+        """Rejects new jobs and sets `stopping`, without waiting. Takes no
+        locks, so it is safe to call from a signal handler."""
+        self._stopping.set()
+
+    def shutdown(self, drain_timeout: float = None):
+        """Stops accepting jobs, drops queued ones and waits up to `drain_timeout` for running ones."""
+        with self._lock:
+            if self._shut_down:
+                return
+            self._shut_down = True
+        self._stopping.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if drain_timeout is None:
+            drain_timeout = float(os.getenv("WORKER_POOL_DRAIN_TIMEOUT", "10"))
+        # Cancelled jobs never reach _run, so only the running ones need draining.
+        with self._lock:
+            drained = self._idle.wait_for(lambda: self._active == 0, timeout=drain_timeout)
+            if not drained:
+                print(f"[WorkerPool:{self.name}] WARNING: {self._active} job(s) still running after {drain_timeout}s drain timeout.")
+
+
+def _pool_from_env(name: str, default_workers: int, default_queue: int) -> WorkerPool:
+    prefix = name.upper()
+    workers = int(os.getenv(f"{prefix}_POOL_WORKERS", str(default_workers)))
+    queue = int(os.getenv(f"{prefix}_POOL_QUEUE", str(default_queue)))
+    return WorkerPool(name, max_workers=workers, max_queue=queue)
+
+
+# Short jobs (flight searches) and long-lived jobs (payment pollers) get separate
+# pools so a backlog of pollers can never starve searches.
+search_pool = _pool_from_env("search", default_workers=8, default_queue=32)
+poller_pool = _pool_from_env("poller", default_workers=16, default_queue=64)
+
+
+# Reference lookups (IATA codes, airport and airline names) fanned out from a
+# search job. A plain executor, since callers wait on the results; it is
+# separate from search_pool so a search never waits on its own pool's slots.
+lookup_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LOOKUP_POOL_WORKERS", "8")), thread_name_prefix="lookup-worker"
+)
+
+# The per-date searches of a flexible-date request. Each can block for
+# seconds (retries, waiting on another worker's identical search), so they
+# get their own executor and never queue ahead of the short lookups above.
+date_search_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DATE_SEARCH_POOL_WORKERS", "8")), thread_name_prefix="date-search-worker"
+)
+
+
+def run_lookups(groups: dict, executor: ThreadPoolExecutor = None) -> dict:
+    """Runs independent lookups concurrently and waits for all of them.
+
+    Args:
+        groups: name -> (fn, keys). `fn(key)` is called once per distinct,
+            non-empty key, however often it repeats in `keys`.
+        executor: Where the lookups run; lookup_executor by default.
+
+    Returns:
+        name -> {key: fn(key)}. An exception from any lookup is re-raised.
+    """
+    calls = {(name, key): fn for name, (fn, keys) in groups.items() for key in dict.fromkeys(keys) if key}
+    if len(calls) <= 1:
+        results = {call: fn(call[1]) for call, fn in calls.items()}
+    else:
+        executor = executor or lookup_executor
+        futures = {call: executor.submit(fn, call[1]) for call, fn in calls.items()}
+        results = {call: future.result() for call, future in futures.items()}
+    grouped = {name: {} for name in groups}
+    for (name, key), value in results.items():
+        grouped[name][key] = value
+    return grouped
+
+
+def lookup_all(fn, keys, executor: ThreadPoolExecutor = None) -> dict:
+    """`run_lookups` for a single lookup function: returns {key: fn(key)}."""
+    return run_lookups({"": (fn, keys)}, executor)[""]
+
+
+def get_pool_stats() -> dict:
+    return {pool.name: pool.stats() for pool in (search_pool, poller_pool)}
+
+
+def stop_pools():
+    """Tells the pools to stop taking jobs; see WorkerPool.request_stop."""
+    for pool in (search_pool, poller_pool):
+        pool.request_stop()
+
+
+def shutdown_pools(drain_timeout: float = None):
+    """Stops the pools and waits up to `drain_timeout` in total for their
+    running jobs. Run from gunicorn's worker_exit hook (gunicorn.conf.py)
+    and at exit; never from a signal handler, as it takes the pool locks."""
+    if drain_timeout is None:
+        drain_timeout = float(os.getenv("WORKER_POOL_DRAIN_TIMEOUT", "10"))
+    deadline = time.monotonic() + drain_timeout
+    stop_pools()
+    for pool in (search_pool, poller_pool):
+        pool.shutdown(drain_timeout=max(0.0, deadline - time.monotonic()))
+    for executor in (lookup_executor, date_search_executor):
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def install_shutdown_handler(signum=signal.SIGTERM) -> bool:
+    """Stops the pools when the process is told to stop, then hands the
+    signal to whatever handled it before.
+
+    The handler only sets the pools' stop flags, so running jobs that check
+    `stopping` wind down; the drain happens in shutdown_pools. Under
+    gunicorn the worker's signals are gunicorn's and its worker_exit hook
+    drains. Elsewhere a default SIGTERM becomes SystemExit so the atexit
+    hook below still runs. Signal handlers can only be set from the main
+    thread.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return False
+    previous = signal.getsignal(signum)
+
+    def handler(sig, frame):
+        stop_pools()
+        if callable(previous):
+            previous(sig, frame)
+        elif previous == signal.SIG_DFL:
+            raise SystemExit(128 + sig)
+
+    signal.signal(signum, handler)
+    return True
+
+
+install_shutdown_handler()
+# Covers exits that are not signalled; idle pools shut down immediately.
+atexit.register(shutdown_pools)
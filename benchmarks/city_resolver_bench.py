@@ -0,0 +1,93 @@
+"""Measures city-to-IATA lookup latency and accuracy of app/city_resolver.py.
+
+The corpus is origin/destination strings as the LLM extracts them from user
+messages: plain city names, "city, country", extra words ("new york city"),
+airport names, IATA codes and typos. Each is paired with the code a correct
+search would use (None where the name is ambiguous and Amadeus should
+decide). The resolver is compared with a difflib scan over every city name,
+the simplest offline alternative.
+
+Usage:
+    python benchmarks/city_resolver_bench.py [--rounds 200]
+"""
+import argparse
+import difflib
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.city_resolver import normalize  # noqa: E402
+from app.reference_data import load_reference_data  # noqa: E402
+
+CORPUS = [
+    ("Lagos", "LOS"), ("lagos", "LOS"), ("Lagos, Nigeria", "LOS"), ("lagos nigeria", "LOS"),
+    ("Abuja", "ABV"), ("abuja nigeria", "ABV"), ("Port Harcourt", "PHC"), ("Kano", "KAN"),
+    ("Enugu", "ENU"), ("Accra", "ACC"), ("Accra, Ghana", "ACC"), ("Nairobi", "NBO"),
+    ("Nairobbi", "NBO"), ("Johannesburg", "JNB"), ("Johannesberg", "JNB"), ("Cape Town", "CPT"),
+    ("Kigali", "KGL"), ("Addis Ababa", "ADD"), ("Cairo", "CAI"), ("Casablanca", "CMN"),
+    ("Dakar", "DKR"), ("London", "LON"), ("london uk", "LON"), ("London, UK", "LON"),
+    ("Londn", "LON"), ("Heathrow", "LHR"), ("Gatwick", "LGW"), ("LHR", "LHR"),
+    ("Manchester", "MAN"), ("Edinburgh", "EDI"), ("Dublin", "DUB"), ("Paris", "PAR"),
+    ("paris france", "PAR"), ("Pari", "PAR"), ("Amsterdam", "AMS"), ("Amsterdm", "AMS"),
+    ("Frankfurt", "FRA"), ("Berlin", "BER"), ("Munich", "MUC"), ("Rome", "ROM"),
+    ("Milan", "MIL"), ("Venice", "VCE"), ("Madrid", "MAD"), ("Barcelona", "BCN"),
+    ("Barcelna", "BCN"), ("Lisbon", "LIS"), ("Istanbul", "IST"), ("Athens", "ATH"),
+    ("Zurich", "ZRH"), ("Geneva", "GVA"), ("Vienna", "VIE"), ("Prague", "PRG"),
+    ("Dubai", "DXB"), ("Dubai, UAE", "DXB"), ("Abu Dhabi", "AUH"), ("Doha", "DOH"),
+    ("Riyadh", "RUH"), ("Jeddah", "JED"), ("Tel Aviv", "TLV"), ("Amman", "AMM"),
+    ("Mumbai", "BOM"), ("Bombay", "BOM"), ("Delhi", "DEL"), ("New Delhi", "DEL"),
+    ("Bangalore", "BLR"), ("Singapore", "SIN"), ("Bangkok", "BKK"), ("Kuala Lumpur", "KUL"),
+    ("Hong Kong", "HKG"), ("Tokyo", "TYO"), ("Seoul", "SEL"), ("Beijing", "BJS"),
+    ("Shanghai", "SHA"), ("Sydney", "SYD"), ("Melbourne", "MEL"), ("Auckland", "AKL"),
+    ("New York", "NYC"), ("new york city", "NYC"), ("NYC", "NYC"), ("JFK", "JFK"),
+    ("Los Angeles", "LAX"), ("San Francisco", "SFO"), ("Chicago", "CHI"), ("Miami", "MIA"),
+    ("Atlanta", "ATL"), ("Houston", "HOU"), ("Dallas", "DFW"), ("Seattle", "SEA"),
+    ("Boston", "BOS"), ("Washington", "WAS"), ("Las Vegas", "LAS"), ("Orlando", "MCO"),
+    ("Toronto", "YTO"), ("Montreal", "YUL"), ("Vancouver", "YVR"), ("Mexico City", "MEX"),
+    ("Cancun", "CUN"), ("Bogota", "BOG"), ("Lima", "LIM"), ("Sao Paulo", "SAO"),
+    ("São Paulo", "SAO"), ("Rio de Janeiro", "RIO"), ("Buenos Aires", "BUE"), ("Santiago", "SCL"),
+    ("Birmingham", None), ("Birmingham, UK", "BHX"), ("San Jose", None), ("Atlantis Springs", None),
+]
+
+
+def difflib_resolve(reference, city_names, query):
+    key = normalize(query.partition(",")[0])
+    match = difflib.get_close_matches(key, city_names, n=1, cutoff=0.8)
+    return reference.resolve_city(match[0]) if match else None
+
+
+def run(name, resolve, rounds):
+    latencies, correct = [], 0
+    for query, expected in CORPUS:
+        result = resolve(query)
+        correct += result == expected
+        start = time.perf_counter()
+        for _ in range(rounds):
+            resolve(query)
+        latencies.append((time.perf_counter() - start) * 1e6 / rounds)
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)]
+    print(f"{name:<16} {correct:>4}/{len(CORPUS):<4} {statistics.median(latencies):>10.1f} "
+          f"{p95:>10.1f} {latencies[-1]:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    reference = load_reference_data()
+    print(f"Loaded {reference.stats()} in {time.perf_counter() - start:.2f}s")
+    city_names = sorted(set(reference.resolver.names))
+
+    print(f"{'resolver':<16} {'correct':>9} {'p50 us':>10} {'p95 us':>10} {'max us':>10}")
+    run("city_resolver", reference.resolve_city, args.rounds)
+    run("difflib scan", lambda q: difflib_resolve(reference, city_names, q), max(1, args.rounds // 50))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Compares the latency of the [INFO_COMPLETE] turn with one model call and with two.
+
+The two-call path gets the reply from get_ai_response and then extracts the
+details with extract_flight_details_from_history. The combined path
+(AI_COMBINED_TURN) gets both from get_ai_response_with_details. Both talk to
+a local stub of the OpenAI-compatible API. The stub answers after a fixed
+per-request latency plus a per-output-token time, so the combined reply's
+longer output is charged for.
+
+Usage:
+    python benchmarks/combined_turn_bench.py [--turns 20] [--latency 0.4] [--token-ms 20]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("IO_API_KEY", "benchmark")
+
+import openai  # noqa: E402
+
+import app.ai_service as ai_service  # noqa: E402
+
+REPLY = ("Thanks, David. You'd like to fly from Lagos to London on 2025-09-15 for 2 travelers. "
+         "Is that correct? [INFO_COMPLETE]")
+DETAILS = {"traveler_name": "David Ugbodaga", "origin": "Lagos", "destination": "London",
+           "departure_date": "2025-09-15", "number_of_travelers": 2}
+HISTORY = [
+    {"role": "user", "content": "Hi, I need a flight from Lagos to London"},
+    {"role": "assistant", "content": "When would you like to depart?"},
+    {"role": "user", "content": "The 15th of September"},
+    {"role": "assistant", "content": "How many people are travelling?"},
+    {"role": "user", "content": "Two of us"},
+    {"role": "assistant", "content": "What is the lead traveler's full name?"},
+]
+KNOWN = {"origin": "Lagos", "destination": "London", "departure_date": "2025-09-15", "number_of_travelers": 2}
+
+
+def stub_handler(latency, token_seconds):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if request.get("response_format", {}).get("type") == "json_object":
+                combined = '"reply"' in request["messages"][0]["content"]
+                content = json.dumps({"reply": REPLY, "details": DETAILS} if combined else DETAILS)
+            else:
+                content = REPLY
+            completion_tokens = len(content) // 4
+            time.sleep(latency + completion_tokens * token_seconds)
+            body = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": request["model"],
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": completion_tokens, "total_tokens": completion_tokens},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def two_calls():
+    reply, history = ai_service.get_ai_response("David Ugbodaga", list(HISTORY), "GATHERING_INFO")
+    details = ai_service.extract_flight_details_from_history(history, known_details=KNOWN)
+    return reply, details
+
+
+def one_call():
+    reply, _, details = ai_service.get_ai_response_with_details("David Ugbodaga", list(HISTORY), "GATHERING_INFO", KNOWN)
+    return reply, details
+
+
+def measure(turn, turns):
+    seconds = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        reply, details = turn()
+        seconds.append(time.perf_counter() - start)
+        assert "[INFO_COMPLETE]" in reply and details == DETAILS
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.4, help="seconds per request before output")
+    parser.add_argument("--token-ms", type=float, default=20, help="milliseconds per output token")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub_handler(args.latency, args.token_ms / 1000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ai_service.client = openai.OpenAI(api_key="stub", base_url=f"http://127.0.0.1:{server.server_port}/v1/")
+    try:
+        results = {"two calls": measure(two_calls, args.turns), "combined": measure(one_call, args.turns)}
+    finally:
+        server.shutdown()
+
+    print(f"stub: {args.latency * 1000:.0f} ms per request + {args.token_ms:g} ms per output token, {args.turns} turns")
+    print(f"{'path':>10} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for path, seconds in results.items():
+        p95 = sorted(seconds)[max(0, int(len(seconds) * 0.95) - 1)]
+        print(f"{path:>10} {statistics.mean(seconds) * 1000:>9.0f} {statistics.median(seconds) * 1000:>8.0f} {p95 * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
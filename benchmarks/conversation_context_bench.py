@@ -0,0 +1,86 @@
+"""Measures the prompt sent to the chat model per turn as a conversation grows.
+
+Replays synthetic conversations that gather details, confirm, get corrected
+and start over, the way users talk to the bot. For every turn it compares the
+legacy prompt (the whole history, with a system prompt appended on every
+state change) with app/conversation_context.py (one system prompt, a rolling
+window and a summary of older turns). Token counts use the same estimate as
+the app.
+
+Usage:
+    python benchmarks/conversation_context_bench.py [--turns 100]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("IO_API_KEY", "benchmark")
+
+from app.ai_service import SYSTEM_PROMPT_GATHER_INFO, SYSTEM_PROMPT_CONFIRMATION  # noqa: E402
+from app.conversation_context import conversation_context, estimate_tokens  # noqa: E402
+
+SCRIPT = [
+    ("GATHERING_INFO", "Hi, I need a flight", "Sure! Where would you like to fly from and to?"),
+    ("GATHERING_INFO", "From Lagos to London", "Great. When would you like to depart?"),
+    ("GATHERING_INFO", "Around the 15th of next month", "How many people are travelling?"),
+    ("GATHERING_INFO", "Two adults, me and my wife", "What is the lead traveler's full name?"),
+    ("GATHERING_INFO", "David Ugbodaga",
+     "Let me confirm: Lagos to London, departing 2025-09-15, 2 travelers, lead traveler David Ugbodaga. "
+     "Is that correct? [INFO_COMPLETE]"),
+    ("AWAITING_CONFIRMATION", "Actually make it Manchester",
+     "Updated: Lagos to Manchester, departing 2025-09-15, 2 travelers. Is that correct? [INFO_COMPLETE]"),
+    ("AWAITING_CONFIRMATION", "Yes", "[CONFIRMED]"),
+    ("GATHERING_INFO", "No flights? Let's try another date then", "Which date would you like to try instead?"),
+]
+
+
+def legacy_prompt(history, state):
+    """What get_ai_response sent before: everything, system prompt per state change."""
+    prompt = SYSTEM_PROMPT_CONFIRMATION if state == "AWAITING_CONFIRMATION" else SYSTEM_PROMPT_GATHER_INFO
+    last_system = next((m["content"] for m in reversed(history) if m["role"] == "system"), None)
+    if last_system != prompt:
+        history.append({"role": "system", "content": prompt})
+    return history
+
+
+def windowed_prompt(history, state):
+    prompt = SYSTEM_PROMPT_CONFIRMATION if state == "AWAITING_CONFIRMATION" else SYSTEM_PROMPT_GATHER_INFO
+    conversation_context.set_system_prompt(history, prompt)
+    return history
+
+
+def replay(turns, build_history, send):
+    history, sizes, build_seconds = [], [], 0.0
+    for turn in range(turns):
+        state, user, assistant = SCRIPT[turn % len(SCRIPT)]
+        build_history(history, state)
+        history.append({"role": "user", "content": user})
+        start = time.perf_counter()
+        messages = send(history)
+        build_seconds += time.perf_counter() - start
+        sizes.append(estimate_tokens(messages))
+        history.append({"role": "assistant", "content": assistant})
+    return sizes, build_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=100)
+    args = parser.parse_args()
+
+    legacy, _ = replay(args.turns, legacy_prompt, lambda history: list(history))
+    windowed, seconds = replay(args.turns, windowed_prompt, conversation_context.build_messages)
+
+    print(f"window: {conversation_context.window_turns} turns, summary: {conversation_context.summary_max_chars} chars")
+    print(f"{'turn':>6} {'legacy tokens':>14} {'windowed tokens':>16}")
+    for turn in (1, 5, 10, 25, 50, 100, 250, 500):
+        if turn <= args.turns:
+            print(f"{turn:>6} {legacy[turn - 1]:>14,} {windowed[turn - 1]:>16,}")
+    print(f"{'total':>6} {sum(legacy):>14,} {sum(windowed):>16,}")
+    print(f"building the windowed prompt: {seconds * 1e6 / args.turns:.1f} us per turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Compares the legacy JSON session encoding with app/session_codec.py.
+
+Builds sessions with realistic Amadeus flight-offers payloads (1, 2 and 3
+segment itineraries, per-traveler pricing, fare details by segment) and
+reports the stored bytes per session and the encode/decode time per session.
+
+Usage:
+    python benchmarks/session_codec_bench.py [--offers 250] [--rounds 50]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import session_codec  # noqa: E402
+
+AIRPORTS = ["LHR", "JFK", "CDG", "FRA", "AMS", "DXB", "LOS", "ABV", "MAD", "IST", "DOH", "NBO"]
+CARRIERS = ["BA", "AF", "KL", "LH", "EK", "QR", "TK", "IB", "DL", "UA"]
+
+
+def _segment(rng, i, dep, arr, day):
+    carrier = rng.choice(CARRIERS)
+    hour = rng.randint(0, 20)
+    return {
+        "departure": {"iataCode": dep, "terminal": str(rng.randint(1, 5)), "at": f"2025-09-{day:02d}T{hour:02d}:{rng.randint(0, 59):02d}:00"},
+        "arrival": {"iataCode": arr, "terminal": str(rng.randint(1, 5)), "at": f"2025-09-{day:02d}T{hour + 3:02d}:{rng.randint(0, 59):02d}:00"},
+        "carrierCode": carrier,
+        "number": str(rng.randint(10, 9999)),
+        "aircraft": {"code": rng.choice(["320", "321", "333", "359", "77W", "788"])},
+        "operating": {"carrierCode": carrier},
+        "duration": f"PT{rng.randint(1, 12)}H{rng.randint(0, 59)}M",
+        "id": str(i),
+        "numberOfStops": 0,
+        "blacklistedInEU": False,
+    }
+
+
+def make_offer(rng, offer_id, travelers=1):
+    origin, destination = rng.sample(AIRPORTS, 2)
+    stops = rng.choice([0, 0, 1, 1, 2])
+    via = rng.sample([a for a in AIRPORTS if a not in (origin, destination)], stops)
+    route = [origin] + via + [destination]
+    segments = [_segment(rng, i + 1, route[i], route[i + 1], 15) for i in range(len(route) - 1)]
+    total = round(rng.uniform(80, 2500), 2)
+    return {
+        "type": "flight-offer",
+        "id": str(offer_id),
+        "source": "GDS",
+        "instantTicketingRequired": False,
+        "nonHomogeneous": False,
+        "oneWay": False,
+        "lastTicketingDate": "2025-09-10",
+        "lastTicketingDateTime": "2025-09-10",
+        "numberOfBookableSeats": rng.randint(1, 9),
+        "itineraries": [{"duration": f"PT{rng.randint(2, 30)}H{rng.randint(0, 59)}M", "segments": segments}],
+        "price": {
+            "currency": "EUR",
+            "total": f"{total:.2f}",
+            "base": f"{total * 0.8:.2f}",
+            "fees": [{"amount": "0.00", "type": "SUPPLIER"}, {"amount": "0.00", "type": "TICKETING"}],
+            "grandTotal": f"{total:.2f}",
+        },
+        "pricingOptions": {"fareType": ["PUBLISHED"], "includedCheckedBagsOnly": True},
+        "validatingAirlineCodes": [segments[0]["carrierCode"]],
+        "travelerPricings": [
+            {
+                "travelerId": str(t + 1),
+                "fareOption": "STANDARD",
+                "travelerType": "ADULT",
+                "price": {"currency": "EUR", "total": f"{total / travelers:.2f}", "base": f"{total * 0.8 / travelers:.2f}"},
+                "fareDetailsBySegment": [
+                    {
+                        "segmentId": s["id"],
+                        "cabin": "ECONOMY",
+                        "fareBasis": "KLOWGB" + str(rng.randint(1, 9)),
+                        "brandedFare": "LIGHT",
+                        "class": rng.choice("KLMNQSTVY"),
+                        "includedCheckedBags": {"quantity": rng.randint(0, 2)},
+                    }
+                    for s in segments
+                ],
+            }
+            for t in range(travelers)
+        ],
+        "airlineName": "Example Airways",
+    }
+
+
+def make_session(rng, num_offers):
+    history = []
+    for i in range(12):
+        history.append({"role": "user", "content": f"I want to fly from Lagos to London on the {i + 1}th of next month for two adults"})
+        history.append({"role": "assistant", "content": "Sure! Could you confirm the departure city, date and number of travelers so I can search for flights?"})
+    return {
+        "state": "FLIGHT_SELECTION",
+        "conversation_history": history,
+        "flight_offers": [make_offer(rng, i + 1, travelers=2) for i in range(num_offers)],
+        "flight_details": {"origin": "Lagos", "destination": "London", "departure_date": "2025-09-15", "number_of_travelers": 2, "travel_class": "ECONOMY"},
+    }
+
+
+def legacy_encode(session):
+    return {k: json.dumps(v).encode("utf-8") for k, v in session.items()}
+
+
+def legacy_decode(fields):
+    return {k: json.loads(v) for k, v in fields.items()}
+
+
+def codec_encode(session):
+    return {k: session_codec.encode(v) for k, v in session.items()}
+
+
+def codec_decode(fields):
+    return {k: session_codec.decode(v) for k, v in fields.items()}
+
+
+def bench(name, encode, decode, session, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fields = encode(session)
+    encode_ms = (time.perf_counter() - start) * 1000 / rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decoded = decode(fields)
+    decode_ms = (time.perf_counter() - start) * 1000 / rounds
+    assert decoded == session
+    size = sum(len(v) for v in fields.values())
+    print(f"{name:<16} {size:>12,} {encode_ms:>12.2f} {decode_ms:>12.2f}")
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--offers", type=int, default=250)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    session = make_session(random.Random(42), args.offers)
+    print(f"Session with {args.offers} offers, {args.rounds} rounds")
+    print(f"{'codec':<16} {'bytes':>12} {'encode ms':>12} {'decode ms':>12}")
+    before = bench("json (legacy)", legacy_encode, legacy_decode, session, args.rounds)
+    after = bench("msgpack+zstd", codec_encode, codec_decode, session, args.rounds)
+    print(f"Size reduction: {100 * (1 - after / before):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
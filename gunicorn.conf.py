@@ -0,0 +1,10 @@
+# Gunicorn loads this file from the working directory (see render.yaml's startCommand).
+
+
+def worker_exit(server, worker):
+    # Gunicorn owns the worker's signal handlers, so drain the background
+    # pools here, after the worker has stopped taking requests. The drain is
+    # bounded by WORKER_POOL_DRAIN_TIMEOUT (10s), well inside the 30s
+    # graceful_timeout.
+    from app.worker_pool import shutdown_pools
+    shutdown_pools()
@@ -15,6 +15,20 @@ def celery_session_app(request):
     celery_app.conf.update(task_always_eager=True)
     return celery_app
 
+@pytest.fixture(autouse=True)
+def reset_session_snapshots():
+    """Each test starts without remembered session contents from earlier tests."""
+    from app.new_session_manager import reset_session_snapshots
+    reset_session_snapshots()
+    yield
+
+@pytest.fixture(autouse=True)
+def clear_reference_caches():
+    """Airport/airline names are cached process-wide; start every test empty."""
+    from app.reference_cache import clear_reference_caches
+    clear_reference_caches()
+    yield
+
 @pytest.fixture
 def app():
     """Create and configure a new app instance for each test."""
@@ -170,4 +170,125 @@ def test_extract_flight_details_with_travel_class(mock_openai_client):
     details = extract_flight_details_from_history(conversation_history)
     
     assert details.get("travel_class") == "BUSINESS"
-    assert details.get("traveler_name") == "Jane Doe" 
\ No newline at end of file
+    assert details.get("traveler_name") == "Jane Doe" 
+@patch("app.ai_service.client")
+def test_get_ai_response_sends_a_window_of_a_long_conversation(mock_openai_client):
+    """Long conversations send one system prompt and only the recent turns."""
+    from app.ai_service import conversation_context
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock()]
+    mock_response.choices[0].message.content = "When would you like to fly?"
+    mock_openai_client.chat.completions.create.return_value = mock_response
+
+    history = [{"role": "system", "content": SYSTEM_PROMPT_GATHER_INFO}]
+    for i in range(30):
+        history.append({"role": "user", "content": f"message {i}"})
+        history.append({"role": "assistant", "content": f"reply {i}"})
+        history.append({"role": "system", "content": SYSTEM_PROMPT_GATHER_INFO})
+
+    _, updated_history = get_ai_response("to Paris", history, "GATHERING_INFO")
+
+    sent = mock_openai_client.chat.completions.create.call_args[1]['messages']
+    assert [m['role'] for m in sent].count('system') == 1
+    assert len(sent) == 1 + conversation_context.window_turns * 2
+    assert sent[-1] == {"role": "user", "content": "to Paris"}
+    # The stored history keeps every turn but only one system prompt
+    assert [m['role'] for m in updated_history].count('system') == 1
+    assert len(updated_history) == 1 + 60 + 2
+
+
+@patch("app.ai_service.client")
+def test_extract_flight_details_incrementally_sends_known_details_and_recent_messages(mock_openai_client):
+    """With known details the prompt holds them and the latest messages only."""
+    from app.ai_service import extract_flight_details_from_history, EXTRACTION_RECENT_MESSAGES
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock()]
+    mock_response.choices[0].message.content = '{"origin": "Lagos", "destination": "Paris"}'
+    mock_openai_client.chat.completions.create.return_value = mock_response
+    history = [{"role": "user", "content": f"old message {i}"} for i in range(20)]
+    history += [{"role": "user", "content": "Actually, to Paris"},
+                {"role": "assistant", "content": "Lagos to Paris then. [INFO_COMPLETE]"}]
+
+    details = extract_flight_details_from_history(history, known_details={"origin": "Lagos", "destination": "London"})
+
+    assert details == {"origin": "Lagos", "destination": "Paris"}
+    prompt = mock_openai_client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+    assert '{"origin": "Lagos", "destination": "London"}' in prompt
+    assert "Actually, to Paris" in prompt
+    assert "old message 0" not in prompt
+    assert prompt.count("old message") == EXTRACTION_RECENT_MESSAGES - 2
+    # The search filters built from the details are asked for too.
+    assert '"non_stop"' in prompt and '"currency"' in prompt
+
+
+@patch("app.ai_service.client")
+def test_combined_response_returns_reply_and_details(mock_openai_client):
+    """One JSON call yields the reply and the details; the stored prompt stays plain."""
+    from app.ai_service import get_ai_response_with_details, SYSTEM_PROMPT_GATHER_INFO
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock()]
+    mock_response.choices[0].message.content = (
+        '{"reply": "Lagos to London on 2025-09-15. Correct? [INFO_COMPLETE]", '
+        '"details": {"origin": "Lagos", "destination": "London", "departure_date": "2025-09-15"}}')
+    mock_openai_client.chat.completions.create.return_value = mock_response
+
+    reply, history, details = get_ai_response_with_details("On the 15th", [], "GATHERING_INFO", {"origin": "Lagos"})
+
+    assert reply.endswith("[INFO_COMPLETE]")
+    assert details["destination"] == "London"
+    assert history == [{"role": "system", "content": SYSTEM_PROMPT_GATHER_INFO},
+                       {"role": "user", "content": "On the 15th"},
+                       {"role": "assistant", "content": reply}]
+    kwargs = mock_openai_client.chat.completions.create.call_args.kwargs
+    assert kwargs["response_format"] == {"type": "json_object"}
+    assert '{"origin": "Lagos"}' in kwargs["messages"][0]["content"]
+    assert mock_openai_client.chat.completions.create.call_count == 1
+
+
+@patch("app.ai_service.client")
+def test_combined_response_falls_back_to_a_plain_reply(mock_openai_client):
+    """Unusable JSON falls back to the ordinary reply, without details."""
+    from app.ai_service import get_ai_response_with_details
+    bad, plain = MagicMock(), MagicMock()
+    bad.choices = [MagicMock()]
+    bad.choices[0].message.content = '{"answer": "hi"}'
+    plain.choices = [MagicMock()]
+    plain.choices[0].message.content = "Where would you like to fly to?"
+    mock_openai_client.chat.completions.create.side_effect = [bad, plain]
+
+    reply, history, details = get_ai_response_with_details("hi", [], "GATHERING_INFO", {})
+
+    assert (reply, details) == ("Where would you like to fly to?", None)
+    assert [m["role"] for m in history] == ["system", "user", "assistant"]
+    assert "response_format" not in mock_openai_client.chat.completions.create.call_args.kwargs
+
+
+def test_visible_text_strips_and_holds_back_control_tokens():
+    from app.ai_service import visible_text
+    assert visible_text("Lagos to London. Correct? [INFO_COMPLETE]") == "Lagos to London. Correct?"
+    assert visible_text("Lagos to London. [INFO_") == "Lagos to London."
+    assert visible_text("[CONF") == ""
+    assert visible_text("Seats [2A] and [2B]") == "Seats [2A] and [2B]"
+    assert visible_text("Done [INFO_", final=True) == "Done [INFO_"
+
+
+@patch("app.ai_service.client")
+def test_get_ai_response_streams_to_the_reply_sink(mock_openai_client):
+    """Inside streaming_replies_to the reply is streamed, and withdrawn once a control token shows up."""
+    from app.ai_service import get_ai_response, streaming_replies_to
+
+    def chunk(text):
+        return MagicMock(choices=[MagicMock(delta=MagicMock(content=text))])
+
+    pieces = ["Lagos to ", "London. ", "Correct? [INFO", "_COMPLETE]"]
+    mock_openai_client.chat.completions.create.return_value = iter([chunk(p) for p in pieces])
+    shown = []
+
+    with streaming_replies_to(shown.append):
+        ai_response, history = get_ai_response("David", [], "GATHERING_INFO")
+
+    assert ai_response == "Lagos to London. Correct? [INFO_COMPLETE]"
+    assert history[-1]["content"] == ai_response
+    # The partial "[INFO" is held back, then the reply is withdrawn.
+    assert shown == ["Lagos to", "Lagos to London.", "Lagos to London. Correct?", None]
+    assert mock_openai_client.chat.completions.create.call_args.kwargs["stream"] is True
@@ -0,0 +1,77 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.amadeus_scheduler import AmadeusScheduler, RateLimited, PRIORITY_SEARCH, PRIORITY_LOOKUP
+
+
+def make_scheduler(**overrides):
+    options = dict(name="unit", rate=10, burst=3, reserve=1,
+                   max_wait={PRIORITY_SEARCH: 1, PRIORITY_LOOKUP: 0.05})
+    options.update(overrides)
+    return AmadeusScheduler(**options)
+
+
+def throttled_error(retry_after="0.05"):
+    error = RuntimeError("[429]")
+    error.response = MagicMock(status_code=429)
+    error.response.http_response.headers = {"Retry-After": retry_after}
+    return error
+
+
+def test_lookups_leave_reserved_slots_for_searches():
+    scheduler = make_scheduler()
+    scheduler.acquire(PRIORITY_LOOKUP)
+    scheduler.acquire(PRIORITY_LOOKUP)
+    with pytest.raises(RateLimited):
+        scheduler.acquire(PRIORITY_LOOKUP)
+    # The reserved slot is still there for a search
+    assert scheduler.acquire(PRIORITY_SEARCH) < 0.05
+    assert scheduler.stats()["timeouts"] == 1
+
+
+def test_searches_wait_for_the_bucket_to_refill():
+    scheduler = make_scheduler(reserve=0)
+    for _ in range(3):
+        scheduler.acquire(PRIORITY_SEARCH)
+    waited = scheduler.acquire(PRIORITY_SEARCH)
+    assert 0.05 <= waited < 0.5
+
+    waits = scheduler.stats()["wait_seconds"][PRIORITY_SEARCH]
+    assert waits["count"] == 4
+    assert waits["buckets"]["0.01"] == 3 and waits["buckets"]["+Inf"] == 4
+
+
+def test_throttled_calls_honor_retry_after_and_are_retried():
+    scheduler = make_scheduler()
+    fn = MagicMock(side_effect=[throttled_error("0.1"), "offers"])
+
+    start = time.monotonic()
+    assert scheduler.call(PRIORITY_SEARCH, fn, origin="LOS") == "offers"
+    assert time.monotonic() - start >= 0.1
+    assert fn.call_count == 2
+    assert scheduler.stats()["throttled"] == 1
+
+
+def test_other_errors_are_not_retried():
+    scheduler = make_scheduler()
+    fn = MagicMock(side_effect=ValueError("boom"))
+    with pytest.raises(ValueError):
+        scheduler.call(PRIORITY_SEARCH, fn)
+    assert fn.call_count == 1
+
+
+def test_bucket_is_shared_through_redis(mock_redis):
+    first, second = make_scheduler(reserve=0), make_scheduler(reserve=0)
+    for _ in range(3):
+        first.acquire(PRIORITY_SEARCH)
+    # The other worker sees an empty bucket
+    assert second.acquire(PRIORITY_SEARCH) >= 0.05
+
+    second.pause(0.1)
+    assert float(mock_redis.hget("amadeus_rate:unit", "paused_until")) > time.time()
+    real_sleep = time.sleep
+    with patch("app.amadeus_scheduler.time.sleep", side_effect=lambda s: real_sleep(min(s, 0.2))) as mock_sleep:
+        first.acquire(PRIORITY_SEARCH)
+    assert mock_sleep.call_args_list[0].args[0] > 0.05
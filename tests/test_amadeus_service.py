@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import MagicMock, patch
 from app.amadeus_service import AmadeusService, ResponseError, Location
+from app.amadeus_scheduler import RateLimited
 
 @pytest.fixture
 def mock_amadeus_client():
@@ -10,38 +11,78 @@ def mock_amadeus_client():
         yield mock_instance
 
 def test_get_iata_code_success(mock_amadeus_client):
-    """ Test successful IATA code lookup. """
+    """ Test IATA code lookup through Amadeus for a city the bundled data does not know. """
     mock_response = MagicMock()
-    mock_response.data = [{'iataCode': 'LHR'}]
+    mock_response.data = [{'iataCode': 'ATS'}]
     mock_amadeus_client.reference_data.locations.get.return_value = mock_response
 
     service = AmadeusService()
-    iata_code = service.get_iata_code('London')
+    iata_code = service.get_iata_code('Atlantis Springs')
     
     mock_amadeus_client.reference_data.locations.get.assert_called_once_with(
-        keyword='London',
+        keyword='Atlantis Springs',
         subType='CITY,AIRPORT'
     )
-    assert iata_code == 'LHR'
+    assert iata_code == 'ATS'
+
+def test_get_iata_code_resolved_locally(mock_amadeus_client):
+    """ Known cities are resolved from the bundled reference data without an API call. """
+    service = AmadeusService()
+
+    assert service.get_iata_code('London') == 'LON'
+    assert service.get_iata_code('Lagos') == 'LOS'
+    mock_amadeus_client.reference_data.locations.get.assert_not_called()
+
+def test_get_iata_code_ambiguous_city_falls_back_to_amadeus(mock_amadeus_client):
+    """ A city name shared by several countries is left to Amadeus. """
+    mock_response = MagicMock()
+    mock_response.data = [{'iataCode': 'BHX'}]
+    mock_amadeus_client.reference_data.locations.get.return_value = mock_response
+
+    service = AmadeusService()
+
+    assert service.get_iata_code('Birmingham') == 'BHX'
+    mock_amadeus_client.reference_data.locations.get.assert_called_once()
+
+def test_local_reference_data_can_be_disabled(mock_amadeus_client, monkeypatch):
+    """ LOCAL_REFERENCE_DATA=false sends every lookup to Amadeus. """
+    monkeypatch.setenv('LOCAL_REFERENCE_DATA', 'false')
+    mock_response = MagicMock()
+    mock_response.data = [{'iataCode': 'LHR'}]
+    mock_amadeus_client.reference_data.locations.get.return_value = mock_response
+
+    service = AmadeusService()
+
+    assert service.get_iata_code('London') == 'LHR'
+    mock_amadeus_client.reference_data.locations.get.assert_called_once()
 
 def test_get_airline_name_success_and_cached(mock_amadeus_client):
-    """ Test successful airline name lookup and that the result is cached. """
+    """ Test airline name lookup for a code missing from the bundled data, and that the result is cached. """
     mock_response = MagicMock()
-    mock_response.data = [{'businessName': 'American Airlines'}]
+    mock_response.data = [{'businessName': 'Example Air'}]
     mock_amadeus_client.reference_data.airlines.get.return_value = mock_response
 
     service = AmadeusService()
 
     # First call - should trigger API call
-    name = service.get_airline_name('AA')
-    assert name == 'American Airlines'
-    mock_amadeus_client.reference_data.airlines.get.assert_called_once_with(airlineCodes='AA')
+    name = service.get_airline_name('X9')
+    assert name == 'Example Air'
+    mock_amadeus_client.reference_data.airlines.get.assert_called_once_with(airlineCodes='X9')
 
     # Second call - should use cache, no new API call
-    name2 = service.get_airline_name('AA')
-    assert name2 == 'American Airlines'
+    name2 = service.get_airline_name('X9')
+    assert name2 == 'Example Air'
     mock_amadeus_client.reference_data.airlines.get.assert_called_once()
 
+def test_get_names_resolved_locally(mock_amadeus_client):
+    """ Known airline and airport codes are named from the bundled reference data. """
+    service = AmadeusService()
+
+    assert service.get_airline_name('AA') == 'American Airlines'
+    assert service.get_airport_name('LHR') == 'London Heathrow Airport'
+    mock_amadeus_client.reference_data.airlines.get.assert_not_called()
+    mock_amadeus_client.reference_data.locations.get.assert_not_called()
+
 
 def test_get_iata_code_not_found(mock_amadeus_client):
     """ Test IATA code lookup when no code is found. """
@@ -55,29 +96,29 @@ def test_get_iata_code_not_found(mock_amadeus_client):
     assert iata_code is None
 
 def test_get_airport_name_success_and_cached(mock_amadeus_client):
-    """ Test successful airport name lookup and that the result is cached. """
+    """ Test airport name lookup for a code missing from the bundled data, and that the result is cached. """
     mock_response = MagicMock()
-    mock_response.data = [{'name': 'HEATHROW'}]
+    mock_response.data = [{'name': 'NEW FIELD'}]
     mock_amadeus_client.reference_data.locations.get.return_value = mock_response
 
     service = AmadeusService()
     
     # First call - should trigger API call
-    name = service.get_airport_name('LHR')
-    assert name == 'HEATHROW'
+    name = service.get_airport_name('XQZ')
+    assert name == 'NEW FIELD'
     mock_amadeus_client.reference_data.locations.get.assert_called_once_with(
-        keyword='LHR',
+        keyword='XQZ',
         subType=Location.AIRPORT
     )
     
     # Second call - should use cache, no new API call
-    name2 = service.get_airport_name('LHR')
-    assert name2 == 'HEATHROW'
+    name2 = service.get_airport_name('XQZ')
+    assert name2 == 'NEW FIELD'
     mock_amadeus_client.reference_data.locations.get.assert_called_once() # Still called only once
 
 def test_get_airport_name_api_failure_and_fallback(mock_amadeus_client):
-    """ Test that the function falls back to the IATA code on API error and caches the failure. """
-    mock_amadeus_client.reference_data.locations.get.side_effect = ResponseError(MagicMock())
+    """ Test that the function falls back to the IATA code when Amadeus does not know it, and caches the miss. """
+    mock_amadeus_client.reference_data.locations.get.side_effect = ResponseError(MagicMock(status_code=404))
 
     service = AmadeusService()
 
@@ -94,6 +135,23 @@ def test_get_airport_name_api_failure_and_fallback(mock_amadeus_client):
     assert name2 == 'BADCODE'
     mock_amadeus_client.reference_data.locations.get.assert_called_once() # Still called only once
 
+def test_get_airport_name_transient_failures_are_not_cached(mock_amadeus_client):
+    """ Rate limits and server errors fall back to the code without hiding it from later lookups. """
+    mock_response = MagicMock()
+    mock_response.data = [{'name': 'LATE FIELD'}]
+    mock_amadeus_client.reference_data.locations.get.side_effect = [
+        ResponseError(MagicMock(status_code=503)),
+        RateLimited("no request slot"),
+        mock_response,
+    ]
+
+    service = AmadeusService()
+
+    assert service.get_airport_name('XQY') == 'XQY'
+    assert service.get_airport_name('XQY') == 'XQY'
+    assert service.get_airport_name('XQY') == 'LATE FIELD'
+    assert mock_amadeus_client.reference_data.locations.get.call_count == 3
+
 def test_search_flights_success(mock_amadeus_client):
     """ Test successful flight search. """
     mock_response = MagicMock()
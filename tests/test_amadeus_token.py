@@ -0,0 +1,83 @@
+import time
+import threading
+from unittest.mock import MagicMock
+
+from app.amadeus_token import TokenBroker, SharedAccessToken
+
+
+def make_client(client_id="id", expires_in=1799, delay=0):
+    client = MagicMock()
+    client.host = "test.api.amadeus.com"
+    client.client_id = client_id
+    client.client_secret = "secret"
+
+    def request(method, path, params):
+        time.sleep(delay)
+        return MagicMock(result={"access_token": f"token-{client.request.call_count}", "expires_in": expires_in})
+
+    client.request = MagicMock(side_effect=request)
+    client._unauthenticated_request = client.request
+    return client
+
+
+def test_clients_with_the_same_credentials_share_one_token():
+    broker = TokenBroker(refresh_margin=60, wait_timeout=1)
+    first, second = make_client(), make_client()
+
+    assert SharedAccessToken(first, broker)._bearer_token() == "Bearer token-1"
+    assert SharedAccessToken(second, broker)._bearer_token() == "Bearer token-1"
+    assert first.request.call_count == 1 and second.request.call_count == 0
+    assert broker.access_token(make_client("other")) == "token-1"
+    assert broker.stats()["fetches"] == 2
+
+
+def test_token_is_refreshed_shortly_before_it_expires():
+    broker = TokenBroker(refresh_margin=60, wait_timeout=1)
+    client = make_client(expires_in=30)
+
+    broker.access_token(client)
+    broker.access_token(client)
+    assert client.request.call_count == 2
+
+
+def test_concurrent_refreshes_make_one_request():
+    broker = TokenBroker(refresh_margin=60, wait_timeout=1)
+    client = make_client(delay=0.05)
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(broker.access_token(client))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tokens == ["token-1"] * 8
+    assert client.request.call_count == 1
+
+
+def test_token_is_shared_across_processes_through_redis(mock_redis):
+    client = make_client()
+    TokenBroker(refresh_margin=60, wait_timeout=1).access_token(client)
+
+    # A broker in another process reads the token instead of fetching one.
+    other_process = TokenBroker(refresh_margin=60, wait_timeout=1)
+    assert other_process.access_token(make_client()) == "token-1"
+    assert other_process.stats()["redis_hits"] == 1
+    assert 0 < mock_redis.ttl(f"{TokenBroker.KEY_PREFIX}{TokenBroker.token_key(client)}") <= 1799 - 60
+
+    other_process.invalidate(client)
+    assert other_process.access_token(client) == "token-2"
+
+
+def test_waits_for_the_process_holding_the_refresh_lock(mock_redis):
+    client = make_client()
+    key = TokenBroker.token_key(client)
+    mock_redis.set(f"lock:{TokenBroker.KEY_PREFIX}{key}", "1", ex=5)
+    broker = TokenBroker(refresh_margin=60, wait_timeout=1, poll_interval=0.01)
+
+    def fill():
+        time.sleep(0.05)
+        mock_redis.set(f"{TokenBroker.KEY_PREFIX}{key}", '{"access_token": "theirs", "expires_at": %d}' % (time.time() + 1800))
+
+    threading.Thread(target=fill).start()
+    assert broker.access_token(client) == "theirs"
+    assert client.request.call_count == 0
@@ -99,4 +99,59 @@ def test_send_whatsapp_pdf_returns_none_on_failure(mock_cloudinary_upload):
     # Call the function and check the return value
     result_url = send_whatsapp_pdf(b"pdf-data", "test.pdf")
 
-    assert result_url is None 
\ No newline at end of file
+    assert result_url is None 
+
+
+@patch('app.main.handle_successful_payment')
+@patch('app.main.get_user_id_from_wallet', return_value='telegram:123')
+@patch('app.main.settle_circle_intent')
+def test_circle_webhook_handles_each_payment_intent_once(mock_settle, mock_lookup, mock_handle, client):
+    """
+    Tests that a completed Circle payment is handled only when the intent has
+    not already been settled by the poller or an earlier delivery.
+    """
+    payload = {'notification': {'type': 'payments', 'payment': {'id': 'pay_1', 'status': 'complete', 'paymentIntentId': 'intent_1'}}}
+
+    mock_settle.return_value = True
+    assert client.post('/circle-webhook', json=payload).status_code == 200
+    mock_handle.assert_called_once_with('telegram:123')
+
+    mock_settle.return_value = False
+    assert client.post('/circle-webhook', json=payload).status_code == 200
+    mock_handle.assert_called_once()
+
+
+@patch('app.main.handle_successful_payment')
+@patch('app.main.get_user_id_from_wallet')
+@patch('app.main.settle_circle_intent')
+def test_circle_webhook_leaves_intent_unsettled_when_it_cannot_be_handled(mock_settle, mock_lookup, mock_handle, client):
+    """
+    Tests that a missing user mapping does not settle the intent, and that a
+    Redis error while settling asks Circle to retry.
+    """
+    payload = {'notification': {'type': 'payments', 'payment': {'id': 'pay_1', 'status': 'complete', 'paymentIntentId': 'intent_1'}}}
+
+    mock_lookup.return_value = None
+    assert client.post('/circle-webhook', json=payload).status_code == 404
+    mock_settle.assert_not_called()
+
+    mock_lookup.return_value = 'telegram:123'
+    mock_settle.return_value = None
+    assert client.post('/circle-webhook', json=payload).status_code == 503
+    mock_handle.assert_not_called()
+
+
+@patch('app.main.send_message')
+@patch('app.main.save_session')
+@patch('app.main.load_session', return_value=("AWAITING_PAYMENT", [], [], {}))
+def test_payment_without_a_stored_offer_tells_the_user(mock_load, mock_save, mock_send):
+    """
+    Tests that a paid user whose selected flight is missing is told to
+    contact support rather than hearing nothing.
+    """
+    from app.main import handle_successful_payment
+
+    handle_successful_payment('telegram:123')
+
+    assert "contact support" in mock_send.call_args[0][1]
+    mock_save.assert_not_called()
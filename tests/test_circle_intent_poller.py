@@ -0,0 +1,99 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from app.circle_intent_poller import CircleIntentPoller
+
+
+@pytest.fixture
+def mock_circle():
+    return MagicMock()
+
+
+@patch("app.circle_intent_poller.poller_pool")
+@patch("app.circle_intent_poller.get_user_id_from_wallet", return_value="telegram:1")
+@patch("app.circle_intent_poller.settle_circle_intent", return_value=True)
+@patch("app.circle_intent_poller.schedule_circle_intent")
+@patch("app.circle_intent_poller.get_due_circle_intents")
+@patch("app.circle_intent_poller.time.time", return_value=1000.0)
+def test_tick_dispatches_completed_and_reschedules_pending(mock_time, mock_due, mock_schedule, mock_settle, mock_lookup, mock_pool, mock_circle):
+    mock_due.return_value = {"intent_paid": 990.0, "intent_pending": 995.0}
+    mock_circle.get_payment_intent_status.side_effect = lambda intent_id: "complete" if intent_id == "intent_paid" else "pending"
+
+    poller = CircleIntentPoller(circle_service=mock_circle)
+    assert poller.tick() == 1
+
+    mock_settle.assert_called_once_with("intent_paid")
+    mock_lookup.assert_called_once_with("intent_paid")
+    mock_pool.submit.assert_called_once()
+    assert mock_pool.submit.call_args[0][1] == "telegram:1"
+    mock_schedule.assert_called_once_with("intent_pending", 1000.0 + poller.fast_interval)
+
+
+@patch("app.circle_intent_poller.poller_pool")
+@patch("app.circle_intent_poller.get_user_id_from_wallet", return_value="telegram:1")
+@patch("app.circle_intent_poller.settle_circle_intent", return_value=False)
+@patch("app.circle_intent_poller.get_due_circle_intents", return_value={"intent_paid": 990.0})
+@patch("app.circle_intent_poller.time.time", return_value=1000.0)
+def test_tick_skips_intent_settled_by_webhook(mock_time, mock_due, mock_settle, mock_lookup, mock_pool, mock_circle):
+    mock_circle.get_payment_intent_status.return_value = "complete"
+
+    poller = CircleIntentPoller(circle_service=mock_circle)
+
+    assert poller.tick() == 0
+    mock_settle.assert_called_once_with("intent_paid")
+    mock_pool.submit.assert_not_called()
+
+
+@pytest.mark.parametrize("user_id, settled", [(None, True), ("telegram:1", None)])
+@patch("app.circle_intent_poller.poller_pool")
+@patch("app.circle_intent_poller.get_user_id_from_wallet")
+@patch("app.circle_intent_poller.settle_circle_intent")
+@patch("app.circle_intent_poller.schedule_circle_intent")
+@patch("app.circle_intent_poller.get_due_circle_intents", return_value={"intent_paid": 990.0})
+@patch("app.circle_intent_poller.time.time", return_value=1000.0)
+def test_tick_keeps_polling_when_lookup_or_settle_fails(mock_time, mock_due, mock_schedule, mock_settle, mock_lookup, mock_pool, user_id, settled, mock_circle):
+    """A missing user mapping or a Redis error leaves the intent scheduled instead of losing the payment."""
+    mock_circle.get_payment_intent_status.return_value = "complete"
+    mock_lookup.return_value = user_id
+    mock_settle.return_value = settled
+
+    poller = CircleIntentPoller(circle_service=mock_circle)
+
+    assert poller.tick() == 0
+    if user_id is None:
+        mock_settle.assert_not_called()
+    mock_schedule.assert_called_once_with("intent_paid", 1000.0 + poller.fast_interval)
+    mock_pool.submit.assert_not_called()
+
+
+@patch("app.circle_intent_poller.drop_circle_intent")
+@patch("app.circle_intent_poller.get_due_circle_intents")
+@patch("app.circle_intent_poller.time.time", return_value=10000.0)
+def test_tick_drops_expired_intents_without_status_check(mock_time, mock_due, mock_drop, mock_circle):
+    mock_due.return_value = {"intent_old": 0.0}
+
+    poller = CircleIntentPoller(circle_service=mock_circle)
+    poller.timeout_seconds = 3600
+
+    assert poller.tick() == 0
+    mock_drop.assert_called_once_with("intent_old")
+    mock_circle.get_payment_intent_status.assert_not_called()
+
+
+@patch("app.circle_intent_poller.get_due_circle_intents", return_value={})
+def test_tick_without_due_intents_makes_no_api_calls(mock_due, mock_circle):
+    poller = CircleIntentPoller(circle_service=mock_circle)
+
+    assert poller.tick() == 0
+    mock_circle.get_payment_intent_status.assert_not_called()
+
+
+def test_next_interval_backs_off_after_fast_window():
+    poller = CircleIntentPoller()
+    poller.fast_interval, poller.fast_window, poller.max_interval = 5, 120, 120
+
+    assert poller.next_interval(30) == 5
+    assert poller.next_interval(120) == 5
+    assert poller.next_interval(240) == 10
+    assert poller.next_interval(360) == 20
+    assert poller.next_interval(3000) == 120
+
@@ -26,8 +26,8 @@ def circle_service():
     return CircleService()
 
 @patch('app.circle_service.time.sleep', return_value=None) # Mock sleep to speed up test
-@patch('app.circle_service.requests.get')
-@patch('app.circle_service.requests.post')
+@patch('app.circle_service.http_client.get')
+@patch('app.circle_service.http_client.post')
 def test_create_payment_intent_success(mock_post, mock_get, mock_sleep, circle_service):
     """
     Tests successful payment intent creation and polling for the address.
@@ -61,7 +61,7 @@ def test_create_payment_intent_success(mock_post, mock_get, mock_sleep, circle_s
     assert "paymentIntents/test_intent_id" in mock_get.call_args.args[0]
 
 
-@patch('app.circle_service.requests.post')
+@patch('app.circle_service.http_client.post')
 def test_create_payment_intent_fails_on_creation(mock_post, circle_service):
     """
     Tests when the initial POST to create an intent fails.
@@ -71,8 +71,8 @@ def test_create_payment_intent_fails_on_creation(mock_post, circle_service):
     assert result is None
 
 @patch('app.circle_service.time.sleep', return_value=None)
-@patch('app.circle_service.requests.get')
-@patch('app.circle_service.requests.post')
+@patch('app.circle_service.http_client.get')
+@patch('app.circle_service.http_client.post')
 def test_create_payment_intent_polling_times_out(mock_post, mock_get, mock_sleep, circle_service):
     """
     Tests when polling for the address times out.
@@ -103,7 +103,7 @@ def test_get_payment_intent_status_complete(circle_service):
     ]
     fake_data = {"data": {"timeline": fake_timeline}}
 
-    with patch("app.circle_service.requests.get", return_value=DummyResponse(fake_data)):
+    with patch("app.circle_service.http_client.get", return_value=DummyResponse(fake_data)):
         status = circle_service.get_payment_intent_status("intent_123")
 
     assert status == "complete"
@@ -113,7 +113,32 @@ def test_get_payment_intent_status_no_timeline(circle_service):
     """Returns None when timeline is missing or empty."""
     fake_data = {"data": {"timeline": []}}
 
-    with patch("app.circle_service.requests.get", return_value=DummyResponse(fake_data)):
+    with patch("app.circle_service.http_client.get", return_value=DummyResponse(fake_data)):
         status = circle_service.get_payment_intent_status("intent_456")
 
-    assert status is None 
\ No newline at end of file
+    assert status is None 
+
+@patch('app.circle_service.http_client.get')
+@patch('app.circle_service.http_client.post')
+def test_create_payment_intent_without_waiting_for_address(mock_post, mock_get, circle_service):
+    """
+    Tests that the non-blocking mode returns the intent right after creation.
+    """
+    mock_post.return_value = DummyResponse({"data": {"id": "test_intent_id"}})
+
+    result = circle_service.create_payment_intent(10.00, wait_for_address=False)
+
+    assert result == {"walletId": "test_intent_id", "address": None}
+    mock_get.assert_not_called()
+
+
+def test_get_deposit_address(circle_service):
+    """Returns the address once assigned and None while pending or on errors."""
+    with patch("app.circle_service.http_client.get", return_value=DummyResponse({"data": {"paymentMethods": [{"address": "0xabc"}]}})):
+        assert circle_service.get_deposit_address("intent_1") == "0xabc"
+
+    with patch("app.circle_service.http_client.get", return_value=DummyResponse({"data": {"paymentMethods": []}})):
+        assert circle_service.get_deposit_address("intent_1") is None
+
+    with patch("app.circle_service.http_client.get", side_effect=requests.exceptions.RequestException("boom")):
+        assert circle_service.get_deposit_address("intent_1") is None
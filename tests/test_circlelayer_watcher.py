@@ -0,0 +1,169 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from app.circlelayer_watcher import CircleLayerPaymentWatcher
+
+
+def _payment(address, initial_balance=0, expected_amount=100):
+    return {
+        "address": address,
+        "initial_balance": initial_balance,
+        "expected_amount": expected_amount,
+        "address_index": 0,
+        "created_at": 0,
+    }
+
+
+@pytest.fixture
+def mock_service():
+    svc = MagicMock()
+    svc.get_confirmed_block.return_value = 500
+    return svc
+
+
+@patch("app.circlelayer_watcher.poller_pool")
+@patch("app.circlelayer_watcher.claim_circlelayer_payment", return_value=True)
+@patch("app.circlelayer_watcher.list_circlelayer_payments")
+def test_tick_batches_balances_and_dispatches_paid_users(mock_list, mock_claim, mock_pool, mock_service):
+    mock_list.return_value = {
+        "telegram:1": _payment("0xaaa", initial_balance=10, expected_amount=100),
+        "telegram:2": _payment("0xbbb", initial_balance=0, expected_amount=100),
+    }
+    mock_service.get_native_balances.return_value = {"0xaaa": 110, "0xbbb": 50}
+
+    watcher = CircleLayerPaymentWatcher(service=mock_service, poll_interval=1, min_confirmations=3)
+    confirmed = watcher.tick()
+
+    assert confirmed == 1
+    # One confirmed-block lookup and one batched balance call for all addresses
+    mock_service.get_confirmed_block.assert_called_once_with(3)
+    mock_service.get_native_balances.assert_called_once_with(["0xaaa", "0xbbb"], 500)
+    mock_claim.assert_called_once_with("telegram:1")
+    mock_pool.submit.assert_called_once()
+    assert mock_pool.submit.call_args[0][1] == "telegram:1"
+
+
+@patch("app.circlelayer_watcher.poller_pool")
+@patch("app.circlelayer_watcher.claim_circlelayer_payment", return_value=False)
+@patch("app.circlelayer_watcher.list_circlelayer_payments")
+def test_tick_skips_payment_claimed_by_another_worker(mock_list, mock_claim, mock_pool, mock_service):
+    mock_list.return_value = {"telegram:1": _payment("0xaaa")}
+    mock_service.get_native_balances.return_value = {"0xaaa": 100}
+
+    watcher = CircleLayerPaymentWatcher(service=mock_service, poll_interval=1, min_confirmations=3)
+
+    assert watcher.tick() == 0
+    mock_pool.submit.assert_not_called()
+
+
+@patch("app.circlelayer_watcher.list_circlelayer_payments", return_value={})
+def test_tick_without_payments_makes_no_rpc_calls(mock_list, mock_service):
+    watcher = CircleLayerPaymentWatcher(service=mock_service, poll_interval=1, min_confirmations=3)
+
+    assert watcher.tick() == 0
+    mock_service.get_confirmed_block.assert_not_called()
+    mock_service.get_native_balances.assert_not_called()
+
+
+@patch("app.circlelayer_service.http_client.post")
+def test_get_native_balances_uses_single_batch_request(mock_post):
+    from app.circlelayer_service import CircleLayerService
+
+    mock_response = MagicMock()
+    mock_response.raise_for_status.return_value = None
+    mock_response.json.return_value = [
+        {"jsonrpc": "2.0", "id": 1, "result": "0x10"},
+        {"jsonrpc": "2.0", "id": 0, "result": "0x0"},
+    ]
+    mock_post.return_value = mock_response
+
+    svc = CircleLayerService(rpc_url="http://localhost:8545")
+    svc.w3 = MagicMock()
+    svc.active_rpc_url = "http://localhost:8545"
+    balances = svc.get_native_balances(["0xAAA", "0xbbb"], 255)
+
+    assert balances == {"0xaaa": 0, "0xbbb": 16}
+    mock_post.assert_called_once()
+    payload = mock_post.call_args[1]["json"]
+    assert [req["params"] for req in payload] == [["0xaaa", "0xff"], ["0xbbb", "0xff"]]
+
+
+def _token_payment(address, expected_amount=1000000, received=0):
+    payment = _payment(address, expected_amount=expected_amount)
+    payment.update({"token_address": "0xtoken", "received": received})
+    return payment
+
+
+@patch("app.circlelayer_watcher.poller_pool")
+@patch("app.circlelayer_watcher.save_indexer_cursor")
+@patch("app.circlelayer_watcher.get_indexer_cursor", return_value=None)
+@patch("app.circlelayer_watcher.credit_circlelayer_transfer")
+@patch("app.circlelayer_watcher.claim_circlelayer_payment", return_value=True)
+@patch("app.circlelayer_watcher.list_circlelayer_payments")
+def test_transfer_indexer_credits_matching_transfers(mock_list, mock_claim, mock_credit, mock_get_cursor, mock_save_cursor, mock_pool, mock_service, monkeypatch):
+    monkeypatch.setenv("CIRCLE_LAYER_INDEXER_LOOKBACK", "100")
+    mock_list.return_value = {
+        "telegram:1": _token_payment("0xaaa"),
+        "telegram:2": _token_payment("0xbbb"),
+    }
+    mock_service.get_transfer_logs.return_value = [
+        {"to": "0xaaa", "value": 1000000, "block_number": 450, "transfer_id": "0xtx1:0"},
+        {"to": "0xbbb", "value": 10, "block_number": 451, "transfer_id": "0xtx2:3"},
+    ]
+    mock_credit.side_effect = lambda user_id, transfer_id, value: value
+
+    watcher = CircleLayerPaymentWatcher(service=mock_service, poll_interval=1, min_confirmations=3)
+    confirmed = watcher.tick()
+
+    assert confirmed == 1
+    # One topic-filtered scan for every waiting address; no native balance calls
+    mock_service.get_transfer_logs.assert_called_once_with("0xtoken", 400, 500, ["0xaaa", "0xbbb"])
+    mock_service.get_native_balances.assert_not_called()
+    mock_claim.assert_called_once_with("telegram:1")
+    mock_save_cursor.assert_called_once_with("circlelayer_transfers:0xtoken", 500)
+
+
+@patch("app.circlelayer_watcher.poller_pool")
+@patch("app.circlelayer_watcher.save_indexer_cursor")
+@patch("app.circlelayer_watcher.get_indexer_cursor", return_value=489)
+@patch("app.circlelayer_watcher.credit_circlelayer_transfer")
+@patch("app.circlelayer_watcher.claim_circlelayer_payment", return_value=True)
+@patch("app.circlelayer_watcher.list_circlelayer_payments")
+def test_transfer_indexer_resumes_from_cursor_in_chunks(mock_list, mock_claim, mock_credit, mock_get_cursor, mock_save_cursor, mock_pool, mock_service, monkeypatch):
+    monkeypatch.setenv("CIRCLE_LAYER_INDEXER_MAX_RANGE", "5")
+    mock_list.return_value = {"telegram:1": _token_payment("0xaaa")}
+    mock_service.get_transfer_logs.return_value = []
+
+    watcher = CircleLayerPaymentWatcher(service=mock_service, poll_interval=1, min_confirmations=3)
+
+    assert watcher.tick() == 0
+    ranges = [c[0][1:3] for c in mock_service.get_transfer_logs.call_args_list]
+    assert ranges == [(490, 494), (495, 499), (500, 500)]
+    assert mock_save_cursor.call_args[0] == ("circlelayer_transfers:0xtoken", 500)
+    mock_claim.assert_not_called()
+
+
+@patch("app.circlelayer_service.Web3")
+def test_get_transfer_logs_filters_by_recipient_topic(mock_web3_cls):
+    from app.circlelayer_service import CircleLayerService, TRANSFER_EVENT_TOPIC
+
+    svc = CircleLayerService(rpc_url="http://localhost:8545")
+    svc.w3 = MagicMock()
+    svc.w3.to_checksum_address.side_effect = lambda a: a
+    svc.w3.eth.get_logs.return_value = [{
+        "topics": [TRANSFER_EVENT_TOPIC, "0x" + "0" * 64, "0x" + "0" * 24 + "aaaa" * 10],
+        "data": "0x" + "0" * 58 + "0f4240",
+        "blockNumber": 42,
+        "transactionHash": bytes.fromhex("ab" * 32),
+        "logIndex": 7,
+    }]
+
+    transfers = svc.get_transfer_logs("0xToken", 10, 20, ["0x" + "AAAA" * 10])
+
+    params = svc.w3.eth.get_logs.call_args[0][0]
+    assert params["topics"] == [TRANSFER_EVENT_TOPIC, None, ["0x" + "0" * 24 + "aaaa" * 10]]
+    assert transfers == [{
+        "to": "0x" + "aaaa" * 10,
+        "value": 1000000,
+        "block_number": 42,
+        "transfer_id": "0x" + "ab" * 32 + ":7",
+    }]
@@ -0,0 +1,82 @@
+import pytest
+from app.city_resolver import CityResolver, PrefixTrie, Place, edit_distance, TIER_CITY, TIER_FUZZY
+
+PLACES = [
+    Place('London', 'LON', 'GB', 'metro'),
+    Place('London', 'LHR', 'GB', 'city', False, True),
+    Place('London', 'LGW', 'GB', 'city'),
+    Place('London', 'YXU', 'CA', 'city'),
+    Place('heathrow', 'LHR', 'GB', 'airport'),
+    Place('Lagos', 'LOS', 'NG', 'city', True, True),
+    Place('Birmingham', 'BHX', 'GB', 'city', True),
+    Place('Birmingham', 'BHM', 'US', 'city', True),
+    Place('Frankfurt am Main', 'FRA', 'DE', 'city', False, True),
+    Place('Frankfort', 'FFT', 'US', 'city'),
+    Place('New York', 'NYC', 'US', 'metro'),
+    Place('New York', 'JFK', 'US', 'city', True, True),
+    Place('Dublin', 'DUB', 'IE', 'city', False, True),
+    Place('Dublin', 'DBN', 'US', 'city'),
+    Place('Dublin', 'PSK', 'US', 'city'),
+]
+
+
+@pytest.fixture(scope='module')
+def resolver():
+    return CityResolver(PLACES)
+
+
+def test_edit_distance_counts_transpositions_and_stops_at_limit():
+    assert edit_distance('london', 'londn', 2) == 1
+    assert edit_distance('lagos', 'lgaos', 2) == 1
+    assert edit_distance('lagos', 'dublin', 2) == 3
+
+
+def test_prefix_trie_keeps_best_values_per_prefix():
+    trie = PrefixTrie(best_per_node=2)
+    for value, key in enumerate(['frankfurt am main', 'frankfort', 'france', 'paris']):
+        trie.insert(key, value)
+    assert trie.best('fran') == [0, 1]
+    assert trie.best('frankfo') == [1]
+    assert trie.best('paris') == [3]
+    assert trie.best('x') == []
+
+
+def test_exact_city_prefers_metro_code(resolver):
+    candidates = resolver.candidates('london')
+    assert [c.code for c in candidates][:3] == ['LON', 'LHR', 'LGW']
+    assert candidates[0].tier == TIER_CITY
+    assert resolver.resolve('London') == 'LON'
+
+
+def test_hub_outranks_more_airports_in_another_country(resolver):
+    assert resolver.resolve('Dublin') == 'DUB'
+
+
+def test_country_qualifier_and_trailing_country(resolver):
+    assert resolver.resolve('London, CA') == 'YXU'
+    assert resolver.resolve('Birmingham, UK') == 'BHX'
+    assert resolver.resolve('birmingham united states') == 'BHM'
+    assert resolver.resolve('Lagos, Nigeria') == 'LOS'
+
+
+def test_ambiguous_name_is_not_resolved(resolver):
+    assert resolver.resolve('Birmingham') is None
+    assert {c.code for c in resolver.candidates('Birmingham')} == {'BHX', 'BHM'}
+
+
+def test_noise_words_prefixes_and_airport_names(resolver):
+    assert resolver.resolve('new york city') == 'NYC'
+    assert resolver.resolve('Frankfurt') == 'FRA'
+    assert resolver.resolve('Londo') == 'LON'
+    assert resolver.resolve('Heathrow') == 'LHR'
+    assert resolver.resolve('JFK') == 'JFK'
+
+
+def test_typos_are_matched_within_edit_limit(resolver):
+    candidates = resolver.candidates('Lgaos')
+    assert candidates[0].code == 'LOS'
+    assert candidates[0].tier == TIER_FUZZY
+    assert candidates[0].distance == 1
+    assert resolver.resolve('Londn') == 'LON'
+    assert resolver.resolve('Atlantis') is None
+    assert resolver.resolve('') is None
@@ -0,0 +1,82 @@
+from app.conversation_context import ConversationContext, SUMMARY_PREFIX, estimate_tokens
+
+
+def make_turns(n):
+    turns = []
+    for i in range(n):
+        turns.append({"role": "user", "content": f"user message {i}"})
+        turns.append({"role": "assistant", "content": f"assistant reply {i}"})
+    return turns
+
+
+def test_set_system_prompt_keeps_a_single_system_message():
+    history = [{"role": "system", "content": "gather"}, {"role": "user", "content": "hi"},
+               {"role": "system", "content": "confirm"}, {"role": "system", "content": "gather"}]
+    ConversationContext.set_system_prompt(history, "confirm")
+    assert history == [{"role": "system", "content": "confirm"}, {"role": "user", "content": "hi"}]
+
+
+def test_short_conversations_are_sent_whole():
+    context = ConversationContext(window_turns=3, summary_max_chars=500)
+    history = [{"role": "system", "content": "prompt"}] + make_turns(2)
+    assert context.build_messages(history) == history
+
+
+def test_older_turns_are_summarized_into_the_system_prompt():
+    context = ConversationContext(window_turns=1, summary_max_chars=500)
+    history = [{"role": "system", "content": "prompt"}] + make_turns(3)
+    history[4] = {"role": "assistant", "content": "Flying Lagos to London on 2025-09-15. [INFO_COMPLETE]"}
+    history += make_turns(3)[:1] + [{"role": "user", "content": "actually, make it two travelers"}]
+
+    messages = context.build_messages(history)
+
+    assert [m["role"] for m in messages].count("system") == 1
+    assert messages[1:] == history[-2:]
+    summary = messages[0]["content"]
+    assert summary.startswith("prompt\n\n" + SUMMARY_PREFIX)
+    # The last restatement and what the user said after it; nothing older.
+    assert "- assistant: Flying Lagos to London on 2025-09-15." in summary
+    assert "user message 2" in summary
+    assert "user message 1" not in summary and "[INFO_COMPLETE]" not in summary
+
+
+def test_details_stated_early_survive_the_window():
+    context = ConversationContext(window_turns=1, summary_max_chars=60)
+    history = [{"role": "system", "content": "prompt"}, {"role": "user", "content": "Lagos to London on 2 November, two of us"}]
+    history += make_turns(20) + [{"role": "user", "content": "names are Ada Obi and Ben Obi"}]
+    known = {"destination": "LHR", "origin": "LOS", "departure_date": "2026-11-02", "return_date": None,
+             "number_of_travelers": 2, "traveler_names": ["Ada Obi", "Ben Obi"], "non_stop": False}
+
+    messages = context.build_messages(history, known)
+
+    assert messages[1:] == history[-2:]
+    assert messages[0]["content"] == (f"prompt\n\n{SUMMARY_PREFIX}\nKnown: origin=LOS, destination=LHR, departure_date=2026-11-02, "
+                                      "number_of_travelers=2, traveler_names=Ada Obi and Ben Obi")
+    assert "user message" not in messages[0]["content"]
+
+
+def test_summary_keeps_the_most_recent_lines_within_budget():
+    context = ConversationContext(window_turns=1, summary_max_chars=len(SUMMARY_PREFIX) + 40)
+    summary = context.summarize(make_turns(10))
+    assert summary.endswith("- user: user message 9")
+    assert "user message 0" not in summary
+
+
+def test_usage_is_recorded_per_kind():
+    context = ConversationContext(window_turns=1, summary_max_chars=100)
+    history = make_turns(10)
+    messages = history[-2:]
+
+    class Usage:
+        prompt_tokens, completion_tokens = 30, 7
+
+    class Response:
+        usage = Usage()
+
+    context.record("reply", messages, history, Response())
+    context.record("extraction", messages)
+    stats = context.stats()
+    assert stats["reply"]["calls"] == 1
+    assert stats["reply"]["prompt_tokens"] == 30 and stats["reply"]["completion_tokens"] == 7
+    assert stats["reply"]["estimated_tokens_saved"] == estimate_tokens(history) - estimate_tokens(messages)
+    assert stats["extraction"]["estimated_tokens_saved"] == 0
@@ -110,11 +110,11 @@ def test_awaiting_class_selection_invalid_input(mock_save_session, mock_load_ses
     
     mock_save_session.assert_called_with("user1", "AWAITING_CLASS_SELECTION", ["history"], [], flight_details)
 
-@patch("threading.Thread")
+@patch("app.core_logic.search_pool")
 @patch("app.core_logic.load_session")
 @patch("app.core_logic.save_session")
 @patch("app.core_logic.get_ai_response")
-def test_process_message_awaiting_confirmation_triggers_task_on_confirm(mock_get_ai, mock_save_session, mock_load_session, mock_thread):
+def test_process_message_awaiting_confirmation_triggers_task_on_confirm(mock_get_ai, mock_save_session, mock_load_session, mock_search_pool):
     """
     Tests that the AWAITING_CONFIRMATION state triggers the task when the AI confirms.
     """
@@ -124,22 +124,17 @@ def test_process_message_awaiting_confirmation_triggers_task_on_confirm(mock_get
     mock_load_session.return_value = ("AWAITING_CONFIRMATION", ["history"], [], flight_details)
     mock_get_ai.return_value = ("[CONFIRMED]", ["history", {"role": "assistant", "content": "[CONFIRMED]"}])
     
-    # Mock the thread object
-    mock_thread_instance = MagicMock()
-    mock_thread.return_value = mock_thread_instance
+    mock_search_pool.submit.return_value = True
 
     response = process_message(user_id, "yeap", MagicMock())
     
-    mock_get_ai.assert_called_once_with("yeap", ["history"], "AWAITING_CONFIRMATION")
+    mock_get_ai.assert_called_once_with("yeap", ["history"], "AWAITING_CONFIRMATION", flight_details)
     
     # Check for immediate user feedback
     assert response[0] == "Okay, I'm searching for the best flights for you. This might take a moment..."
     
-    # Check that a thread was created with the correct target and arguments
-    mock_thread.assert_called_once_with(target=ANY, args=(user_id, flight_details))
-    
-    # Check that the thread was started
-    mock_thread_instance.start.assert_called_once()
+    # Check that the search was queued on the search pool with the correct arguments
+    mock_search_pool.submit.assert_called_once_with(ANY, user_id, flight_details)
     
     # Check that the state was updated to SEARCH_IN_PROGRESS
     mock_save_session.assert_called_with(user_id, "SEARCH_IN_PROGRESS", ["history", {"role": "assistant", "content": "[CONFIRMED]"}], [], flight_details)
@@ -162,8 +157,8 @@ def test_process_message_awaiting_confirmation_handles_correction_and_re_asks_cl
     updated_history = ["history", {"role": "assistant", "content": ai_correction_response}]
     mock_get_ai.return_value = (ai_correction_response, updated_history)
     
-    # The new extracted details do NOT have a travel class
-    corrected_details = {'origin': 'LHR', 'destination': 'JFK'}
+    # The new extracted details clear the travel class
+    corrected_details = {'origin': 'LHR', 'destination': 'JFK', 'travel_class': None}
     mock_extract_details.return_value = corrected_details
     
     response = process_message(user_id, "no, to JFK", MagicMock())
@@ -172,7 +167,29 @@ def test_process_message_awaiting_confirmation_handles_correction_and_re_asks_cl
     assert "What class would you like to fly?" in response[0]
     
     # Check that the state is now AWAITING_CLASS_SELECTION
-    mock_save_session.assert_called_with(user_id, "AWAITING_CLASS_SELECTION", ANY, [], corrected_details)
+    mock_save_session.assert_called_with(user_id, "AWAITING_CLASS_SELECTION", ANY, [], {'origin': 'LHR', 'destination': 'JFK'})
+
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+@patch("app.core_logic.get_ai_response")
+@patch("app.core_logic.extract_flight_details_from_history")
+def test_correction_with_null_details_keeps_the_known_ones(mock_extract_details, mock_get_ai, mock_save_session, mock_load_session):
+    """A null from the model only clears an optional detail; required ones keep their value."""
+    initial_details = {'origin': 'LHR', 'destination': 'CDG', 'departure_date': '2099-12-15', 'return_date': '2099-12-20',
+                       'number_of_travelers': 2, 'traveler_names': ['Ada Obi', 'Ben Obi'], 'travel_class': 'ECONOMY'}
+    mock_load_session.return_value = ("AWAITING_CONFIRMATION", ["history"], [], initial_details)
+    mock_get_ai.return_value = ("One way to JFK then. [INFO_COMPLETE]", ["history"])
+    mock_extract_details.return_value = {'destination': 'JFK', 'return_date': None,
+                                         'number_of_travelers': None, 'traveler_names': None}
+
+    response = process_message("user1", "no, one way to JFK", MagicMock())
+
+    expected = {key: value for key, value in initial_details.items() if key != 'return_date'}
+    expected['destination'] = 'JFK'
+    assert "Travelers: Ada Obi, Ben Obi" in response[0]
+    assert "None" not in response[0]
+    mock_save_session.assert_called_with("user1", "AWAITING_CONFIRMATION", ANY, [], expected)
 
 @patch("app.core_logic.load_session")
 @patch("app.core_logic.save_session")
@@ -188,7 +205,26 @@ def test_process_message_search_in_progress(mock_save_session, mock_load_session
 
     assert len(response) == 1
     assert "I'm still looking for flights" in response[0]
-    mock_save_session.assert_called_once_with(user_id, "SEARCH_IN_PROGRESS", ["history"], [], {})
+    mock_save_session.assert_not_called()
+
+def test_search_in_progress_reply_keeps_results_saved_meanwhile(mock_redis):
+    """Results the search saves after this message loaded the session are not overwritten."""
+    user_id = "telegram:1"
+    save_session(user_id, "SEARCH_IN_PROGRESS", ["history"], [], {"origin": "LHR"})
+    offers = [{"id": "1", "price": {"total": "100", "currency": "USD"}}]
+
+    def load_then_search_finishes(uid):
+        loaded = load_session(uid)
+        save_session(uid, "FLIGHT_SELECTION", ["history"], offers, {"origin": "LHR"})
+        return loaded
+
+    with patch("app.core_logic.load_session", side_effect=load_then_search_finishes):
+        response = process_message(user_id, "are you done yet?", MagicMock())
+
+    assert "I'm still looking for flights" in response[0]
+    state, _, stored_offers, _ = load_session(user_id)
+    assert state == "FLIGHT_SELECTION"
+    assert list(stored_offers) == offers
 
 @patch("app.core_logic.load_session")
 @patch("app.core_logic.save_session")
@@ -216,6 +252,18 @@ def test_flight_selection_creates_payment_link(mock_create_checkout, mock_save_s
     # Check that the session was updated correctly to the new state
     mock_save_session.assert_called_once_with(user_id, "AWAITING_PAYMENT_SELECTION", ["history"], [flight_offers[0]], {})
 
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+def test_flight_selection_with_expired_offers_starts_over(mock_save_session, mock_load_session):
+    """Offers that expired before a choice send the user back to search instead of looping."""
+    mock_load_session.return_value = ("FLIGHT_SELECTION", ["history"], [], {"origin": "LHR"})
+
+    response = process_message("user1", "1", MagicMock())
+
+    assert "expired" in response[0]
+    mock_save_session.assert_called_once_with("user1", "GATHERING_INFO", [], [], {})
+
 @patch("app.core_logic.load_session")
 @patch("app.core_logic.save_session")
 @patch("app.core_logic.extract_flight_details_from_history")
@@ -271,11 +319,11 @@ def test_awaiting_payment_selection_card(mock_create_checkout, mock_save_session
     mock_create_checkout.assert_called_once_with(selected_flight[0], user_id)
     mock_save_session.assert_called_once_with(user_id, "AWAITING_PAYMENT", ["history"], selected_flight, {})
 
-@patch("threading.Thread")
+@patch("app.core_logic.search_pool")
 @patch("app.core_logic.load_session")
 @patch("app.core_logic.save_session")
 @patch("app.core_logic.get_ai_response")
-def test_process_message_confirmation_parses_date_before_task(mock_get_ai, mock_save_session, mock_load_session, mock_thread, monkeypatch):
+def test_process_message_confirmation_parses_date_before_task(mock_get_ai, mock_save_session, mock_load_session, mock_search_pool, monkeypatch):
     """
     Tests that a human-readable date is correctly parsed and reformatted
     to YYYY-MM-DD before being passed to the flight search task.
@@ -285,10 +333,10 @@ def test_process_message_confirmation_parses_date_before_task(mock_get_ai, mock_
     mock_load_session.return_value = ("AWAITING_CONFIRMATION", [], [], flight_details)
     mock_get_ai.return_value = ("[CONFIRMED]", [])
 
-    # We need to correctly mock the thread's target function to inspect its arguments
+    # We need to correctly mock the pool's job function to inspect its arguments
     mock_search_task = MagicMock()
-    # Configure the mock_thread to use our mock task as the target
-    mock_thread.side_effect = lambda target, args: target(*args) # This allows the task to run in the test thread
+    # Run submitted jobs inline so the task executes in the test thread
+    mock_search_pool.submit.side_effect = lambda fn, *args: fn(*args) or True
     monkeypatch.setattr("app.core_logic.search_flights_task", mock_search_task)
 
 
@@ -329,8 +377,8 @@ def test_awaiting_payment_selection_usdc(monkeypatch):
     mock_currency_service.convert_to_usd.return_value = 165.00
     monkeypatch.setattr("app.core_logic.currency_service", mock_currency_service)
     
-    mock_thread = MagicMock()
-    monkeypatch.setattr("threading.Thread", mock_thread)
+    mock_intent_poller = MagicMock()
+    monkeypatch.setattr("app.core_logic.circle_intent_poller", mock_intent_poller)
 
     # Action
     responses = process_message(user_id, "usdc", amadeus_service=MagicMock())
@@ -345,7 +393,8 @@ def test_awaiting_payment_selection_usdc(monkeypatch):
     mock_load_session.assert_called_once_with(user_id)
     mock_circle_service.create_payment_intent.assert_called_once_with(10.00)
     mock_save_wallet.assert_called_once_with("mock-wallet-id", user_id)
-    mock_thread.assert_called_once()
+    mock_intent_poller.register.assert_called_once_with("mock-wallet-id", user_id)
+    mock_intent_poller.start.assert_called_once()
     
     # Verify the final state was saved correctly
     mock_save_session.assert_called_with(
@@ -356,14 +405,69 @@ def test_awaiting_payment_selection_usdc(monkeypatch):
         {'expected_usd_amount': 10.00}
     )
 
+def test_awaiting_payment_selection_usdc_async(monkeypatch):
+    """In async mode the intent is created without waiting and the address is delivered by a background task."""
+    user_id = "test_user_usdc_async"
+    selected_flight = {"price": {"total": "150.00", "currency": "EUR"}}
+    monkeypatch.setenv("CIRCLE_ASYNC_PAYMENT_INTENTS", "true")
+
+    mock_save_session = MagicMock()
+    mock_save_wallet = MagicMock()
+    monkeypatch.setattr("app.core_logic.load_session", MagicMock(return_value=("AWAITING_PAYMENT_SELECTION", [], [selected_flight], {})))
+    monkeypatch.setattr("app.core_logic.save_session", mock_save_session)
+    monkeypatch.setattr("app.core_logic.save_wallet_mapping", mock_save_wallet)
+
+    mock_circle_service = MagicMock()
+    mock_circle_service.create_payment_intent.return_value = {"walletId": "mock-wallet-id", "address": None}
+    monkeypatch.setattr("app.core_logic.circle_service", mock_circle_service)
+    mock_poller_pool = MagicMock()
+    # The task must find the mapping and the new state when it starts.
+    mock_poller_pool.submit.side_effect = lambda *args: mock_save_wallet.called and mock_save_session.called
+    monkeypatch.setattr("app.core_logic.poller_pool", mock_poller_pool)
+    mock_intent_poller = MagicMock()
+    monkeypatch.setattr("app.core_logic.circle_intent_poller", mock_intent_poller)
+
+    responses = process_message(user_id, "usdc", amadeus_service=MagicMock())
+
+    assert len(responses) == 1
+    assert "send it here in a moment" in responses[0]
+    mock_circle_service.create_payment_intent.assert_called_once_with(10.00, wait_for_address=False)
+    submit_args = mock_poller_pool.submit.call_args.args
+    assert submit_args[1:4] == (user_id, "mock-wallet-id", 10.00)
+    mock_save_wallet.assert_called_once_with("mock-wallet-id", user_id)
+    mock_intent_poller.register.assert_called_once_with("mock-wallet-id", user_id)
+    mock_save_session.assert_called_with(user_id, "AWAITING_USDC_PAYMENT", [], [selected_flight], {'expected_usd_amount': 10.00})
+
+
+def test_awaiting_payment_selection_usdc_async_rejected_task_keeps_payment_selection(monkeypatch):
+    """If the delivery task cannot be queued, the session saved for it is reverted."""
+    selected_flight = {"price": {"total": "150.00", "currency": "EUR"}}
+    monkeypatch.setenv("CIRCLE_ASYNC_PAYMENT_INTENTS", "true")
+    mock_save_session = MagicMock()
+    monkeypatch.setattr("app.core_logic.load_session", MagicMock(return_value=("AWAITING_PAYMENT_SELECTION", [], [selected_flight], {})))
+    monkeypatch.setattr("app.core_logic.save_session", mock_save_session)
+    monkeypatch.setattr("app.core_logic.save_wallet_mapping", MagicMock())
+    mock_circle_service = MagicMock()
+    mock_circle_service.create_payment_intent.return_value = {"walletId": "mock-wallet-id", "address": None}
+    monkeypatch.setattr("app.core_logic.circle_service", mock_circle_service)
+    monkeypatch.setattr("app.core_logic.poller_pool", MagicMock(**{"submit.return_value": False}))
+    mock_intent_poller = MagicMock()
+    monkeypatch.setattr("app.core_logic.circle_intent_poller", mock_intent_poller)
+
+    responses = process_message("user1", "usdc", amadeus_service=MagicMock())
+
+    assert "couldn't generate a USDC payment address" in responses[0]
+    mock_intent_poller.register.assert_not_called()
+    mock_save_session.assert_called_with("user1", "AWAITING_PAYMENT_SELECTION", [], [selected_flight], {})
+
 @patch("app.core_logic.load_session")
 @patch("app.core_logic.save_session")
-@patch("threading.Thread")
+@patch("app.core_logic.circlelayer_watcher")
 @patch("app.core_logic.save_evm_mapping")
 @patch("app.core_logic.save_circlelayer_payment_info")
 @patch("app.core_logic.get_next_address_index", return_value=0)
 @patch("app.core_logic.circlelayer_service.CircleLayerService")
-def test_awaiting_payment_selection_circle_layer(mock_circlelayer_service, mock_get_index, mock_save_payment_info, mock_save_evm, mock_thread, mock_save_session, mock_load_session):
+def test_awaiting_payment_selection_circle_layer(mock_circlelayer_service, mock_get_index, mock_save_payment_info, mock_save_evm, mock_watcher, mock_save_session, mock_load_session):
     user_id = "test_user_clayer"
     selected_flight = [{"price": {"total": "200.00", "currency": "USD"}}]
     mock_load_session.return_value = ("AWAITING_PAYMENT_SELECTION", [], selected_flight, {})
@@ -390,9 +494,13 @@ def test_awaiting_payment_selection_circle_layer(mock_circlelayer_service, mock_
         address="0xDEPOSIT",
         initial_balance=0,
         expected_amount=1000000000000000000,
-        address_index=0
+        address_index=0,
+        token_address=None
     )
     
+    # The shared watcher is started instead of a per-payment poller
+    mock_watcher.start.assert_called_once()
+
     # Verify session was saved with new fields
     mock_save_session.assert_called_with(user_id, "AWAITING_CIRCLE_LAYER_PAYMENT", [], selected_flight, {
         'circlelayer': {
@@ -422,12 +530,12 @@ def test_awaiting_payment_selection_invalid(mock_save_session, mock_load_session
 
 @patch("app.core_logic.load_session")
 @patch("app.core_logic.save_session")
-@patch("threading.Thread")
+@patch("app.core_logic.circlelayer_watcher")
 @patch("app.core_logic.save_evm_mapping")
 @patch("app.core_logic.save_circlelayer_payment_info")
 @patch("app.core_logic.get_next_address_index", return_value=0)
 @patch("app.core_logic.circlelayer_service.CircleLayerService")
-def test_awaiting_payment_selection_onchain_case_insensitive(mock_circlelayer_service, mock_get_index, mock_save_payment_info, mock_save_evm, mock_thread, mock_save_session, mock_load_session):
+def test_awaiting_payment_selection_onchain_case_insensitive(mock_circlelayer_service, mock_get_index, mock_save_payment_info, mock_save_evm, mock_watcher, mock_save_session, mock_load_session):
     """
     Tests that "on-chain" payment selection works with different case variations.
     """
@@ -453,4 +561,210 @@ def test_awaiting_payment_selection_onchain_case_insensitive(mock_circlelayer_se
         
         assert len(responses) == 2, f"Should return two messages for input '{test_input}'"
         assert "please send exactly 1.00 CLAYER" in responses[0], f"Should contain CLAYER message for input '{test_input}'"
-        assert responses[1] == "0xDEPOSIT", f"Should return deposit address for input '{test_input}'" 
\ No newline at end of file
+        assert responses[1] == "0xDEPOSIT", f"Should return deposit address for input '{test_input}'" 
+@patch("app.core_logic.search_pool")
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+@patch("app.core_logic.get_ai_response")
+def test_confirmation_when_search_pool_is_full(mock_get_ai, mock_save_session, mock_load_session, mock_search_pool):
+    """
+    Tests that a rejected search job leaves the user in AWAITING_CONFIRMATION with a busy message.
+    """
+    user_id = "test_user_busy"
+    flight_details = {'origin': 'London', 'destination': 'Paris', 'travel_class': 'ECONOMY'}
+    mock_load_session.return_value = ("AWAITING_CONFIRMATION", ["history"], [], flight_details)
+    mock_get_ai.return_value = ("[CONFIRMED]", ["history", {"role": "assistant", "content": "[CONFIRMED]"}])
+    mock_search_pool.submit.return_value = False
+
+    response = process_message(user_id, "yes", MagicMock())
+
+    assert "handling a lot of requests" in response[0]
+    mock_save_session.assert_called_with(user_id, "AWAITING_CONFIRMATION", ["history"], [], flight_details)
+
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+@patch("app.core_logic.extract_flight_details_from_history")
+@patch("app.core_logic.get_ai_response")
+def test_complete_details_skip_the_model(mock_get_ai, mock_extract, mock_save_session, mock_load_session):
+    """A message that states every required detail is handled without model calls."""
+    from app.slot_extractor import get_slot_extractor_stats
+    before = get_slot_extractor_stats()["llm_calls_avoided"]
+    mock_load_session.return_value = ("GATHERING_INFO", [], [], {})
+
+    response = process_message("user1", "My name is David Ugbodaga. Fly me from Lagos to London on 15 December 2099, just me", MagicMock())
+
+    mock_get_ai.assert_not_called()
+    mock_extract.assert_not_called()
+    assert "What class would you like to fly?" in response[0]
+    details = mock_save_session.call_args[0][4]
+    assert details == {"origin": "Lagos", "destination": "London", "departure_date": "2099-12-15",
+                       "number_of_travelers": 1, "traveler_name": "David Ugbodaga"}
+    history = mock_save_session.call_args[0][2]
+    assert "[INFO_COMPLETE]" in history[1]["content"]
+    assert get_slot_extractor_stats()["llm_calls_avoided"] == before + 2
+
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+@patch("app.core_logic.extract_flight_details_from_history")
+@patch("app.core_logic.get_ai_response")
+def test_gathering_keeps_slot_state_in_the_session(mock_get_ai, mock_extract, mock_save_session, mock_load_session):
+    """Each turn parses only the new message and stores the merged details."""
+    history = [{"role": "user", "content": "From Lagos to London"},
+               {"role": "assistant", "content": "How many people are travelling?"}]
+    mock_load_session.return_value = ("GATHERING_INFO", history, [], {"origin": "Lagos", "destination": "London"})
+    mock_get_ai.return_value = ("When would you like to depart?", history + ["turn"])
+
+    process_message("user1", "two", MagicMock())
+
+    mock_extract.assert_not_called()
+    mock_save_session.assert_called_once_with("user1", "GATHERING_INFO", history + ["turn"], [],
+                                              {"origin": "Lagos", "destination": "London", "number_of_travelers": 2})
+
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+@patch("app.core_logic.extract_flight_details_from_history")
+@patch("app.core_logic.get_ai_response")
+def test_info_complete_extracts_from_the_known_details(mock_get_ai, mock_extract, mock_save_session, mock_load_session):
+    """The model updates the stored details; what it leaves out is kept."""
+    known = {"origin": "Lagos", "destination": "London", "departure_date": "2099-12-15"}
+    mock_load_session.return_value = ("GATHERING_INFO", [], [], known)
+    mock_get_ai.return_value = ("Thanks, Ada. [INFO_COMPLETE]", ["history"])
+    mock_extract.return_value = {"traveler_name": "Ada", "destination": "Paris"}
+
+    process_message("user1", "I'm travelling alone, name's Ada", MagicMock())
+
+    slots = dict(known, number_of_travelers=1)
+    assert mock_extract.call_args.kwargs == {"known_details": slots}
+    assert mock_save_session.call_args[0][4] == dict(slots, traveler_name="Ada", destination="Paris")
+
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.get_ai_response")
+def test_details_left_from_a_search_do_not_skip_the_model(mock_get_ai, mock_load_session):
+    """Complete details already in the session only skip the model once the user changes one."""
+    details = {"origin": "Lagos", "destination": "London", "departure_date": "2099-12-15",
+               "number_of_travelers": 1, "traveler_name": "David Ugbodaga"}
+    mock_load_session.return_value = ("GATHERING_INFO", [], [], details)
+    mock_get_ai.return_value = ("Which date would you like to try instead?", ["history"])
+
+    with patch("app.core_logic.save_session"):
+        response = process_message("user1", "hmm, what now?", MagicMock())
+
+    assert response == ["Which date would you like to try instead?"]
+
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+@patch("app.core_logic.extract_flight_details_from_history")
+@patch("app.core_logic.get_ai_response_with_details")
+def test_combined_turn_skips_the_extraction_call(mock_combined, mock_extract, mock_save_session, mock_load_session, monkeypatch):
+    """With AI_COMBINED_TURN the details come with the reply."""
+    monkeypatch.setenv("AI_COMBINED_TURN", "true")
+    details = {"origin": "BOS", "destination": "LHR", "number_of_travelers": 1}
+    mock_load_session.return_value = ("GATHERING_INFO", [], [], {})
+    mock_combined.return_value = ("Boston to London. [INFO_COMPLETE]", ["history"], details)
+
+    response = process_message("user1", "hmm", MagicMock())
+
+    mock_combined.assert_called_once_with("hmm", [], "GATHERING_INFO", {})
+    mock_extract.assert_not_called()
+    assert "What class would you like to fly?" in response[0]
+    mock_save_session.assert_called_once_with("user1", "AWAITING_CLASS_SELECTION", ANY, [], details)
+
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+@patch("app.core_logic.extract_flight_details_from_history")
+@patch("app.core_logic.get_ai_response_with_details")
+def test_combined_turn_fallback_extracts_separately(mock_combined, mock_extract, mock_save_session, mock_load_session, monkeypatch):
+    """A combined call that fell back to a plain reply still gets its details extracted."""
+    monkeypatch.setenv("AI_COMBINED_TURN", "true")
+    details = {"origin": "LHR", "destination": "JFK", "travel_class": "ECONOMY"}
+    mock_load_session.return_value = ("AWAITING_CONFIRMATION", ["history"], [], {"origin": "LHR", "destination": "CDG"})
+    mock_combined.return_value = ("To JFK then. [INFO_COMPLETE]", ["history"], None)
+    mock_extract.return_value = details
+
+    process_message("user1", "no, to JFK", MagicMock())
+
+    mock_extract.assert_called_once()
+    assert mock_save_session.call_args[0][4] == details
+
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+@patch("app.core_logic.extract_flight_details_from_history")
+@patch("app.core_logic.get_ai_response_with_details")
+def test_combined_turn_details_are_merged_into_the_known_ones(mock_combined, mock_extract, mock_save_session, mock_load_session, monkeypatch):
+    """A correction's details keep whatever the model left out."""
+    monkeypatch.setenv("AI_COMBINED_TURN", "true")
+    known = {"origin": "LHR", "destination": "CDG", "travel_class": "BUSINESS", "traveler_name": "Ada Obi"}
+    mock_load_session.return_value = ("AWAITING_CONFIRMATION", ["history"], [], dict(known))
+    mock_combined.return_value = ("To JFK then. [INFO_COMPLETE]", ["history"], {"destination": "JFK"})
+
+    response = process_message("user1", "no, to JFK", MagicMock())
+
+    mock_extract.assert_not_called()
+    assert "Please confirm the updated details" in response[0]
+    assert mock_save_session.call_args[0][4] == dict(known, destination="JFK")
+
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+@patch("app.core_logic.extract_flight_details_from_history")
+@patch("app.core_logic.get_ai_response_with_details")
+def test_combined_turn_nulls_do_not_wipe_known_details(mock_combined, mock_extract, mock_save_session, mock_load_session, monkeypatch):
+    """A null in the combined details keeps a slot filled earlier."""
+    monkeypatch.setenv("AI_COMBINED_TURN", "true")
+    mock_load_session.return_value = ("GATHERING_INFO", [], [], {"origin": "Lagos", "return_date": "2099-12-20"})
+    mock_combined.return_value = ("Lagos to London. [INFO_COMPLETE]", ["history"],
+                                  {"origin": None, "destination": "London", "number_of_travelers": 1, "return_date": None})
+
+    process_message("user1", "hmm", MagicMock())
+
+    mock_extract.assert_not_called()
+    assert mock_save_session.call_args[0][4] == {"origin": "Lagos", "destination": "London", "number_of_travelers": 1}
+
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+@patch("app.core_logic.extract_flight_details_from_history")
+@patch("app.core_logic.get_ai_response_with_details")
+def test_combined_correction_nulls_do_not_reach_the_summary(mock_combined, mock_extract, mock_save_session, mock_load_session, monkeypatch):
+    """A correction whose combined details null a required slot still shows the known value."""
+    monkeypatch.setenv("AI_COMBINED_TURN", "true")
+    known = {"origin": "LHR", "destination": "CDG", "travel_class": "BUSINESS", "traveler_name": "Ada Obi"}
+    mock_load_session.return_value = ("AWAITING_CONFIRMATION", ["history"], [], dict(known))
+    mock_combined.return_value = ("To JFK then. [INFO_COMPLETE]", ["history"], {"destination": "JFK", "traveler_name": None})
+
+    response = process_message("user1", "no, to JFK", MagicMock())
+
+    assert "- Traveler: Ada Obi" in response[0]
+    assert mock_save_session.call_args[0][4] == dict(known, destination="JFK")
+
+
+@patch("app.core_logic.load_session")
+@patch("app.core_logic.save_session")
+@patch("app.core_logic.extract_flight_details_from_history")
+@patch("app.ai_service.client")
+def test_streamed_info_complete_restatement_is_withdrawn(mock_openai_client, mock_extract, mock_save_session, mock_load_session):
+    """A streamed reply ending in [INFO_COMPLETE] is taken back; only the class question is a response."""
+    from app.ai_service import streaming_replies_to
+
+    def chunk(text):
+        return MagicMock(choices=[MagicMock(delta=MagicMock(content=text))])
+
+    mock_load_session.return_value = ("GATHERING_INFO", [], [], {})
+    mock_openai_client.chat.completions.create.return_value = iter(
+        [chunk("Boston to London for one. "), chunk("Is that correct? "), chunk("[INFO_COMPLETE]")])
+    mock_extract.return_value = {"origin": "BOS", "destination": "LHR", "number_of_travelers": 1}
+    shown = []
+
+    with streaming_replies_to(shown.append):
+        response = process_message("user1", "hmm", MagicMock())
+
+    assert shown[-1] is None
+    assert shown.count(None) == 1
+    assert response == ["What class would you like to fly? You can choose from: ECONOMY, PREMIUM_ECONOMY, BUSINESS, FIRST."]
@@ -8,7 +8,7 @@ def currency_service():
     """Fixture to provide an instance of the CurrencyService."""
     return CurrencyService()
 
-@patch('app.currency_service.requests.get')
+@patch('app.currency_service.http_client.get')
 def test_convert_to_usd_success(mock_get, currency_service):
     """
     Tests successful currency conversion to USD.
@@ -27,12 +27,12 @@ def test_convert_to_usd_same_currency(currency_service):
     """
     Tests that conversion from USD to USD returns the same amount without an API call.
     """
-    with patch('app.currency_service.requests.get') as mock_get:
+    with patch('app.currency_service.http_client.get') as mock_get:
         result = currency_service.convert_to_usd(150, "USD")
         assert result == 150
         mock_get.assert_not_called()
 
-@patch('app.currency_service.requests.get')
+@patch('app.currency_service.http_client.get')
 def test_convert_to_usd_api_error(mock_get, currency_service):
     """
     Tests handling of an API error during currency conversion.
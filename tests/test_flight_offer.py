@@ -0,0 +1,57 @@
+import random
+
+from app import session_codec
+from app.flight_offer import FlightOffer, project_offers, bookable_offer, rank_offers, duration_minutes
+from benchmarks.session_codec_bench import make_offer
+
+
+def test_projection_keeps_the_fields_the_bot_reads():
+    raw = make_offer(random.Random(7), 3, travelers=2)
+    offer = project_offers([raw], "abc")[0]
+
+    assert offer["id"] == "3"
+    assert offer["price"] == {"total": raw["price"]["total"], "currency": "EUR"}
+    assert offer["travelerPricings"][0]["fareDetailsBySegment"][0]["cabin"] == "ECONOMY"
+    assert offer["lastTicketingDate"] == raw["lastTicketingDate"]
+    assert offer["airlineName"] == "Example Airways"
+    assert offer["rawRef"] == "abc:0"
+    for trimmed, full in zip(offer["itineraries"][0]["segments"], raw["itineraries"][0]["segments"]):
+        assert trimmed["departure"] == {"iataCode": full["departure"]["iataCode"], "at": full["departure"]["at"]}
+        assert trimmed["arrival"] == {"iataCode": full["arrival"]["iataCode"], "at": full["arrival"]["at"]}
+        assert trimmed["carrierCode"] == full["carrierCode"]
+    assert "pricingOptions" not in offer and "fees" not in offer["price"]
+
+
+def test_projection_is_much_smaller_than_the_raw_offer():
+    rng = random.Random(1)
+    raw = [make_offer(rng, i + 1, travelers=2) for i in range(50)]
+    assert len(session_codec.encode(project_offers(raw))) < len(session_codec.encode(raw)) / 2
+
+
+def test_projection_tolerates_partial_offers():
+    offer = FlightOffer.from_amadeus({"itineraries": [{"segments": [{"arrival": {"iataCode": "CDG"}}]}],
+                                      "price": {"total": "250.00"}}).to_dict()
+    assert offer == {"price": {"total": "250.00"}, "itineraries": [{"segments": [{"departure": {}, "arrival": {"iataCode": "CDG"}}]}]}
+
+
+def test_bookable_offer_prefers_the_raw_payload():
+    raw = {"id": "1", "source": "GDS"}
+    assert bookable_offer({"id": "1", "raw": raw}) is raw
+    assert bookable_offer(raw) is raw
+
+
+def test_duration_minutes():
+    assert duration_minutes("PT7H35M") == 455
+    assert duration_minutes("PT45M") == 45
+    assert duration_minutes("P1DT2H") == 1560
+    assert duration_minutes("") is None and duration_minutes("soon") is None
+
+
+def test_rank_offers_prefers_price_then_duration():
+    def offer(offer_id, total, duration):
+        return {"id": offer_id, "price": {"total": total}, "itineraries": [{"duration": duration, "segments": [{}]}]}
+
+    offers = [offer("slow", "100.00", "PT9H"), offer("dear", "300.00", "PT2H"),
+              offer("fast", "100.00", "PT3H"), offer("unpriced", None, "PT1H")]
+    assert [o["id"] for o in rank_offers(offers, 3)] == ["fast", "slow", "dear"]
+    assert rank_offers(None, 5) == []
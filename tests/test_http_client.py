@@ -0,0 +1,50 @@
+import pytest
+import requests
+from unittest.mock import patch, MagicMock
+from app.http_client import HttpClient
+
+
+@pytest.fixture
+def client():
+    return HttpClient(pool_maxsize=4, connect_timeout=1, read_timeout=2, retries=2, backoff_factor=0.1, backoff_jitter=0.1)
+
+
+def test_sessions_are_shared_per_host(client):
+    a = client.session_for("https://api.telegram.org/bot1/sendMessage")
+    b = client.session_for("https://api.telegram.org/bot1/sendDocument")
+    c = client.session_for("https://api.frankfurter.app/latest")
+
+    assert a is b
+    assert a is not c
+
+
+def test_pool_size_and_jittered_retries_are_configured(client):
+    adapter = client.session_for("https://api-sandbox.circle.com/v1").get_adapter("https://api-sandbox.circle.com/v1")
+
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total == 2
+    assert adapter.max_retries.backoff_jitter == 0.1
+    # POST is never retried after the request was sent
+    assert "POST" not in adapter.max_retries.allowed_methods
+
+
+def test_request_applies_default_timeout_and_records_stats(client):
+    ok = MagicMock(status_code=200)
+    failed = MagicMock(status_code=503)
+    with patch.object(requests.Session, "request", side_effect=[ok, failed]) as mock_request:
+        client.get("https://api.frankfurter.app/latest")
+        client.post("https://api.frankfurter.app/latest", timeout=20)
+
+    assert mock_request.call_args_list[0].kwargs["timeout"] == (1, 2)
+    assert mock_request.call_args_list[1].kwargs["timeout"] == 20
+    stats = client.stats()["api.frankfurter.app"]
+    assert stats["requests"] == 2
+    assert stats["errors"] == 1
+
+
+def test_connection_errors_are_counted_and_raised(client):
+    with patch.object(requests.Session, "request", side_effect=requests.exceptions.ConnectionError("down")):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.get("https://api.telegram.org/bot1/getMe")
+
+    assert client.stats()["api.telegram.org"]["errors"] == 1
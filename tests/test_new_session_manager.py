@@ -66,4 +66,227 @@ def test_wallet_mapping(mock_redis_client):
     user_id = "user_abc"
     save_wallet_mapping(payment_intent_id, user_id)
     retrieved_user_id = get_user_id_from_wallet(payment_intent_id)
-    assert retrieved_user_id == user_id 
\ No newline at end of file
+    assert retrieved_user_id == user_id 
+def test_list_and_claim_circlelayer_payments(mock_redis):
+    """Outstanding payments are listed from Redis and can only be claimed once."""
+    from app.new_session_manager import save_circlelayer_payment_info, list_circlelayer_payments, claim_circlelayer_payment
+
+    save_circlelayer_payment_info("telegram:1", "0xABC", initial_balance=5, expected_amount=100, address_index=3)
+
+    payments = list_circlelayer_payments()
+    assert payments["telegram:1"]["address"] == "0xabc"
+    assert payments["telegram:1"]["expected_amount"] == 100
+
+    assert claim_circlelayer_payment("telegram:1") is True
+    assert claim_circlelayer_payment("telegram:1") is False
+    assert list_circlelayer_payments() == {}
+
+def test_credit_circlelayer_transfer_is_idempotent(mock_redis):
+    """A Transfer log is only credited once, and never to a payment that was already claimed."""
+    from app.new_session_manager import save_circlelayer_payment_info, credit_circlelayer_transfer, claim_circlelayer_payment
+
+    save_circlelayer_payment_info("telegram:1", "0xabc", initial_balance=0, expected_amount=100, address_index=0, token_address="0xToken")
+
+    assert credit_circlelayer_transfer("telegram:1", "0xtx:0", 60) == 60
+    assert credit_circlelayer_transfer("telegram:1", "0xtx:0", 60) is None
+    assert credit_circlelayer_transfer("telegram:1", "0xtx:1", 40) == 100
+
+    claim_circlelayer_payment("telegram:1")
+    assert credit_circlelayer_transfer("telegram:1", "0xtx:2", 40) is None
+
+def test_credit_circlelayer_transfer_does_not_recreate_a_claimed_hash(mock_redis):
+    """A claim that lands after the existence check aborts the credit instead of re-creating the hash."""
+    from app.new_session_manager import save_circlelayer_payment_info, credit_circlelayer_transfer, CIRCLELAYER_PAYMENT_PREFIX
+
+    save_circlelayer_payment_info("telegram:1", "0xabc", initial_balance=0, expected_amount=100, address_index=0, token_address="0xToken")
+    key = f"{CIRCLELAYER_PAYMENT_PREFIX}telegram:1"
+    real_exists = mock_redis.pipeline().__class__.exists
+
+    def exists_then_claim(pipe, *names):
+        found = real_exists(pipe, *names)
+        mock_redis.delete(key)
+        return found
+
+    with patch.object(mock_redis.pipeline().__class__, "exists", exists_then_claim):
+        assert credit_circlelayer_transfer("telegram:1", "0xtx:0", 60) is None
+    assert not mock_redis.exists(key)
+
+def test_circle_intent_schedule_and_settle(mock_redis):
+    """Due intents are returned by check time, and an intent can only be settled once."""
+    from app.new_session_manager import schedule_circle_intent, get_due_circle_intents, settle_circle_intent, count_circle_intents
+
+    schedule_circle_intent("intent_a", 100, created_at=50)
+    schedule_circle_intent("intent_b", 500, created_at=60)
+
+    assert get_due_circle_intents(200, limit=10) == {"intent_a": 50.0}
+    assert count_circle_intents(200, overdue_after=1000)["pending"] == 2
+
+    assert settle_circle_intent("intent_a") is True
+    # A second settle (e.g. a redelivered webhook) is rejected
+    assert settle_circle_intent("intent_a") is False
+    assert get_due_circle_intents(1000, limit=10) == {"intent_b": 60.0}
+
+def test_get_redis_client_backs_off_after_failed_connect(monkeypatch):
+    """A failed connect is not retried on every call, and a later attempt can succeed."""
+    import redis
+    import app.new_session_manager as nsm
+
+    monkeypatch.setenv("REDIS_URL", "redis://localhost:6399/0")
+    monkeypatch.setattr(nsm, "redis_client", None)
+    monkeypatch.setattr(nsm, "_redis_pool", None)
+    monkeypatch.setattr(nsm, "_connect_failures", 0)
+    monkeypatch.setattr(nsm, "_next_connect_attempt", 0.0)
+    clock = [100.0]
+    monkeypatch.setattr(nsm.time, "monotonic", lambda: clock[0])
+
+    mock_client = MagicMock()
+    mock_client.ping.side_effect = [redis.exceptions.ConnectionError("down"), True]
+    with patch("app.new_session_manager.redis.Redis", return_value=mock_client):
+        assert nsm.get_redis_client() is None
+        assert nsm.get_redis_client() is None
+        assert mock_client.ping.call_count == 1
+
+        clock[0] += nsm.REDIS_RECONNECT_BASE
+        assert nsm.get_redis_client() is mock_client
+
+    # Connected: later calls are a plain global read
+    assert nsm.get_redis_client() is mock_client
+    assert mock_client.ping.call_count == 2
+    stats = nsm.get_redis_pool_stats()
+    assert stats["connected"] is True
+    assert stats["max_connections"] == nsm.REDIS_MAX_CONNECTIONS
+    assert stats["in_use"] == 0
+
+def test_binary_pool_has_its_own_budget_and_is_reported(monkeypatch):
+    """The binary client's pool is sized by REDIS_BINARY_MAX_CONNECTIONS and shows up in the pool stats."""
+    import app.new_session_manager as nsm
+    pool = nsm.redis.ConnectionPool(max_connections=nsm.REDIS_MAX_CONNECTIONS, decode_responses=True)
+    client = nsm.redis.Redis(connection_pool=pool)
+    monkeypatch.setattr(nsm, "redis_client", client)
+    monkeypatch.setattr(nsm, "_redis_pool", pool)
+    monkeypatch.setattr(nsm, "_binary_client", (None, None))
+
+    binary = nsm.get_binary_redis_client()
+
+    assert binary.connection_pool.max_connections == nsm.REDIS_BINARY_MAX_CONNECTIONS
+    assert binary.connection_pool.connection_kwargs["decode_responses"] is False
+    stats = nsm.get_redis_pool_stats()
+    assert stats["max_connections"] == nsm.REDIS_MAX_CONNECTIONS
+    assert stats["binary"]["max_connections"] == nsm.REDIS_BINARY_MAX_CONNECTIONS
+
+def test_legacy_json_session_is_migrated_on_save(mock_redis):
+    """Sessions written as JSON strings still load and are rewritten in the compact format."""
+    mock_redis.hset("session:telegram:1", mapping={
+        "state": json.dumps("FLIGHT_SELECTION"),
+        "conversation_history": json.dumps([{"role": "user", "content": "hi"}]),
+        "flight_offers": json.dumps([{"id": "1"}]),
+        "flight_details": json.dumps({"origin": "LHR"}),
+    })
+
+    state, history, offers, details = load_session("telegram:1")
+    assert (state, history, offers, details) == ("FLIGHT_SELECTION", [{"role": "user", "content": "hi"}], [{"id": "1"}], {"origin": "LHR"})
+
+    save_session("telegram:1", state, history, offers, details)
+    from app.new_session_manager import get_binary_redis_client
+    raw = get_binary_redis_client().hget("session:telegram:1", "flight_details")
+    assert raw[:1] == b"\x01"
+    assert load_session("telegram:1") == (state, history, offers, details)
+
+def test_save_session_only_writes_changed_fields(mock_redis):
+    """Unchanged fields are not rewritten, and a save with no changes skips Redis entirely."""
+    from app.new_session_manager import Session, get_session_write_stats
+
+    offers = [{"id": str(i), "price": {"total": "100.00"}} for i in range(50)]
+    save_session("telegram:1", "FLIGHT_SELECTION", [{"role": "user", "content": "hi"}], offers, {"origin": "LHR"})
+    before = get_session_write_stats()
+
+    state, history, loaded_offers, details = load_session("telegram:1")
+    with patch.object(StrictRedis, "hset", autospec=True, side_effect=StrictRedis.hset) as spy_hset:
+        save_session("telegram:1", "AWAITING_PAYMENT_SELECTION", history, loaded_offers, details)
+        assert set(spy_hset.call_args.kwargs["mapping"]) == {"state"}
+
+        # In-place mutation is detected too
+        details["travel_class"] = "BUSINESS"
+        save_session("telegram:1", "AWAITING_PAYMENT_SELECTION", history, loaded_offers, details)
+        assert set(spy_hset.call_args.kwargs["mapping"]) == {"flight_details"}
+
+        session = Session.load("telegram:1")
+        assert session.save() == 0
+        assert spy_hset.call_count == 2
+
+    assert load_session("telegram:1") == ("AWAITING_PAYMENT_SELECTION", history, offers, {"origin": "LHR", "travel_class": "BUSINESS"})
+    after = get_session_write_stats()
+    assert after["skipped_saves"] == before["skipped_saves"] + 1
+    assert after["bytes_saved"] > before["bytes_saved"]
+
+def test_flight_offers_are_stored_out_of_band_and_loaded_lazily(mock_redis):
+    """Offers live under a content-addressed key and are only fetched by states that use them."""
+    from app.new_session_manager import FLIGHT_OFFERS_PREFIX, flight_offers_ttl
+
+    offers = [{"id": "1", "lastTicketingDate": "2099-01-01"}, {"id": "2"}]
+    save_session("telegram:1", "FLIGHT_SELECTION", [], offers, {})
+
+    ref = mock_redis.hget("session:telegram:1", "flight_offers_ref")
+    assert mock_redis.hget("session:telegram:1", "flight_offers") is None
+    assert 0 < mock_redis.ttl(f"{FLIGHT_OFFERS_PREFIX}{ref}") <= flight_offers_ttl(offers)
+
+    # A conversational state does not read the offers key until the offers are used
+    save_session("telegram:1", "GATHERING_INFO", [], offers, {})
+    with patch.object(StrictRedis, "get", autospec=True, side_effect=StrictRedis.get) as spy_get:
+        state, history, lazy_offers, details = load_session("telegram:1")
+        save_session("telegram:1", "AWAITING_CONFIRMATION", history, lazy_offers, details)
+        spy_get.assert_not_called()
+        assert lazy_offers == offers
+        assert spy_get.call_count == 1
+
+    assert mock_redis.hget("session:telegram:1", "flight_offers_ref") == ref
+    assert load_session("telegram:1") == ("AWAITING_CONFIRMATION", [], offers, {})
+
+    save_session("telegram:1", "GATHERING_INFO", [], [], {})
+    assert mock_redis.hget("session:telegram:1", "flight_offers_ref") == ""
+    assert load_session("telegram:1")[2] == []
+
+
+def test_selected_offer_does_not_expire_during_payment(mock_redis):
+    """The offer a user selected is kept for as long as the payment can still arrive."""
+    from app.new_session_manager import FLIGHT_OFFERS_PREFIX
+
+    selected = [{"id": "1", "lastTicketingDate": "2099-01-01"}]
+    save_session("telegram:1", "AWAITING_PAYMENT_SELECTION", [], selected, {})
+    key = f"{FLIGHT_OFFERS_PREFIX}{mock_redis.hget('session:telegram:1', 'flight_offers_ref')}"
+    assert mock_redis.ttl(key) == -1
+
+    # An offer stored with an expiry (e.g. before a deploy) loses it on the next state change.
+    mock_redis.expire(key, 3600)
+    save_session("telegram:1", "AWAITING_PAYMENT", [], selected, {})
+    assert mock_redis.ttl(key) == -1
+    assert load_session("telegram:1")[2] == selected
+
+
+def test_flight_offers_ttl_follows_last_ticketing_date():
+    from app.new_session_manager import flight_offers_ttl, FLIGHT_OFFERS_MIN_TTL, FLIGHT_OFFERS_MAX_TTL
+    from datetime import datetime, timezone
+
+    now = datetime(2025, 9, 1, 12, 0, tzinfo=timezone.utc).timestamp()
+    assert flight_offers_ttl([{"lastTicketingDate": "2025-09-01"}], now=now) == max(FLIGHT_OFFERS_MIN_TTL, 12 * 3600)
+    assert flight_offers_ttl([{"lastTicketingDate": "2025-08-01"}], now=now) == FLIGHT_OFFERS_MIN_TTL
+    assert flight_offers_ttl([{"id": "1"}], now=now) == FLIGHT_OFFERS_MAX_TTL
+
+
+def test_raw_flight_offers_are_loaded_back_for_the_selected_offer(mock_redis):
+    from app.new_session_manager import save_raw_flight_offers, with_raw_offer, RAW_FLIGHT_OFFERS_PREFIX
+    from app.flight_offer import project_offers
+
+    raw_offers = [{"id": "1", "source": "GDS", "price": {"total": "100.00", "currency": "EUR", "base": "80.00"}},
+                  {"id": "2", "source": "GDS", "price": {"total": "120.00", "currency": "EUR", "base": "96.00"}}]
+    ref = save_raw_flight_offers(raw_offers)
+    trimmed = project_offers(raw_offers, ref)
+    assert trimmed[1]["rawRef"] == f"{ref}:1"
+
+    selected = with_raw_offer(trimmed[1])
+    assert selected["raw"] == raw_offers[1]
+    assert selected["price"] == {"total": "120.00", "currency": "EUR"}
+
+    # An expired payload leaves the trimmed offer as it is
+    mock_redis.delete(f"{RAW_FLIGHT_OFFERS_PREFIX}{ref}")
+    assert with_raw_offer(trimmed[0]) == trimmed[0]
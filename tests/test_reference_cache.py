@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from app.reference_cache import ReferenceCache
+
+
+@pytest.fixture
+def cache():
+    return ReferenceCache("test", max_size=2, ttl=3600, negative_ttl=60)
+
+
+def test_loads_once_and_shares_through_redis(mock_redis, cache):
+    loader = MagicMock(return_value="Heathrow")
+
+    assert cache.get_or_load("LHR", loader) == "Heathrow"
+    assert cache.get_or_load("LHR", loader) == "Heathrow"
+    loader.assert_called_once_with("LHR")
+
+    # Another process (empty local tier) is served from Redis
+    other = ReferenceCache("test", max_size=2, ttl=3600, negative_ttl=60)
+    assert other.get_or_load("LHR", loader) == "Heathrow"
+    loader.assert_called_once()
+    assert other.stats()["redis_hits"] == 1
+    assert 0 < mock_redis.ttl("refdata:test:LHR") <= 3600
+
+
+def test_negative_results_expire(mock_redis, cache):
+    loader = MagicMock(return_value=None)
+    clock = [1000.0]
+
+    with patch("app.reference_cache.time.monotonic", lambda: clock[0]):
+        assert cache.get_or_load("XXX", loader) is None
+        assert cache.get_or_load("XXX", loader) is None
+        loader.assert_called_once()
+        assert 0 < mock_redis.ttl("refdata:test:XXX") <= 60
+
+        clock[0] += 61
+        mock_redis.delete("refdata:test:XXX")
+        cache.get_or_load("XXX", loader)
+        assert loader.call_count == 2
+
+
+def test_failed_loads_are_not_cached(mock_redis, cache):
+    loader = MagicMock(side_effect=[RuntimeError("throttled"), "Heathrow"])
+
+    assert cache.get_or_load("LHR", loader) is None
+    assert mock_redis.get("refdata:test:LHR") is None
+    assert cache.get_or_load("LHR", loader) == "Heathrow"
+    assert cache.stats()["load_errors"] == 1
+
+
+def test_local_tier_is_bounded_lru(cache):
+    loader = lambda key: key.lower()
+
+    for key in ("A", "B", "A", "C"):
+        cache.get_or_load(key, loader)
+
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 1
+    assert stats["local_hits"] == 1
+    assert stats["loads"] == 3
+
+
+def test_prewarm_loads_most_used_keys(mock_redis, cache):
+    cache.POPULARITY_FLUSH_EVERY = 1
+    for key in ("LHR", "LHR", "JFK"):
+        cache.get_or_load(key, lambda k: k)
+    cache.clear()
+    mock_redis.delete("refdata:test:LHR")
+
+    loader = MagicMock(side_effect=lambda k: f"{k} airport")
+    assert cache.prewarm(1, loader) == 1
+    loader.assert_called_once_with("LHR")
+    assert cache.get("LHR") == "LHR airport"
@@ -0,0 +1,77 @@
+import pytest
+from app.reference_data import ReferenceData, load_reference_data, normalize
+
+AIRPORTS = {
+    'LHR': {'iata': 'LHR', 'name': 'London Heathrow Airport', 'city': 'London', 'country': 'GB', 'lat': 51.47, 'lon': -0.46, 'tz': 'Europe/London'},
+    'LGW': {'iata': 'LGW', 'name': 'London Gatwick Airport', 'city': 'London', 'country': 'GB', 'lat': 51.15, 'lon': -0.19, 'tz': 'Europe/London'},
+    'YXU': {'iata': 'YXU', 'name': 'London Airport', 'city': 'London', 'country': 'CA', 'lat': 43.03, 'lon': -81.15, 'tz': 'America/Toronto'},
+    'LOS': {'iata': 'LOS', 'name': 'Murtala Muhammed International Airport', 'city': 'Lagos', 'country': 'NG', 'lat': 6.58, 'lon': 3.32, 'tz': 'Africa/Lagos'},
+    'BHX': {'iata': 'BHX', 'name': 'Birmingham International Airport', 'city': 'Birmingham', 'country': 'GB', 'lat': 52.45, 'lon': -1.75, 'tz': 'Europe/London'},
+    'BHM': {'iata': 'BHM', 'name': 'Birmingham-Shuttlesworth International Airport', 'city': 'Birmingham', 'country': 'US', 'lat': 33.56, 'lon': -86.75, 'tz': 'America/Chicago'},
+    'GRU': {'iata': 'GRU', 'name': 'Guarulhos International Airport', 'city': 'São Paulo', 'country': 'BR', 'lat': -23.43, 'lon': -46.47, 'tz': 'America/Sao_Paulo'},
+    'FRA': {'iata': 'FRA', 'name': 'Frankfurt am Main Airport', 'city': 'Frankfurt am Main', 'country': 'DE', 'lat': 50.03, 'lon': 8.56, 'tz': 'Europe/Berlin'},
+}
+METRO_CODES = {'LON': {'name': 'London', 'country': 'GB', 'airports': {}}}
+AIRLINES = {'BA': 'British Airways'}
+
+
+@pytest.fixture
+def reference():
+    return ReferenceData(AIRPORTS, METRO_CODES, AIRLINES)
+
+
+def test_normalize_strips_accents_and_punctuation():
+    assert normalize('  São-Paulo ') == 'sao paulo'
+
+
+def test_airport_record_and_names(reference):
+    airport = reference.airport('lhr')
+    assert airport.name == 'London Heathrow Airport'
+    assert airport.country == 'GB'
+    assert airport.tz == 'Europe/London'
+    assert airport.lat == pytest.approx(51.47)
+    assert reference.airport('XXX') is None
+    assert reference.airport_timezone('LOS') == 'Africa/Lagos'
+    assert reference.airline_name('ba') == 'British Airways'
+    assert reference.airline_name('ZZ') is None
+
+
+def test_resolve_city_prefers_metro_code_and_country(reference):
+    assert reference.resolve_city('London') == 'LON'
+    assert reference.resolve_city('london, CA') == 'YXU'
+    assert reference.resolve_city('Lagos') == 'LOS'
+    assert reference.resolve_city('Sao Paulo') == 'GRU'
+
+
+def test_resolve_city_accepts_codes_airport_names_and_prefixes(reference):
+    assert reference.resolve_city('LGW') == 'LGW'
+    assert reference.resolve_city('Heathrow') == 'LHR'
+    assert reference.resolve_city('Frankfurt') == 'FRA'
+
+
+def test_resolve_city_fuzzy_match(reference):
+    assert reference.resolve_city('Londn') == 'LON'
+    assert reference.resolve_city('Lagoss') == 'LOS'
+
+
+def test_resolve_city_leaves_ambiguous_and_unknown_names_to_caller(reference):
+    assert reference.resolve_city('Birmingham') is None
+    assert reference.resolve_city('Birmingham, UK') == 'BHX'
+    assert reference.resolve_city('Atlantis') is None
+    assert reference.resolve_city('') is None
+
+
+def test_bundled_dataset_loads():
+    reference = load_reference_data()
+    stats = reference.stats()
+    assert stats['airports'] > 5000
+    assert stats['airlines'] > 100
+    assert reference.resolve_city('Abuja') == 'ABV'
+    assert reference.airline_name('EK') == 'Emirates'
+
+
+def test_major_airports_add_city_names_and_rank_first():
+    airports = dict(AIRPORTS, YUL={'iata': 'YUL', 'name': 'Montreal-Trudeau International Airport', 'city': 'Dorval', 'country': 'CA', 'lat': 45.47, 'lon': -73.74, 'tz': 'America/Toronto'})
+    reference = ReferenceData(airports, METRO_CODES, AIRLINES, major_airports={'YUL': ['Montreal'], 'BHX': ['Birmingham']})
+    assert reference.resolve_city('Montreal') == 'YUL'
+    assert reference.resolve_city('Birmingham') == 'BHX'
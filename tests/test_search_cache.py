@@ -0,0 +1,112 @@
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from app.search_cache import SearchCache
+
+PARAMS = {"originLocationCode": "LOS", "destinationLocationCode": "LHR", "departureDate": "2025-09-15", "adults": "1"}
+OFFERS = [{"id": "1", "price": {"total": "500.00", "currency": "EUR"}}]
+
+
+@pytest.fixture
+def cache():
+    return SearchCache(ttl=300, stale_ttl=900, wait_timeout=2, poll_interval=0.01)
+
+
+def test_equivalent_params_share_a_key(cache):
+    same = {"adults": 1, "departureDate": "2025-09-15", "destinationLocationCode": "lhr",
+            "originLocationCode": "LOS", "travelClass": None}
+    assert cache.cache_key(PARAMS) == cache.cache_key(same)
+    assert cache.cache_key(PARAMS) != cache.cache_key(dict(PARAMS, adults="2"))
+
+
+def test_result_is_shared_through_redis(mock_redis, cache):
+    search = MagicMock(return_value=OFFERS)
+
+    assert cache.get_or_search(PARAMS, search) == OFFERS
+    other_worker = SearchCache(ttl=300, stale_ttl=900, wait_timeout=2)
+    assert other_worker.get_or_search(dict(PARAMS, adults=1), search) == OFFERS
+
+    search.assert_called_once()
+    assert other_worker.stats()["hits"] == 1
+    assert 0 < mock_redis.ttl(f"flight_search:{cache.cache_key(PARAMS)}") <= 1200
+
+
+def test_empty_results_are_not_cached(mock_redis, cache):
+    search = MagicMock(return_value=[])
+
+    assert cache.get_or_search(PARAMS, search) == []
+    assert cache.get_or_search(PARAMS, search) == []
+    assert search.call_count == 2
+
+
+def test_concurrent_identical_searches_share_one_call(mock_redis, cache):
+    release = threading.Event()
+    calls = []
+
+    def slow_search():
+        calls.append(1)
+        release.wait(2)
+        return [dict(OFFERS[0])]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_search(PARAMS, slow_search))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)
+    release.set()
+    for t in threads:
+        t.join(2)
+
+    assert len(calls) == 1
+    assert results == [OFFERS] * 4
+    # Callers get their own copies, so enriching one does not touch the others.
+    assert len({id(r) for r in results}) == 4
+    assert cache.stats()["coalesced"] == 3
+
+
+def test_leader_does_not_share_its_result_with_followers(cache):
+    """The caller that ran the search gets a copy, not the object followers copy from."""
+    searched = [dict(OFFERS[0])]
+
+    result = cache.get_or_search(PARAMS, lambda: searched)
+
+    assert result == OFFERS
+    assert result is not searched and result[0] is not searched[0]
+
+
+def test_waits_for_another_worker_holding_the_lock(mock_redis, cache):
+    key = cache.cache_key(PARAMS)
+    mock_redis.set(f"lock:flight_search:{key}", "1", ex=5)
+    search = MagicMock(return_value=OFFERS)
+    other_worker = SearchCache(ttl=300, stale_ttl=900, wait_timeout=2)
+
+    timer = threading.Timer(0.05, lambda: other_worker._write(key, OFFERS))
+    timer.start()
+    assert cache.get_or_search(PARAMS, search) == OFFERS
+    search.assert_not_called()
+
+
+def test_stale_result_is_served_and_refreshed_in_background(mock_redis, cache):
+    cache.get_or_search(PARAMS, MagicMock(return_value=OFFERS))
+    fresh = [{"id": "2", "price": {"total": "450.00", "currency": "EUR"}}]
+    refreshed = threading.Event()
+
+    def search():
+        refreshed.set()
+        return fresh
+
+    with patch("app.search_cache.time.time", return_value=time.time() + 400):
+        assert cache.get_or_search(PARAMS, search) == OFFERS
+    assert refreshed.wait(2)
+    time.sleep(0.05)
+    assert cache.get_or_search(PARAMS, MagicMock()) == fresh
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_without_redis_searches_pass_through(cache):
+    search = MagicMock(return_value=OFFERS)
+    with patch("app.search_cache.get_binary_redis_client", return_value=None):
+        assert cache.get_or_search(PARAMS, search) == OFFERS
+        assert cache.get_or_search(PARAMS, search) == OFFERS
+    assert search.call_count == 2
@@ -0,0 +1,44 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from app import session_codec
+
+
+def test_small_values_round_trip_uncompressed():
+    value = {"origin": "LHR", "number_of_travelers": 2, "return_date": None}
+    encoded = session_codec.encode(value)
+
+    assert encoded[:1] == session_codec.FORMAT_MSGPACK
+    assert session_codec.decode(encoded) == value
+
+
+def test_large_values_are_compressed():
+    offers = [{"id": str(i), "price": {"total": "123.45", "currency": "EUR"}, "itineraries": [{"duration": "PT2H5M"}]} for i in range(100)]
+    encoded = session_codec.encode(offers)
+
+    assert encoded[:1] == session_codec.FORMAT_MSGPACK_ZSTD
+    assert len(encoded) < len(json.dumps(offers))
+    assert session_codec.decode(encoded) == offers
+
+
+def test_legacy_json_is_decoded():
+    assert session_codec.decode('"FLIGHT_SELECTION"') == "FLIGHT_SELECTION"
+    assert session_codec.decode(b'[{"id": "1"}]') == [{"id": "1"}]
+
+
+def test_json_codec_can_be_forced(monkeypatch):
+    monkeypatch.setenv("SESSION_CODEC", "json")
+
+    assert session_codec.encode({"a": 1}) == b'{"a": 1}'
+
+
+def test_concurrent_round_trips():
+    def round_trip(n):
+        offers = [{"id": f"{n}-{i}", "price": {"total": str(n * i)}} for i in range(100)]
+        for _ in range(50):
+            encoded = session_codec.encode(offers)
+            assert encoded[:1] == session_codec.FORMAT_MSGPACK_ZSTD
+            assert session_codec.decode(encoded) == offers
+        return n
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        assert sorted(executor.map(round_trip, range(32))) == list(range(32))
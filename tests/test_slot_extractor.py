@@ -0,0 +1,78 @@
+from datetime import date
+
+import pytest
+
+from app.slot_extractor import extract_slots, extract_from_history, update_slots, is_complete, confirmation_message
+
+TODAY = date(2025, 9, 1)
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("I want to fly from Lagos to London on the 15th of September",
+     {"origin": "Lagos", "destination": "London", "departure_date": "2025-09-15"}),
+    ("Lagos to London, 2 adults, returning 20/09/2025",
+     {"origin": "Lagos", "destination": "London", "return_date": "2025-09-20", "number_of_travelers": 2}),
+    ("to london from abuja 2025-10-01 just me",
+     {"origin": "Abuja", "destination": "London", "departure_date": "2025-10-01", "number_of_travelers": 1}),
+    ("me and my wife want to go to Dubai next friday, business class",
+     {"destination": "Dubai", "departure_date": "2025-09-05", "number_of_travelers": 2, "travel_class": "BUSINESS"}),
+    ("I'm David Ugbodaga, flying to Paris around the 15th",
+     {"destination": "Paris", "departure_date": "2025-09-15", "flexible_dates": True, "traveler_name": "David Ugbodaga"}),
+    ("I want to fly to New York on Sept 3", {"destination": "New York", "departure_date": "2025-09-03"}),
+    ("Direct flights only from Lagos to London, prices in naira",
+     {"origin": "Lagos", "destination": "London", "non_stop": True, "currency": "NGN"}),
+    ("I want to fly to Paris nonstop and pay in USD", {"destination": "Paris", "non_stop": True, "currency": "USD"}),
+    # A past day-and-month means next year
+    ("Flying to Accra on 3 March", {"destination": "Accra", "departure_date": "2026-03-03"}),
+])
+def test_extract_slots(message, expected):
+    assert extract_slots(message, today=TODAY) == expected
+
+
+@pytest.mark.parametrize("message", [
+    "I need a flight",
+    "hi",
+    # Ambiguous city names, typos and day/month orders are left to the model
+    "Book a flight from Birmingham",
+    "from Londn",
+    "departing 05/06",
+])
+def test_ambiguous_input_fills_nothing(message):
+    assert extract_slots(message, today=TODAY) == {}
+
+
+def test_bare_answers_fill_the_slot_that_was_asked_for():
+    assert extract_slots("Lagos", "origin", TODAY) == {"origin": "Lagos"}
+    assert extract_slots("two", "number_of_travelers", TODAY) == {"number_of_travelers": 2}
+    assert extract_slots("david ugbodaga", "traveler_name", TODAY) == {"traveler_name": "David Ugbodaga"}
+    assert extract_slots("Lagos", None, TODAY) == {}
+
+
+def test_history_uses_the_latest_statement_and_the_question_asked():
+    history = [
+        {"role": "system", "content": "prompt"},
+        {"role": "user", "content": "I want to fly from Lagos to London"},
+        {"role": "assistant", "content": "When would you like to depart?"},
+        {"role": "user", "content": "15 September"},
+        {"role": "assistant", "content": "How many people are travelling?"},
+        {"role": "user", "content": "3"},
+        {"role": "assistant", "content": "What is the lead traveler's full name?"},
+        {"role": "user", "content": "David Ugbodaga"},
+        {"role": "user", "content": "Actually, from Abuja to London"},
+        "not a message",
+    ]
+    slots = extract_from_history(history, TODAY)
+    assert slots == {"origin": "Abuja", "destination": "London", "departure_date": "2025-09-15",
+                     "number_of_travelers": 3, "traveler_name": "David Ugbodaga"}
+    assert is_complete(slots)
+    assert confirmation_message(slots).endswith("[INFO_COMPLETE]")
+    assert not is_complete(dict(slots, traveler_name=None))
+
+
+def test_update_slots_merges_only_the_new_message():
+    slots = {"origin": "Lagos", "destination": "London", "departure_date": "2025-09-15"}
+    updated = update_slots(slots, "3", "How many people are travelling?", TODAY)
+    assert updated == dict(slots, number_of_travelers=3)
+    assert update_slots(updated, "Actually, I want to fly to Paris", None, TODAY)["destination"] == "Paris"
+    assert slots == {"origin": "Lagos", "destination": "London", "departure_date": "2025-09-15"}
+    assert update_slots(None, "hi") == {}
@@ -1,9 +1,10 @@
 
 import pytest
 from unittest.mock import patch, MagicMock
-from app.tasks import search_flights_task
+from app.tasks import search_flights_task, deliver_usdc_address_task, _departure_dates
 from app.new_session_manager import save_session
 import time
+import threading
 
 @pytest.fixture
 def mock_amadeus_fixture():
@@ -167,6 +168,29 @@ def test_search_flights_task_attaches_traveler_name(mock_send_telegram, mock_sav
     assert len(saved_offers) > 0
     assert saved_offers[0].get('traveler_name') == 'David Ugbodaga'
 
+@patch("app.tasks.AmadeusService")
+@patch("app.tasks.load_session")
+@patch("app.tasks.save_session")
+@patch("app.tasks.send_message")
+def test_search_flights_task_looks_up_each_code_once(mock_send_telegram, mock_save_session, mock_load_session, MockAmadeusService, mock_amadeus_fixture):
+    """
+    Airline and airport names are fetched once per distinct code, however many offers share it.
+    """
+    offer = mock_amadeus_fixture.search_flights.return_value[0]
+    mock_amadeus_fixture.search_flights.return_value = [offer, dict(offer), dict(offer)]
+    MockAmadeusService.return_value = mock_amadeus_fixture
+    flight_details = {'origin': 'London', 'destination': 'Paris', 'departure_date': '2024-10-26', 'number_of_travelers': '1'}
+    mock_load_session.return_value = ("SEARCH_IN_PROGRESS", ["history"], [], {})
+
+    search_flights_task("telegram:123456", flight_details)
+
+    mock_amadeus_fixture.get_airline_name.assert_called_once_with("TA")
+    assert sorted(c.args[0] for c in mock_amadeus_fixture.get_airport_name.call_args_list) == ["CDG", "LHR"]
+    assert sorted(c.args[0] for c in mock_amadeus_fixture.get_iata_code.call_args_list) == ["London", "Paris"]
+    message = mock_send_telegram.call_args[0][1]
+    assert message.count("London Heathrow (LHR) to Charles de Gaulle (CDG)") == 3
+    assert all(o['airlineName'] == "Test Airline" for o in mock_save_session.call_args[0][3])
+
 @patch("app.tasks.AmadeusService")
 @patch("app.tasks.load_session")
 @patch("app.tasks.save_session")
@@ -195,57 +219,127 @@ def test_search_flights_task_uses_travel_class(mock_send_telegram, mock_save_ses
     assert 'travelClass' in call_kwargs
     assert call_kwargs['travelClass'] == 'BUSINESS' 
 
-import pytest
-from unittest.mock import patch, MagicMock
-from app.tasks import poll_usdc_payment_task
+@patch("app.tasks.AmadeusService")
+@patch("app.tasks.load_session")
+@patch("app.tasks.save_session")
+@patch("app.tasks.send_message")
+def test_search_flights_task_limits_and_ranks_offers(mock_send_telegram, mock_save_session, mock_load_session, MockAmadeusService, mock_amadeus_fixture, monkeypatch):
+    """Searches ask Amadeus for a bounded result set and keep only the best offers."""
+    monkeypatch.setattr("app.tasks.FLIGHT_OFFERS_KEPT", 2)
+    offer = mock_amadeus_fixture.search_flights.return_value[0]
+    mock_amadeus_fixture.search_flights.return_value = [
+        dict(offer, id=str(i), price={"total": total, "currency": "EUR"})
+        for i, total in enumerate(["300.00", "120.00", "450.00", "99.50"])
+    ]
+    MockAmadeusService.return_value = mock_amadeus_fixture
+    mock_load_session.return_value = ("SEARCH_IN_PROGRESS", [], [], {})
 
+    search_flights_task("telegram:1", {'origin': 'London', 'destination': 'Paris', 'departure_date': '2024-10-26',
+                                       'non_stop': True, 'currency': 'usd'})
 
-@pytest.fixture
-def mock_circle_service(monkeypatch):
-    """Fixture to mock the CircleService and its methods."""
-    mock_instance = MagicMock()
-    mock_class = MagicMock(return_value=mock_instance)
-    # Patch CircleService where it's defined so the local import in the task gets the mock.
-    monkeypatch.setattr("app.circle_service.CircleService", mock_class)
-    return mock_instance
+    call_kwargs = mock_amadeus_fixture.search_flights.call_args[1]
+    assert call_kwargs['max'] > 0
+    assert call_kwargs['nonStop'] == "true"
+    assert call_kwargs['currencyCode'] == "USD"
+    assert [o['id'] for o in mock_save_session.call_args[0][3]] == ["3", "1"]
 
+def test_departure_dates_cover_the_flexible_window(monkeypatch):
+    from datetime import date
+    monkeypatch.setattr("app.tasks.FLEXIBLE_DATE_WINDOW", 2)
+    details = {'departure_date': '2030-05-15', 'flexible_dates': True}
 
-def test_poll_usdc_payment_task_success(monkeypatch, mock_circle_service):
-    """Polling task should call handle_successful_payment when status becomes complete."""
-    # Configure the mock to return different statuses on consecutive calls
-    mock_circle_service.get_payment_intent_status.side_effect = ["pending", "pending", "complete"]
+    assert _departure_dates({'departure_date': '2030-05-15'}) == ['2030-05-15']
+    assert _departure_dates(details, today=date(2030, 1, 1)) == ['2030-05-15', '2030-05-14', '2030-05-16', '2030-05-13', '2030-05-17']
+    # Days already past are not searched
+    assert _departure_dates(details, today=date(2030, 5, 15)) == ['2030-05-15', '2030-05-16', '2030-05-17']
+    assert _departure_dates({'departure_date': 'next week', 'flexible_dates': True}) == ['next week']
 
-    # Spy on the successful payment handler
-    mock_handle_payment = MagicMock()
-    monkeypatch.setattr("app.main.handle_successful_payment", mock_handle_payment)
 
-    # Mock time.sleep to avoid delays during the test
-    monkeypatch.setattr("time.sleep", lambda x: None)
+@patch("app.tasks.AmadeusService")
+@patch("app.tasks.load_session")
+@patch("app.tasks.save_session")
+@patch("app.tasks.send_message")
+def test_search_flights_task_flexible_dates_fan_out(mock_send_telegram, mock_save_session, mock_load_session, MockAmadeusService, mock_amadeus_fixture, monkeypatch):
+    """A flexible search covers each date in the window and reports the cheapest one."""
+    monkeypatch.setattr("app.tasks.FLEXIBLE_DATE_WINDOW", 1)
+    offer = mock_amadeus_fixture.search_flights.return_value[0]
+    prices = {'2030-05-14': "180.00", '2030-05-15': "250.00", '2030-05-16': "140.00"}
+
+    threads = set()
+
+    def search(**params):
+        threads.add(threading.current_thread().name)
+        day = params['departureDate']
+        segment = dict(offer['itineraries'][0]['segments'][0], departure={"iataCode": "LHR", "at": f"{day}T10:00:00"})
+        return [dict(offer, id=day, price={"total": prices[day], "currency": "EUR"},
+                     itineraries=[{"duration": "PT2H30M", "segments": [segment]}])]
+
+    mock_amadeus_fixture.search_flights.side_effect = search
+    MockAmadeusService.return_value = mock_amadeus_fixture
+    mock_load_session.return_value = ("SEARCH_IN_PROGRESS", [], [], {})
+
+    search_flights_task("telegram:1", {'origin': 'London', 'destination': 'Paris', 'departure_date': '2030-05-15',
+                                       'flexible_dates': True})
+
+    searched = sorted(c.kwargs['departureDate'] for c in mock_amadeus_fixture.search_flights.call_args_list)
+    assert searched == ['2030-05-14', '2030-05-15', '2030-05-16']
+    # The date searches run on their own executor, not the shared lookup one.
+    assert all(name.startswith("date-search-worker") for name in threads)
+    assert [o['id'] for o in mock_save_session.call_args[0][3]] == ['2030-05-16', '2030-05-14', '2030-05-15']
+    message = mock_send_telegram.call_args[0][1]
+    assert message.startswith("The cheapest day to fly is Thu 16 May, from 140.00 EUR.")
+    assert "Departs at: Thu 16 May, 10:00 AM" in message
+
+@patch('app.tasks.time.sleep', return_value=None)
+@patch('app.tasks.send_message')
+def test_deliver_usdc_address_task_sends_address_when_ready(mock_send_telegram, mock_sleep):
+    """The address lookup backs off until Circle assigns an address, then messages the user."""
+    mock_circle = MagicMock()
+    mock_circle.get_deposit_address.side_effect = [None, None, "0xdeposit"]
+
+    deliver_usdc_address_task("telegram:123", "intent_1", 10.00, mock_circle)
+
+    assert mock_circle.get_deposit_address.call_count == 3
+    delays = [c.args[0] for c in mock_sleep.call_args_list]
+    assert delays == sorted(delays) and delays[0] < delays[-1]
+    sent = [c.args[1] for c in mock_send_telegram.call_args_list]
+    assert "send exactly 10.00 USDC" in sent[0]
+    assert sent[1] == "0xdeposit"
 
-    # Run the task
-    poll_usdc_payment_task("telegram:123", "intent_abc", poll_interval=0.01)
 
-    # Assertions
-    assert mock_circle_service.get_payment_intent_status.call_count == 3
-    mock_handle_payment.assert_called_once_with("telegram:123")
+@patch('app.tasks.time.sleep', return_value=None)
+@patch('app.tasks.drop_circle_intent')
+@patch('app.tasks.save_session')
+@patch('app.tasks.load_session', return_value=("AWAITING_USDC_PAYMENT", [], [{"id": "1"}], {}))
+@patch('app.tasks.send_message')
+def test_deliver_usdc_address_task_gives_up_after_timeout(mock_send_telegram, mock_load_session, mock_save_session, mock_drop, mock_sleep, monkeypatch):
+    """Without an address the user is returned to payment selection and told to retry."""
+    monkeypatch.setenv("CIRCLE_ADDRESS_TIMEOUT", "0")
+    mock_circle = MagicMock()
+    mock_circle.get_deposit_address.return_value = None
 
+    deliver_usdc_address_task("telegram:123", "intent_1", 10.00, mock_circle)
 
-def test_poll_usdc_payment_task_timeout(monkeypatch, mock_circle_service):
-    """Polling task should exit gracefully after timeout if payment never completes."""
-    # Configure the mock to always return 'pending'
-    mock_circle_service.get_payment_intent_status.return_value = "pending"
+    mock_drop.assert_called_once_with("intent_1")
+    mock_save_session.assert_called_once_with("telegram:123", "AWAITING_PAYMENT_SELECTION", [], [{"id": "1"}], {})
+    assert "couldn't generate a USDC payment address" in mock_send_telegram.call_args.args[1]
 
-    # Spy on the successful payment handler to ensure it's not called
-    mock_handle_payment = MagicMock()
-    monkeypatch.setattr("app.main.handle_successful_payment", mock_handle_payment)
 
-    # Mock time.sleep to avoid delays
-    monkeypatch.setattr("time.sleep", lambda x: None)
+@patch('app.tasks.time.sleep', return_value=None)
+@patch('app.tasks.drop_circle_intent')
+@patch('app.tasks.save_session')
+@patch('app.tasks.load_session', return_value=("AWAITING_USDC_PAYMENT", [], [{"id": "1"}], {}))
+@patch('app.tasks.send_message')
+@patch('app.tasks.poller_pool')
+def test_deliver_usdc_address_task_returns_user_to_payment_selection_on_shutdown(mock_pool, mock_send_telegram, mock_load_session, mock_save_session, mock_drop, mock_sleep):
+    """Nothing resumes the wait after a restart, so a shutdown asks the user to choose again."""
+    mock_pool.stopping = True
+    mock_circle = MagicMock()
+    mock_circle.get_deposit_address.return_value = None
 
-    # Run the task with a very short timeout
-    poll_usdc_payment_task("telegram:456", "intent_def", poll_interval=0.01, timeout_seconds=0.05)
+    deliver_usdc_address_task("telegram:123", "intent_1", 10.00, mock_circle)
 
-    # The handler should never be called
-    mock_handle_payment.assert_not_called()
-    # The status should have been checked multiple times
-    assert mock_circle_service.get_payment_intent_status.call_count > 1 
\ No newline at end of file
+    mock_circle.get_deposit_address.assert_called_once_with("intent_1")
+    mock_drop.assert_called_once_with("intent_1")
+    mock_save_session.assert_called_once_with("telegram:123", "AWAITING_PAYMENT_SELECTION", [], [{"id": "1"}], {})
+    assert "couldn't generate a USDC payment address" in mock_send_telegram.call_args.args[1]
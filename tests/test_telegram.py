@@ -3,7 +3,7 @@ import pytest
 from app.main import app, amadeus_service
 from unittest.mock import patch, Mock
 import os
-from app.telegram_service import send_pdf
+from app.telegram_service import send_pdf, TelegramReplyStream
 
 @pytest.fixture
 def client():
@@ -44,7 +44,7 @@ def test_telegram_webhook_uses_process_message(mock_send_message, mock_process_m
     # Check that send_message was called with the result
     mock_send_message.assert_called_once_with("987654321", "Processed response") 
 
-@patch('requests.post')
+@patch('app.telegram_service.http_client.post')
 def test_send_pdf(mock_post):
     """
     Test that the send_pdf function calls the Telegram API correctly.
@@ -66,4 +66,99 @@ def test_send_pdf(mock_post):
     assert 'document' in kwargs['files']
     assert kwargs['files']['document'][0] == "test.pdf"
     assert kwargs['files']['document'][1] == pdf_bytes
-    assert kwargs['files']['document'][2] == "application/pdf" 
\ No newline at end of file
+    assert kwargs['files']['document'][2] == "application/pdf" 
+
+
+@patch("app.telegram_service.edit_message_text")
+@patch("app.telegram_service.send_message")
+@patch("app.telegram_service.time.monotonic")
+def test_reply_stream_throttles_edits(mock_monotonic, mock_send, mock_edit):
+    """The first text is sent, later text is edited in at most once per interval."""
+    mock_send.return_value = {"ok": True, "result": {"message_id": 7}}
+    mock_edit.return_value = {"ok": True}
+    stream = TelegramReplyStream("42", edit_interval=1.0)
+
+    for now, text in [(10.0, "Where"), (10.2, "Where would"), (10.5, "Where would you"), (11.1, "Where would you like")]:
+        mock_monotonic.return_value = now
+        stream.update(text)
+    mock_monotonic.return_value = 11.2
+    stream.update("Where would you like to fly?")
+    stream.close()
+
+    mock_send.assert_called_once_with("42", "Where")
+    assert [c.args for c in mock_edit.call_args_list] == [("42", 7, "Where would you like"),
+                                                         ("42", 7, "Where would you like to fly?")]
+    assert stream.delivered("Where would you like to fly?")
+    assert not stream.delivered("What class would you like to fly?")
+
+
+@patch("app.telegram_service.delete_message")
+@patch("app.telegram_service.edit_message_text")
+@patch("app.telegram_service.send_message")
+def test_reply_stream_final_edit_is_retried_then_partial_deleted(mock_send, mock_edit, mock_delete):
+    """A final edit that keeps failing removes the partial message, so the reply is sent once, whole."""
+    mock_send.return_value = {"ok": True, "result": {"message_id": 7}}
+    stream = TelegramReplyStream("42", edit_interval=0)
+    stream.update("Where")
+
+    # The throttled edit and the first final edit fail; the retry gets through.
+    mock_edit.side_effect = [None, None, {"ok": True}]
+    stream.update("Where would")
+    stream.close()
+    assert mock_edit.call_count == 3
+    assert stream.delivered("Where would")
+    mock_delete.assert_not_called()
+
+    mock_edit.side_effect = None
+    mock_edit.return_value = None
+    stream.update("Where would you like to fly?")
+    stream.close()
+    mock_delete.assert_called_once_with("42", 7)
+    assert not stream.delivered("Where would you like to fly?")
+    assert not stream.replace("Where would you like to fly?")
+
+
+@patch("app.main.process_message")
+@patch("app.main.send_message")
+@patch("app.main.TelegramReplyStream")
+def test_telegram_webhook_streams_replies(mock_stream_class, mock_send_message, mock_process_message, client, monkeypatch):
+    """With TELEGRAM_STREAM_REPLIES the streamed reply is not sent a second time."""
+    monkeypatch.setenv("TELEGRAM_STREAM_REPLIES", "true")
+    stream = mock_stream_class.return_value
+    stream.delivered.side_effect = lambda text: text == "Streamed reply"
+    stream.replace.return_value = False
+    mock_process_message.return_value = ["Streamed reply", "What class would you like to fly?"]
+
+    response = client.post("/telegram-webhook", json={"message": {"chat": {"id": 42}, "text": "hi"}})
+
+    assert response.status_code == 200
+    mock_process_message.assert_called_once_with("telegram:42", "hi", amadeus_service)
+    stream.close.assert_called_once()
+    mock_send_message.assert_called_once_with("42", "What class would you like to fly?")
+    stream.discard_withdrawn.assert_called_once()
+
+
+@patch("app.telegram_service.delete_message")
+@patch("app.telegram_service.edit_message_text")
+@patch("app.telegram_service.send_message")
+def test_withdrawn_reply_is_replaced_or_deleted(mock_send, mock_edit, mock_delete):
+    """A withdrawn reply's message shows the next response instead, or is deleted."""
+    mock_send.return_value = {"ok": True, "result": {"message_id": 7}}
+    mock_edit.return_value = {"ok": True}
+
+    stream = TelegramReplyStream("42", edit_interval=0)
+    stream.update("Lagos to London. Is that correct?")
+    stream.update(None)
+    stream.close()
+    assert not stream.delivered("Lagos to London. Is that correct?")
+    assert stream.replace("What class would you like to fly?")
+    assert not stream.replace("Another message")
+    stream.discard_withdrawn()
+    mock_edit.assert_called_once_with("42", 7, "What class would you like to fly?")
+    mock_delete.assert_not_called()
+
+    stream = TelegramReplyStream("42", edit_interval=0)
+    stream.update("Lagos to London.")
+    stream.update(None)
+    stream.discard_withdrawn()
+    mock_delete.assert_called_once_with("42", 7)
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+import pytest
+from app.worker_pool import WorkerPool, run_lookups, lookup_all
+
+
+def test_submit_runs_job_and_counts_completion():
+    pool = WorkerPool("test", max_workers=2, max_queue=2)
+    done = threading.Event()
+
+    assert pool.submit(done.set) is True
+    assert done.wait(1)
+
+    pool.shutdown(drain_timeout=1)
+    stats = pool.stats()
+    assert stats["completed"] == 1
+    assert stats["active"] == 0
+    assert stats["rejected"] == 0
+
+
+def test_submit_rejects_when_queue_is_full():
+    pool = WorkerPool("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    assert pool.submit(release.wait) is True
+    assert pool.submit(release.wait) is True
+    # One running plus one queued fills the pool.
+    assert pool.submit(release.wait) is False
+    assert pool.stats()["rejected"] == 1
+
+    release.set()
+    pool.shutdown(drain_timeout=1)
+
+
+def test_failed_job_is_counted_and_does_not_kill_worker():
+    pool = WorkerPool("test", max_workers=1, max_queue=1)
+    done = threading.Event()
+
+    def boom():
+        raise ValueError("boom")
+
+    pool.submit(boom)
+    pool.submit(done.set)
+    assert done.wait(1)
+
+    pool.shutdown(drain_timeout=1)
+    assert pool.stats()["failed"] == 1
+    assert pool.stats()["completed"] == 1
+
+
+def test_shutdown_rejects_new_jobs_and_sets_stopping():
+    pool = WorkerPool("test", max_workers=1, max_queue=1)
+    pool.shutdown(drain_timeout=1)
+
+    assert pool.stopping is True
+    assert pool.submit(lambda: None) is False
+
+
+def test_shutdown_releases_cancelled_jobs():
+    pool = WorkerPool("test", max_workers=1, max_queue=2)
+    started = threading.Event()
+
+    def blocker():
+        started.set()
+        time.sleep(0.2)
+
+    pool.submit(blocker)
+    assert started.wait(1)
+    pool.submit(lambda: None)
+    pool.submit(lambda: None)
+    pool.shutdown(drain_timeout=1)
+
+    stats = pool.stats()
+    assert stats["queued"] == 0
+    assert stats["cancelled"] == 2
+    # Every slot is free again.
+    assert all(pool._slots.acquire(blocking=False) for _ in range(3))
+
+
+def test_shutdown_handler_only_stops_pools_and_chains(monkeypatch):
+    import signal
+    import app.worker_pool as worker_pool
+    calls = []
+    monkeypatch.setattr(worker_pool, "stop_pools", lambda: calls.append("stop"))
+    monkeypatch.setattr(worker_pool, "shutdown_pools", lambda: calls.append("drain"))
+    previous = signal.getsignal(signal.SIGUSR1)
+    try:
+        signal.signal(signal.SIGUSR1, lambda sig, frame: calls.append("previous"))
+        assert worker_pool.install_shutdown_handler(signal.SIGUSR1)
+        signal.getsignal(signal.SIGUSR1)(signal.SIGUSR1, None)
+
+        # Without a previous handler, the default exit becomes SystemExit so atexit hooks drain.
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+        assert worker_pool.install_shutdown_handler(signal.SIGUSR1)
+        with pytest.raises(SystemExit):
+            signal.getsignal(signal.SIGUSR1)(signal.SIGUSR1, None)
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+    assert calls == ["stop", "previous", "stop"]
+
+
+def test_request_stop_does_not_wait_for_the_lock():
+    pool = WorkerPool("test", max_workers=1, max_queue=1)
+    with pool._lock:
+        # As when a signal lands while the main thread is inside submit().
+        pool.request_stop()
+    assert pool.stopping is True
+    assert pool.submit(lambda: None) is False
+
+    # A later shutdown still cancels and drains.
+    pool.shutdown(drain_timeout=1)
+    assert pool._shut_down is True
+
+
+def test_gunicorn_worker_exit_drains_pools(monkeypatch):
+    import runpy
+    import app.worker_pool as worker_pool
+    calls = []
+    monkeypatch.setattr(worker_pool, "shutdown_pools", lambda: calls.append("drain"))
+    config = runpy.run_path(os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py"))
+
+    config["worker_exit"](None, None)
+    assert calls == ["drain"]
+
+
+def test_run_lookups_dedupes_keys_and_runs_concurrently():
+    calls = []
+
+    def slow_lookup(key):
+        calls.append(key)
+        time.sleep(0.2)
+        return key.lower()
+
+    start = time.monotonic()
+    results = run_lookups({
+        "airlines": (slow_lookup, ["BA", "AF", "BA", None]),
+        "airports": (slow_lookup, ["LHR", "CDG", "LHR"]),
+    })
+    elapsed = time.monotonic() - start
+
+    assert results == {"airlines": {"BA": "ba", "AF": "af"}, "airports": {"LHR": "lhr", "CDG": "cdg"}}
+    assert sorted(calls) == ["AF", "BA", "CDG", "LHR"]
+    # Four 0.2s lookups in parallel, not one after another.
+    assert elapsed < 0.6
+
+
+def test_lookup_all_reraises_lookup_errors():
+    def failing_lookup(key):
+        raise RuntimeError(key)
+
+    assert lookup_all(failing_lookup, []) == {}
+    with pytest.raises(RuntimeError):
+        lookup_all(failing_lookup, ["London", "Paris"])